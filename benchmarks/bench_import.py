@@ -0,0 +1,45 @@
+#! /usr/bin/env python2
+"""Benchmark of the time it takes to start verifyproblem, measured as
+the time to run a fresh interpreter importing it, minus that of a bare
+interpreter.
+
+Usage: bench_import.py [runs] [module]
+"""
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+
+def bench(code, runs):
+    env = dict(os.environ)
+    env['PYTHONPATH'] = ROOT
+    times = []
+    for _ in range(runs):
+        start = time.time()
+        subprocess.check_call([sys.executable, '-c', code], env=env)
+        times.append(time.time() - start)
+    times.sort()
+    return times[len(times) // 2]
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    module = sys.argv[2] if len(sys.argv) > 2 else 'problemtools.verifyproblem'
+    # Modules that should only be loaded when they are needed
+    lazy = ['plasTeX', 'problemtools.problem2html', 'problemtools.problem2pdf']
+    code = ('import sys, %s\n'
+            'loaded = [m for m in %r if m in sys.modules]\n'
+            'if loaded: sys.exit("loaded at import: %%s" %% ", ".join(loaded))\n'
+            % (module, lazy))
+
+    bare = bench('pass', runs)
+    imported = bench(code, runs)
+    print('interpreter:    %6.1f ms' % (bare * 1e3))
+    print('import %s: %6.1f ms' % (module, (imported - bare) * 1e3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+#! /usr/bin/env python2
+"""Benchmark of language auto-detection over a few thousand synthetic
+submission trees, comparing the indexed detection of Languages with
+running every language's glob and shebang checks on every file.
+
+Usage: bench_language_detection.py [trees]
+"""
+import fnmatch
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from problemtools import languages
+
+
+SOURCES = [
+    ('main.c', '', ['util.h', 'util.c']),
+    ('main.cpp', '', ['lib.hpp', 'lib.cc']),
+    ('Main.java', '', ['Helper.java']),
+    ('sol.py', '#!/usr/bin/env python3\n', ['helper.py']),
+    ('sol.py', '#!/usr/bin/python2\n', []),
+    ('sol.py', '', []),
+    ('main.go', '', []),
+    ('Main.kt', '', []),
+    ('main.rs', '', []),
+    ('sol.cs', '', ['Other.cs']),
+    ('sol.js', '', []),
+    ('sol.hs', '', []),
+]
+
+
+def make_trees(root, count):
+    rand = random.Random(4711)
+    trees = []
+    for idx in range(count):
+        (main, first_line, extra) = rand.choice(SOURCES)
+        tree = os.path.join(root, 'sub%d' % idx)
+        os.mkdir(tree)
+        names = [main] + extra + ['README.md'] * rand.randint(0, 1)
+        files = []
+        for name in names:
+            path = os.path.join(tree, name)
+            with open(path, 'w') as f_out:
+                f_out.write(first_line + 'int main() {}\n')
+            files.append(path)
+        trees.append(files)
+    return trees
+
+
+def first_line(path):
+    with open(path) as f_in:
+        return f_in.readline()
+
+
+def detect_naive(langs, files):
+    result = None
+    best = (0, 1e99)
+    for lang in langs.languages.values():
+        count = len([path for path in files
+                     if any(fnmatch.fnmatch(path, glob) for glob in lang.files)
+                     and (lang.shebang is None or lang.shebang.search(first_line(path)))])
+        if (count, lang.priority) > best:
+            result = lang
+            best = (count, lang.priority)
+    return result
+
+
+def bench(detect, langs, trees):
+    start = time.time()
+    found = [detect(langs, files) for files in trees]
+    return (time.time() - start, found)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 3000
+    langs = languages.load_language_config_default_paths()
+    root = tempfile.mkdtemp()
+    try:
+        trees = make_trees(root, count)
+        (naive, naive_found) = bench(detect_naive, langs, trees)
+        (indexed, indexed_found) = bench(languages.Languages.detect_language, langs, trees)
+    finally:
+        shutil.rmtree(root)
+    assert naive_found == indexed_found
+    print('%d trees, %d languages' % (count, len(langs.languages)))
+    print('naive:   %.1f us/tree' % (naive / count * 1e6))
+    print('indexed: %.1f us/tree' % (indexed / count * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,48 @@
+#! /usr/bin/env python2
+"""Microbenchmark of the per-run overhead of Program.run, forking
+directly from a large process versus going through the launcher.
+
+Usage: bench_launcher.py [runs] [ballast MB]
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from problemtools import run
+
+
+def bench(prog, runs):
+    start = time.time()
+    for _ in range(runs):
+        prog.run()
+    return (time.time() - start) / runs
+
+
+def main():
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    ballast_mb = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    # Make our address space about as big as that of a verifyproblem
+    # process that has loaded a large problem
+    ballast = bytearray(ballast_mb * 1024**2)
+    for pos in range(0, len(ballast), 4096):
+        ballast[pos] = 1
+
+    prog = run.Executable('/bin/true')
+    direct = bench(prog, runs)
+
+    run.Program.launcher = run.Launcher()
+    try:
+        launched = bench(prog, runs)
+    finally:
+        run.Program.launcher.stop()
+        run.Program.launcher = None
+
+    print 'Per-run overhead with %d MB ballast, %d runs of /bin/true:' % (ballast_mb, runs)
+    print '  direct fork: %7.3f ms' % (1000 * direct)
+    print '  launcher:    %7.3f ms' % (1000 * launched)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,12 +2,18 @@
 This module contains functionality for reading and using configuration
 of programming languages.
 """
+import cPickle
+import errno
 import fnmatch
 import re
 import os
 import string
+import tempfile
 import types
-import yaml.parser
+import yaml
+
+# The C (libyaml) loader is much faster, use it when available
+_YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
 
 
 class LanguageConfigError(Exception):
@@ -39,24 +45,66 @@ class Language(object):
         self.name = None
         self.priority = None
         self.files = None
-        self.shebang = None
         self.compile = None
         self.run = None
+        self._shebang_pattern = None
+        self._shebang = None
+        self._files_re = None
         self.update(lang_spec)
 
 
-    def get_source_files(self, file_list):
+    def __getstate__(self):
+        # Compiled regexes are not pickled, they are recompiled when
+        # first needed
+        state = dict(self.__dict__)
+        state['_shebang'] = None
+        state['_files_re'] = None
+        return state
+
+
+    @property
+    def shebang(self):
+        """Compiled shebang regex of the language, or None."""
+        if self._shebang is None and self._shebang_pattern is not None:
+            self._shebang = re.compile(self._shebang_pattern)
+        return self._shebang
+
+
+    def get_source_files(self, file_list, first_lines=None):
         """Given a list of files, determine which ones would be considered
         source files for the language.
 
         Args:
             file_list (list of str): list of file names
+            first_lines (dict): cache of the first lines of files,
+                shared between calls to avoid reading the same file
+                more than once.
         """
         return [file_name for file_name in file_list
-                if (any(fnmatch.fnmatch(file_name, glob)
-                        for glob in self.files)
+                if (self.matches_glob(file_name)
                     and
-                    self.__matches_shebang(file_name))]
+                    self.matches_shebang(file_name, first_lines))]
+
+
+    def matches_glob(self, file_name):
+        """Check if a file name matches any of the files globs of the
+        language."""
+        if self._files_re is None:
+            self._files_re = re.compile('|'.join(fnmatch.translate(glob)
+                                                 for glob in self.files))
+        return self._files_re.match(os.path.normcase(file_name)) is not None
+
+
+    def matches_shebang(self, file_name, first_lines=None):
+        """Check if a file matches the shebang rule for the language.
+
+        Args:
+            file_name (str): name of the file
+            first_lines (dict): cache of the first lines of files.
+        """
+        if self.shebang is None:
+            return True
+        return self.shebang.search(_first_line(file_name, first_lines)) is not None
 
 
     def update(self, values):
@@ -88,11 +136,13 @@ class Language(object):
 
             # Save the value
             if key == 'shebang':
-                # Compile shebang RE
-                self.shebang = re.compile(value)
+                # Compile shebang RE (which also checks that it is valid)
+                self._shebang_pattern = value
+                self._shebang = re.compile(value)
             elif key == 'files':
                 # Split glob patterns
                 self.files = value.split()
+                self._files_re = None
             else:
                 # Other keys, just copy the value
                 self.__dict__[key] = value
@@ -148,15 +198,15 @@ class Language(object):
                    if field is not None)
 
 
-    def __matches_shebang(self, filename):
-        """Check if a file matches the shebang rule for the language."""
-        if self.shebang is None:
-            return True
-        with open(filename, 'r') as f_in:
-            shebang_line = f_in.readline()
-        return self.shebang.search(shebang_line) is not None
-
-
+def _first_line(file_name, first_lines):
+    """First line of a file, through a cache if given."""
+    if first_lines is not None and file_name in first_lines:
+        return first_lines[file_name]
+    with open(file_name, 'r') as f_in:
+        line = f_in.readline()
+    if first_lines is not None:
+        first_lines[file_name] = line
+    return line
 
 
 
@@ -164,9 +214,32 @@ class Language(object):
 class Languages(object):
     """A set of languages."""
 
+    # Glob patterns that just match a file name suffix
+    __SUFFIX_GLOB = re.compile(r'^\*(\.[^*?\[/]*)$')
+
+    # Name of file in which to persist parsed configurations between
+    # processes (see load_language_config), or None
+    cache_file = None
+
     def __init__(self):
         """Create an empty set of languages."""
         self.languages = {}
+        self._index = None
+
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_index'] = None
+        return state
+
+
+    @staticmethod
+    def default_cache_file():
+        """Default location of the persisted configuration cache
+        (following the XDG base directory conventions)."""
+        base = os.environ.get('XDG_CACHE_HOME',
+                              os.path.join(os.path.expanduser('~'), '.cache'))
+        return os.path.join(base, 'problemtools', 'languages.pickle')
 
 
     def detect_language(self, file_list):
@@ -179,18 +252,50 @@ class Languages(object):
             Language object for the detected language or None if the
             list of files did not match any language in the set.
         """
+        (by_suffix, by_glob) = self.__get_index()
+        first_lines = {}
+        counts = {}
+        for file_name in file_list:
+            base = os.path.basename(os.path.normcase(file_name))
+            candidates = set()
+            pos = base.find('.')
+            while pos != -1:
+                candidates.update(by_suffix.get(base[pos:], []))
+                pos = base.find('.', pos + 1)
+            candidates.update(lang for lang in by_glob
+                              if lang not in candidates and lang.matches_glob(file_name))
+            for lang in candidates:
+                if lang.matches_shebang(file_name, first_lines):
+                    counts[lang] = counts.get(lang, 0) + 1
+
         result = None
-        src = []
-        prio = 1e99
-        for lang in self.languages.values():
-            lang_src = lang.get_source_files(file_list)
-            if (len(lang_src), lang.priority) > (len(src), prio):
+        best = (0, 1e99)
+        for (lang, count) in counts.iteritems():
+            if (count, lang.priority) > best:
                 result = lang
-                src = lang_src
-                prio = lang.priority
+                best = (count, lang.priority)
         return result
 
 
+    def __get_index(self):
+        """Index of the languages by the files they match: a dict from
+        file name suffixes (starting with a '.') to the languages with
+        a files glob '*<suffix>', and a list of languages with other
+        globs (which need to be checked with fnmatch)."""
+        if self._index is None:
+            by_suffix = {}
+            by_glob = []
+            for lang in self.languages.values():
+                for glob in lang.files:
+                    match = Languages.__SUFFIX_GLOB.match(glob)
+                    if match:
+                        by_suffix.setdefault(os.path.normcase(match.group(1)), []).append(lang)
+                    elif lang not in by_glob:
+                        by_glob.append(lang)
+            self._index = (by_suffix, by_glob)
+        return self._index
+
+
     def update(self, config_file):
         """Update the set with language configuration data from a file.
 
@@ -202,10 +307,10 @@ class Languages(object):
         """
         try:
             with open(config_file, 'r') as config:
-                data = yaml.safe_load(config.read())
+                data = yaml.load(config.read(), Loader=_YAML_LOADER)
                 if data is None:
                     data = {}
-        except yaml.parser.ParserError, err:
+        except yaml.YAMLError, err:
             raise LanguageConfigError(
                 'Config file %s: failed to parse: %s' % (config_file, err))
 
@@ -229,6 +334,7 @@ class Languages(object):
                 self.languages[lang_id] = Language(lang_id, lang_spec)
             else:
                 self.languages[lang_id].update(lang_spec)
+        self._index = None
 
         priorities = {}
         for (lang_id, lang) in self.languages.iteritems():
@@ -240,9 +346,20 @@ class Languages(object):
 
 
 
+# Parsed configurations, by the paths, modification times and sizes of
+# the existing config files they were parsed from
+_CACHE = {}
+_CACHE_VERSION = 1
+
+
 def load_language_config(paths):
     """Load language configuration from a list of possible files.
 
+    The result is cached for the rest of the process, and if
+    Languages.cache_file is set, also persisted in that file, for as
+    long as the config files are not modified.  It is shared between
+    callers and must not be modified.
+
     Args:
         paths (list of str): list of file names, paths to
             configuration files.  Files in the list that do not exist
@@ -254,13 +371,85 @@ def load_language_config(paths):
         Languages object for the set of languages in the given config
         files.
     """
-    res = Languages()
+    key = []
     for path in paths:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
         if os.path.isfile(path):
+            key.append((os.path.abspath(path), stat.st_mtime, stat.st_size))
+    key = tuple(key)
+
+    if key in _CACHE:
+        return _CACHE[key]
+    persisted = _read_cache_file(Languages.cache_file)
+    res = persisted.get(key)
+    if res is None:
+        res = Languages()
+        for (path, _, _) in key:
             res.update(path)
+        persisted[key] = res
+        _write_cache_file(Languages.cache_file, persisted)
+    _CACHE[key] = res
     return res
 
 
+def _read_cache_file(cache_file):
+    """Read persisted configurations, returns a dict from cache keys to
+    Languages objects (empty if there is no usable cache file)."""
+    if cache_file is None:
+        return {}
+    try:
+        with open(cache_file, 'rb') as cache_in:
+            (version, persisted) = cPickle.load(cache_in)
+    except Exception:
+        # Missing, corrupt or written by an incompatible version
+        return {}
+    if version != _CACHE_VERSION or not isinstance(persisted, dict):
+        return {}
+    return persisted
+
+
+def _is_current(key):
+    """Check that none of the config files of a cache key have been
+    modified."""
+    for (path, mtime, size) in key:
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        if (stat.st_mtime, stat.st_size) != (mtime, size):
+            return False
+    return True
+
+
+def _write_cache_file(cache_file, persisted):
+    """Persist configurations, atomically replacing the cache file.
+    Failure to write the cache is not an error."""
+    if cache_file is None:
+        return
+    persisted = dict((key, langs) for (key, langs) in persisted.iteritems()
+                     if _is_current(key))
+    cache_dir = os.path.dirname(os.path.abspath(cache_file))
+    try:
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+        (fd, tmp_name) = tempfile.mkstemp(dir=cache_dir, prefix='.languages')
+    except OSError as exc:
+        if exc.errno in (errno.EACCES, errno.EEXIST, errno.EROFS, errno.ENOSPC):
+            return
+        raise
+    try:
+        with os.fdopen(fd, 'wb') as cache_out:
+            cPickle.dump((_CACHE_VERSION, persisted), cache_out,
+                         cPickle.HIGHEST_PROTOCOL)
+        os.rename(tmp_name, cache_file)
+    except (IOError, OSError):
+        if os.path.exists(tmp_name):
+            os.unlink(tmp_name)
+
+
 def load_language_config_default_paths():
     """Load language configuration from the problemtools default locations.
 
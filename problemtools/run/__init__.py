@@ -4,13 +4,23 @@ Problemtools.
 import re
 import os
 
+from .affinity import CorePool
+from .batch import BATCH_ARG, BATCH_GREETING, BatchPool, BatchProcess
 from .buildrun import BuildRun
 from .checktestdata import Checktestdata
+from .compilecache import CompileCache
 from .errors import ProgramError
 from .executable import Executable
-from .program import Program
+from .filehashes import FileHashes
+from .launcher import Launcher
+from .program import CancelToken, Program, RunResult
+from .resultcache import ResultCache
+from .scratch import ScratchStorage
+from .statedb import StateDB
+from .stream import run_piped
 from .source import SourceCode
 from .viva import Viva
+from .watch import DirectoryWatcher
 from .tools import get_tool_path, get_tool
 from . import rutil
 
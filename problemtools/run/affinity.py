@@ -0,0 +1,175 @@
+"""
+Module for pinning runs of programs to dedicated CPU cores, to make CPU
+time measurements of concurrent runs less noisy.
+"""
+import ctypes
+import logging
+import os
+import threading
+
+from . import rutil
+from .errors import ProgramError
+
+
+_CPUSET_FILES = ['/sys/fs/cgroup/cpuset.cpus.effective',
+                 '/sys/fs/cgroup/cpuset/cpuset.effective_cpus',
+                 '/sys/fs/cgroup/cpuset/cpuset.cpus']
+
+_TOPOLOGY_DIR = '/sys/devices/system/cpu'
+
+
+def parse_cpu_list(cpu_list):
+    """Parse a CPU list in the kernel's list format (e.g. "0-3,8,10-11").
+
+    Returns:
+        set of int, the CPUs in the list.
+    """
+    cpus = set()
+    for part in cpu_list.strip().split(','):
+        part = part.strip()
+        if part == '':
+            continue
+        if '-' in part:
+            (low, high) = part.split('-')
+            cpus.update(range(int(low), int(high) + 1))
+        else:
+            cpus.add(int(part))
+    return cpus
+
+
+def allowed_cpus(cpuset_files=None):
+    """Determine which CPUs the current process may run on.
+
+    This is the intersection of the CPUs of our cgroup cpuset (if it
+    can be found) and the CPU affinity of the process.
+
+    Args:
+        cpuset_files (list of str): candidate cgroup cpuset files,
+            the first existing one is used.
+
+    Returns:
+        set of int, the allowed CPUs.
+    """
+    if cpuset_files is None:
+        cpuset_files = _CPUSET_FILES
+    cpus = None
+    for path in cpuset_files:
+        if os.path.isfile(path):
+            with open(path, 'r') as cpuset:
+                cpus = parse_cpu_list(cpuset.read())
+            break
+
+    with open('/proc/self/status', 'r') as status:
+        for line in status:
+            if line.startswith('Cpus_allowed_list:'):
+                own = parse_cpu_list(line.split(':', 1)[1])
+                cpus = own if cpus is None else cpus & own
+    if cpus is None:
+        cpus = set(range(os.sysconf('SC_NPROCESSORS_ONLN')))
+    return cpus
+
+
+def dedicated_cores(cpus, topology_dir=None):
+    """Pick one CPU from every physical core among a set of CPUs, so that
+    no two of the picked CPUs are SMT siblings of each other.
+
+    Args:
+        cpus (set of int): CPUs to pick from.
+        topology_dir (str): sysfs directory holding the cpu<N>/topology
+            directories.
+
+    Returns:
+        sorted list of int, the picked CPUs.
+    """
+    if topology_dir is None:
+        topology_dir = _TOPOLOGY_DIR
+    picked = []
+    taken = set()
+    for cpu in sorted(cpus):
+        if cpu in taken:
+            continue
+        siblings_file = os.path.join(topology_dir, 'cpu%d' % cpu,
+                                     'topology', 'thread_siblings_list')
+        siblings = set([cpu])
+        if os.path.isfile(siblings_file):
+            with open(siblings_file, 'r') as f_in:
+                siblings |= parse_cpu_list(f_in.read())
+        picked.append(cpu)
+        taken |= siblings
+    return picked
+
+
+class CorePool(object):
+    """Pool of dedicated cores handed out to runs of programs.  A run
+    acquires a core before it is started and releases it when it has
+    finished, so no two runs ever share a core (or an SMT sibling of
+    it).
+    """
+
+    def __init__(self, cores=None):
+        """Create a core pool.
+
+        Args:
+            cores (list of int): the CPUs to hand out.  If None, one CPU
+                per physical core among the allowed CPUs is used.
+        """
+        if not CorePool.available():
+            raise ProgramError('sched_setaffinity is not available, cannot pin runs to cores')
+        if cores is None:
+            cores = dedicated_cores(allowed_cpus())
+        if len(cores) == 0:
+            raise ProgramError('No CPU cores available for pinning')
+        self.cores = list(cores)
+        self._free = list(reversed(self.cores))
+        self._cond = threading.Condition()
+        logging.debug('Pinning runs to cores %s', self.cores)
+
+
+    def __len__(self):
+        return len(self.cores)
+
+
+    def acquire(self):
+        """Acquire a core, waiting until one becomes available.
+
+        Returns:
+            int, the acquired CPU.
+        """
+        with self._cond:
+            while not self._free:
+                self._cond.wait()
+            return self._free.pop()
+
+
+    def release(self, cpu):
+        """Return a core acquired through acquire() to the pool."""
+        with self._cond:
+            self._free.append(cpu)
+            self._cond.notify()
+
+
+    @staticmethod
+    def available():
+        """Check whether pinning is supported.  Also loads what is needed
+        for pin(), so call this before forking a process that will
+        pin itself."""
+        return CorePool.__load_libc() is not None
+
+
+    @staticmethod
+    def pin(cpu):
+        """Restrict the calling process to run only on the given CPU."""
+        libc = CorePool.__load_libc()
+        if libc is None:
+            raise OSError(0, 'sched_setaffinity is not available')
+        mask = (ctypes.c_uint64 * (cpu // 64 + 1))()
+        mask[cpu // 64] = 1 << (cpu % 64)
+        if libc.sched_setaffinity(0, ctypes.sizeof(mask), mask) != 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+
+    @staticmethod
+    def __load_libc():
+        libc = rutil.libc()
+        return libc if hasattr(libc, 'sched_setaffinity') else None
@@ -0,0 +1,370 @@
+"""
+Long-lived batch processes, which handle a stream of jobs instead of
+being started once per job.
+
+A program supporting batch mode is started with BATCH_ARG as its last
+command line argument, and then:
+
+1. writes the line BATCH_GREETING to stdout, to say that it supports
+   batch mode (a program that does not is given up on, and callers
+   fall back to starting it once per job),
+2. reads jobs from stdin, one per line, each job being a list of
+   fields separated by NUL characters,
+3. for every job writes one line of response to stdout (flushing it),
+4. exits when stdin is closed.
+
+What the fields and responses are depends on the kind of program, see
+e.g. OutputValidators in verifyproblem.
+"""
+import errno
+import logging
+import os
+import select
+import shutil
+import signal
+import tempfile
+import threading
+
+from . import rutil
+from .launcher import exec_child
+
+BATCH_ARG = '--problemtools-batch'
+BATCH_GREETING = 'problemtools-batch 1'
+
+
+def _write_all(fd, data):
+    while data:
+        try:
+            written = os.write(fd, data)
+        except OSError as exc:
+            if exc.errno == errno.EINTR:
+                continue
+            raise
+        data = data[written:]
+
+
+def _cpu_time(pid):
+    """CPU time in seconds used so far by a running process and its
+    reaped children, or None if it cannot be found out (no /proc)."""
+    try:
+        with open('/proc/%d/stat' % pid) as stat_file:
+            stat = stat_file.read()
+    except IOError:
+        return None
+    # The fields following the command name (which is in parentheses
+    # and may contain anything), starting from the state
+    fields = stat[stat.rindex(')') + 2:].split()
+    # utime, stime, cutime and cstime, in clock ticks
+    ticks = sum(int(field) for field in fields[11:15])
+    return float(ticks) / os.sysconf('SC_CLK_TCK')
+
+
+class BatchProcess(object):
+    """A running batch process.  Not safe to use from several threads
+    at once, see BatchPool for that.
+
+    The process talks to us through two FIFOs.  Jobs are limited in
+    wall time (timeout) and in the CPU time the process uses while
+    handling them (cpu_limit).
+    """
+
+    def __init__(self, argv, work_dir, memlim=None, timeout=None,
+                 greeting_timeout=None, cpu_limit=None):
+        """Create (but do not start) a batch process.
+
+        Args:
+            argv (list of str): command to run, including BATCH_ARG.
+            work_dir (str): empty directory in which to place the
+                FIFOs.  Removed when the process is closed.
+            memlim (int): if not None, memory limit in MB of the
+                process.
+            timeout (float): if not None, time in seconds to wait for
+                the response to each job before giving up on the
+                process.
+            greeting_timeout (float): time in seconds to wait for the
+                greeting.  A program that does not support batch mode
+                typically just waits for its input, so this should be
+                short.  If None, timeout is used.
+            cpu_limit (float): if not None, CPU time in seconds the
+                process may use for each job before giving up on it.
+                Only enforced where the CPU time of a running process
+                can be read from /proc.
+        """
+        self.argv = argv
+        self.work_dir = work_dir
+        self.memlim = memlim
+        self.timeout = timeout
+        self.greeting_timeout = greeting_timeout if greeting_timeout is not None else timeout
+        self.cpu_limit = cpu_limit
+        self.status = None
+        self._lock = threading.Lock()
+        self._pid = None
+        self._reaper = None
+        self._request_fd = None
+        self._request_guard = None
+        self._response_fd = None
+        self._response_guard = None
+        self._buffer = ''
+
+
+    def start(self):
+        """Start the process.
+
+        Returns:
+            True if the process supports batch mode.  If not, the
+            process should be closed.
+        """
+        request_fifo = os.path.join(self.work_dir, 'request')
+        response_fifo = os.path.join(self.work_dir, 'response')
+        os.mkfifo(request_fifo, 0o600)
+        os.mkfifo(response_fifo, 0o600)
+        # We hold a reader of the request FIFO, so that our writes do
+        # not fail before the process has opened it, and a writer of
+        # the response FIFO until the process has exited, so that we
+        # do not see end of file before it has opened it
+        self._request_guard = os.open(request_fifo, os.O_RDONLY | os.O_NONBLOCK | rutil.O_CLOEXEC)
+        self._request_fd = os.open(request_fifo, os.O_WRONLY | rutil.O_CLOEXEC)
+        self._response_fd = os.open(response_fifo, os.O_RDONLY | os.O_NONBLOCK | rutil.O_CLOEXEC)
+        self._response_guard = os.open(response_fifo, os.O_WRONLY | rutil.O_CLOEXEC)
+
+        logging.debug('start batch process "%s"', ' '.join(self.argv))
+        self._pid = os.fork()
+        if self._pid == 0:  # child
+            exec_child(self.argv, request_fifo, response_fifo, os.devnull,
+                       None, self.memlim, None, None)
+        self._reaper = threading.Thread(target=self.__reap)
+        self._reaper.daemon = True
+        self._reaper.start()
+
+        greeting = self.__read_line(self.greeting_timeout)
+        if greeting != BATCH_GREETING:
+            logging.debug('"%s" does not support batch mode (said %r)',
+                          self.argv[0], greeting)
+            return False
+        return True
+
+
+    @staticmethod
+    def can_send(fields):
+        """Check if a job can be sent (no field contains a NUL or a
+        newline)."""
+        return not any('\0' in field or '\n' in field for field in fields)
+
+
+    def request(self, fields):
+        """Send a job to the process and wait for the response.
+
+        Args:
+            fields (list of str): the job, must satisfy can_send.
+
+        Returns:
+            str, the response line (without the newline), or None if the
+            process died or did not respond in time (or within its CPU
+            time limit).  In that case the process is killed and should
+            be closed.
+        """
+        cpu_deadline = None
+        if self.cpu_limit is not None:
+            cpu_start = _cpu_time(self._pid)
+            if cpu_start is not None:
+                cpu_deadline = cpu_start + self.cpu_limit
+        try:
+            _write_all(self._request_fd, '\0'.join(fields) + '\n')
+        except OSError as exc:
+            logging.debug('batch process "%s" not reading jobs: %s', self.argv[0], exc)
+            self.__kill()
+            return None
+        response = self.__read_line(self.timeout, cpu_deadline)
+        if response is None:
+            logging.debug('batch process "%s" died or timed out', self.argv[0])
+        return response
+
+
+    def close(self):
+        """Stop the process (by closing its stdin, or killing it if it
+        does not exit in time) and clean up."""
+        if self._request_fd is not None:
+            os.close(self._request_fd)
+            self._request_fd = None
+        if self._reaper is not None:
+            self._reaper.join(self.timeout)
+            if self._reaper.is_alive():
+                self.__kill()
+                self._reaper.join()
+            self._reaper = None
+        for fd in [self._request_guard, self._response_fd]:
+            if fd is not None:
+                os.close(fd)
+        self._request_guard = self._response_fd = None
+        with self._lock:
+            if self._response_guard is not None:
+                os.close(self._response_guard)
+                self._response_guard = None
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+
+    def __read_line(self, timeout, cpu_deadline=None):
+        """Read a line of response, None on end of file, timeout or
+        the process having used CPU time past cpu_deadline."""
+        deadline = None
+        if timeout is not None:
+            deadline = rutil.monotonic() + timeout
+        while '\n' not in self._buffer:
+            wait = None if deadline is None else max(0.0, deadline - rutil.monotonic())
+            if cpu_deadline is not None:
+                # The process can use at most this much CPU time in
+                # the meantime (a single-threaded one, at least)
+                cpu_left = cpu_deadline - (_cpu_time(self._pid) or 0.0)
+                if cpu_left <= 0:
+                    logging.debug('batch process "%s" exceeded CPU time limit of %.1f secs',
+                                  self.argv[0], self.cpu_limit)
+                    self.__kill()
+                    return None
+                wait = min(cpu_left, 0.1) if wait is None else min(wait, cpu_left, 0.1)
+            try:
+                ready = select.select([self._response_fd], [], [], wait)[0]
+            except select.error as exc:
+                if exc.args[0] == errno.EINTR:
+                    continue
+                raise
+            if not ready:
+                if deadline is None or rutil.monotonic() < deadline:
+                    continue
+                self.__kill()
+                return None
+            try:
+                data = os.read(self._response_fd, 1 << 16)
+            except OSError as exc:
+                if exc.errno in (errno.EINTR, errno.EAGAIN):
+                    continue
+                raise
+            if not data:
+                return None
+            self._buffer += data
+        (line, self._buffer) = self._buffer.split('\n', 1)
+        return line
+
+
+    def __kill(self):
+        if self.status is not None:
+            return
+        try:
+            os.kill(self._pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+
+    def __reap(self):
+        while True:
+            try:
+                (_, self.status) = os.waitpid(self._pid, 0)
+                break
+            except OSError as exc:
+                if exc.errno != errno.EINTR:
+                    raise
+        # Lets __read_line see end of file
+        with self._lock:
+            if self._response_guard is not None:
+                os.close(self._response_guard)
+                self._response_guard = None
+
+
+class BatchPool(object):
+    """Batch processes of a set of programs, reused between jobs.  Safe
+    to use from several threads at once; each process is handed out to
+    one thread at a time, and more processes of a program are started
+    as needed.
+
+    Whether a program supports batch mode is found out by starting one
+    process of it (the probe); other threads wanting a process of the
+    program meanwhile wait for the outcome instead of starting probes
+    of their own.
+    """
+
+    def __init__(self, work_dir, timeout=None, greeting_timeout=5.0,
+                 cpu_limit=None):
+        """Create an empty pool.
+
+        Args:
+            work_dir (str): directory in which to create the work
+                directories of the processes.
+            timeout (float): timeout of the processes (see
+                BatchProcess).
+            greeting_timeout (float): greeting timeout of the
+                processes (see BatchProcess).
+            cpu_limit (float): CPU time limit per job of the
+                processes (see BatchProcess).
+        """
+        self.work_dir = work_dir
+        self.timeout = timeout
+        self.greeting_timeout = greeting_timeout
+        self.cpu_limit = cpu_limit
+        self._lock = threading.Lock()
+        self._probed = threading.Condition(self._lock)
+        self._idle = {}
+        self._supported = set()
+        self._unsupported = set()
+        self._probing = set()
+
+
+    def acquire(self, key, argv, memlim=None):
+        """Get an idle batch process, starting one if needed.
+
+        Args:
+            key: identifies the program (typically the Program object).
+            argv (list of str): command to run, including BATCH_ARG.
+            memlim (int): if not None, memory limit in MB.
+
+        Returns:
+            BatchProcess, to be handed back by release or discard, or
+            None if the program does not support batch mode.
+        """
+        with self._lock:
+            while key in self._probing:
+                self._probed.wait()
+            if key in self._unsupported:
+                return None
+            if self._idle.get(key):
+                return self._idle[key].pop()
+            probe = key not in self._supported
+            if probe:
+                self._probing.add(key)
+        proc = None
+        try:
+            proc = BatchProcess(argv, tempfile.mkdtemp(prefix='batch-', dir=self.work_dir),
+                                memlim=memlim, timeout=self.timeout,
+                                greeting_timeout=self.greeting_timeout,
+                                cpu_limit=self.cpu_limit)
+            if not proc.start():
+                proc.close()
+                proc = None
+        finally:
+            with self._lock:
+                if proc is not None:
+                    self._supported.add(key)
+                else:
+                    self._unsupported.add(key)
+                if probe:
+                    self._probing.discard(key)
+                    self._probed.notify_all()
+        return proc
+
+
+    def release(self, key, proc):
+        """Hand back a process that can take more jobs."""
+        with self._lock:
+            self._idle.setdefault(key, []).append(proc)
+
+
+    def discard(self, proc):
+        """Hand back a process that failed."""
+        proc.close()
+
+
+    def close(self):
+        """Stop all idle processes."""
+        with self._lock:
+            idle = [proc for procs in self._idle.values() for proc in procs]
+            self._idle = {}
+        for proc in idle:
+            proc.close()
@@ -3,6 +3,7 @@ Implementation of programs provided by a directory with build/run scripts.
 """
 
 import os
+import shutil
 import tempfile
 
 import logging
@@ -45,7 +46,9 @@ class BuildRun(Program):
         else:
             os.makedirs(self.path)
 
-        rutil.add_files(path, self.path)
+        # Put in the work dir when the program is built
+        self._files = rutil.list_files(path)
+        self._sources = self._files
 
 
     def __str__(self):
@@ -54,16 +57,43 @@ class BuildRun(Program):
 
 
     _compile_result = None
-    def compile(self):
-        """Run the build script."""
+    compile_output = ''
+    def compile(self, timelim=None):
+        """Run the build script.
+
+        Args:
+            timelim (int): if not None, limit in seconds on the wall
+                time and CPU time of the build script.
+
+        Returns:
+            True if the build succeeded, False otherwise.  The output
+            of the build script is available in compile_output.
+        """
         if self._compile_result is not None:
             return self._compile_result
 
-        command = 'cd "%s" && ./build > /dev/null 2> /dev/null' % self.path
-        status = os.system(command)
+        if self._files is not None:
+            rutil.materialize_files(self._files, self.path)
+            self._files = None
+
+        cache = Program.compile_cache
+        cache_key = None
+        if cache is not None and cache.cache_builds:
+            cache_key = cache.key(self.path, ['buildrun'])
+            if cache.restore(cache_key, self.path):
+                logging.debug('restored %s from compile cache', self.name)
+                self._compile_result = True
+                return True
+
+        (status, self.compile_output, timed_out) = Program._run_captured(
+            ['./build'], cwd=self.path, timelim=timelim)
 
+        if timed_out:
+            logging.debug('Build script exceeded time limit of %d secs when compiling %s', timelim, self.name)
+            self._compile_result = False
+            return False
         if not os.WIFEXITED(status) or os.WEXITSTATUS(status) != 0:
-            logging.debug('Build script failed (status %d) when compiling %s\n        Command used:\n%s', status, self.name, command)
+            logging.debug('Build script failed (status %d) when compiling %s\n        Output:\n%s', status, self.name, self.compile_output)
             self._compile_result = False
             return False
 
@@ -73,6 +103,8 @@ class BuildRun(Program):
             self._compile_result = False
             return False
 
+        if cache_key is not None:
+            cache.store(cache_key, self.path)
         self._compile_result = True
         return True
 
@@ -88,6 +120,15 @@ class BuildRun(Program):
         return [os.path.join(path, 'run')]
 
 
+    def _compute_fingerprint(self):
+        return rutil.hash_files(self._sources, ['buildrun'])
+
+
+    def discard(self):
+        """Remove the work directory of the program."""
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
     def should_skip_memory_rlimit(self):
         """Ugly hack (see program.py for details)."""
         return True
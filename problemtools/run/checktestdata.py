@@ -11,18 +11,17 @@ from .tools import get_tool_path
 class Checktestdata(Executable):
     """Wrapper class for running Checktestdata scripts.
     """
-    _CTD_PATH = get_tool_path('checktestdata')
-
     def __init__(self, path):
         """Create a Checktestdata wrapper.
 
         Args:
             path (str): path to .ctd source file
         """
-        if Checktestdata._CTD_PATH is None:
+        tool_path = get_tool_path('checktestdata')
+        if tool_path is None:
             raise ProgramError(
                 'Could not locate the Checktestdata program to run %s' % path)
-        super(Checktestdata, self).__init__(Checktestdata._CTD_PATH,
+        super(Checktestdata, self).__init__(tool_path,
                                             args=[path])
 
 
@@ -32,15 +31,20 @@ class Checktestdata(Executable):
 
 
     _compile_result = None
-    def compile(self):
+    def compile(self, timelim=None):
         """Syntax-check the Checktestdata script
 
+        Args:
+            timelim (int): if not None, time limit in seconds for the
+                syntax check.
+
         Returns:
             False if the Checktestdata script has syntax errors and
             True otherwise
         """
         if self._compile_result is None:
-            (status, _) = super(Checktestdata, self).run()
+            (status, _) = super(Checktestdata, self).run(
+                timelim=timelim if timelim is not None else 1000)
             self._compile_result = (os.WIFEXITED(status) and
                                     os.WEXITSTATUS(status) in [0, 1])
         return self._compile_result
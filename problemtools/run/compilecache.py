@@ -0,0 +1,257 @@
+"""
+Persistent, content-addressed cache of compiled programs.
+
+A cache entry is a copy of the work directory of a program after it
+was successfully compiled, keyed by a hash of the work directory before
+compilation together with whatever else determines the result of the
+compilation (compile command, compiler binary).  On a cache hit the
+work directory is restored from the entry instead of running the
+compiler.
+"""
+import errno
+import fcntl
+import hashlib
+import logging
+import os
+import shlex
+import shutil
+import stat
+import tempfile
+import threading
+
+from . import rutil
+
+
+class CompileCache(object):
+    """On-disk cache of compiled programs, with LRU eviction to keep the
+    total size of the cache below a given bound.
+
+    The cache may be shared between concurrent threads and processes:
+    entries are only ever created and removed by atomic renames, and
+    a failed restore is simply treated as a cache miss.
+    """
+
+    _ENTRY_PREFIX = 'entry-'
+    _SIZE_SUFFIX = '.size'
+
+    def __init__(self, cache_dir, max_size=2 * 1024**3, cache_builds=False):
+        """Create/open a compile cache.
+
+        Args:
+            cache_dir (str): directory in which the cache is stored.
+                Created if it does not exist.
+            max_size (int): maximum total size of the cache, in bytes.
+            cache_builds (bool): whether to also cache programs built
+                by build scripts.  Nothing tells which tools a build
+                script uses, so changes to those tools do not
+                invalidate such entries.
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.cache_builds = cache_builds
+        self._lock = threading.Lock()
+        self._fingerprints = {}
+        if not os.path.isdir(cache_dir):
+            try:
+                os.makedirs(cache_dir)
+            except OSError as exc:
+                if exc.errno != errno.EEXIST:
+                    raise
+
+
+    @staticmethod
+    def default_dir():
+        """Default location of the cache (following the XDG base
+        directory conventions)."""
+        return rutil.user_cache_path('compile')
+
+
+    def key(self, path, extra):
+        """Compute the cache key of a work directory.
+
+        Args:
+            path (str): the work directory of the program, before
+                compilation.
+            extra (list of str): other things affecting the result
+                of the compilation (e.g. compile command).
+
+        Returns:
+            str, the key.
+        """
+        digest = hashlib.sha256()
+        for item in extra:
+            digest.update('%d:%s' % (len(item), item))
+        for (root, dirs, files) in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                filename = os.path.join(root, name)
+                relname = os.path.relpath(filename, path)
+                mode = os.lstat(filename).st_mode
+                digest.update('%d:%s:%o' % (len(relname), relname,
+                                            stat.S_IMODE(mode) & 0o111))
+                if stat.S_ISLNK(mode):
+                    digest.update('L%s\0' % os.readlink(filename))
+                    continue
+                with open(filename, 'rb') as f_in:
+                    for buf in iter(lambda: f_in.read(1 << 16), b''):
+                        digest.update(buf)
+                digest.update('\0')
+        return digest.hexdigest()
+
+
+    def tool_fingerprint(self, command):
+        """Fingerprint of the compiler used by a compile command, so that
+        upgrading the compiler invalidates its cache entries.
+
+        Args:
+            command (str): the compile command.
+
+        Returns:
+            str, identifying the resolved compiler binary and its
+            size and modification time.
+        """
+        try:
+            tool = shlex.split(command)[0]
+        except (ValueError, IndexError):
+            return ''
+        with self._lock:
+            if tool not in self._fingerprints:
+                path = CompileCache.__which(tool)
+                if path is None:
+                    fingerprint = tool
+                else:
+                    path = os.path.realpath(path)
+                    info = os.stat(path)
+                    fingerprint = '%s:%d:%d' % (path, info.st_size,
+                                                int(info.st_mtime))
+                self._fingerprints[tool] = fingerprint
+            return self._fingerprints[tool]
+
+
+    def restore(self, key, path):
+        """Restore a work directory from the cache.
+
+        Args:
+            key (str): cache key, as computed by key().
+            path (str): the work directory to restore into.  Its
+                current contents are replaced on a cache hit.
+
+        Returns:
+            bool, True if the entry was found and restored.
+        """
+        entry = self.__entry_path(key)
+        if not os.path.isdir(entry):
+            return False
+        staging = tempfile.mkdtemp(prefix='.restore-',
+                                   dir=os.path.dirname(path))
+        os.rmdir(staging)
+        try:
+            shutil.copytree(entry, staging, symlinks=True)
+            # Mark as recently used
+            os.utime(entry, None)
+        except (IOError, OSError, shutil.Error) as exc:
+            # Most likely evicted under our feet, treat as a miss
+            logging.debug('Failed to restore compile cache entry %s: %s', key, exc)
+            shutil.rmtree(staging, ignore_errors=True)
+            return False
+        shutil.rmtree(path)
+        os.rename(staging, path)
+        return True
+
+
+    def store(self, key, path):
+        """Store a compiled work directory in the cache.
+
+        Args:
+            key (str): cache key, as computed by key() before the
+                program was compiled.
+            path (str): the work directory of the compiled program.
+        """
+        entry = self.__entry_path(key)
+        if os.path.isdir(entry):
+            return
+        staging = tempfile.mkdtemp(prefix='.store-', dir=self.cache_dir)
+        try:
+            shutil.copytree(path, os.path.join(staging, 'tree'), symlinks=True)
+            size = CompileCache.__tree_size(os.path.join(staging, 'tree'))
+            with open(os.path.join(staging, 'tree' + CompileCache._SIZE_SUFFIX), 'w') as f_out:
+                f_out.write('%d\n' % size)
+            # The size file goes first, so that an entry directory
+            # always has its size file
+            os.rename(os.path.join(staging, 'tree' + CompileCache._SIZE_SUFFIX),
+                      entry + CompileCache._SIZE_SUFFIX)
+            os.rename(os.path.join(staging, 'tree'), entry)
+        except (IOError, OSError, shutil.Error) as exc:
+            # Someone else stored the same entry first, or we failed
+            # to copy.  Either way not worth failing compilation for.
+            logging.debug('Failed to store compile cache entry %s: %s', key, exc)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        self.evict()
+
+
+    def evict(self):
+        """Remove least recently used entries until the total size of the
+        cache is within its bound."""
+        with self._lock, open(os.path.join(self.cache_dir, '.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            entries = []
+            total = 0
+            for name in os.listdir(self.cache_dir):
+                entry = os.path.join(self.cache_dir, name)
+                if not name.startswith(CompileCache._ENTRY_PREFIX) or not os.path.isdir(entry):
+                    continue
+                try:
+                    with open(entry + CompileCache._SIZE_SUFFIX, 'r') as f_in:
+                        size = int(f_in.read())
+                    used = os.stat(entry).st_mtime
+                except (IOError, OSError, ValueError):
+                    continue
+                entries.append((used, size, entry))
+                total += size
+            entries.sort()
+            while total > self.max_size and entries:
+                (_, size, entry) = entries.pop(0)
+                logging.debug('Evicting compile cache entry %s', entry)
+                CompileCache.__remove_entry(entry)
+                total -= size
+
+
+    def __entry_path(self, key):
+        return os.path.join(self.cache_dir, CompileCache._ENTRY_PREFIX + key)
+
+
+    @staticmethod
+    def __remove_entry(entry):
+        # Rename first so that concurrent readers either see the whole
+        # entry or no entry at all
+        trash = tempfile.mkdtemp(prefix='.evict-', dir=os.path.dirname(entry))
+        try:
+            os.rename(entry, os.path.join(trash, 'tree'))
+        except OSError:
+            pass
+        try:
+            os.unlink(entry + CompileCache._SIZE_SUFFIX)
+        except OSError:
+            pass
+        shutil.rmtree(trash, ignore_errors=True)
+
+
+    @staticmethod
+    def __tree_size(path):
+        size = 0
+        for (root, _, files) in os.walk(path):
+            for name in files:
+                size += os.lstat(os.path.join(root, name)).st_size
+        return size
+
+
+    @staticmethod
+    def __which(tool):
+        if os.sep in tool:
+            return tool if os.access(tool, os.X_OK) else None
+        for directory in os.environ.get('PATH', '').split(os.pathsep):
+            candidate = os.path.join(directory, tool)
+            if os.path.isfile(candidate) and os.access(candidate, os.X_OK):
+                return candidate
+        return None
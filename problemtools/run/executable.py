@@ -2,6 +2,7 @@
 Implementation of programs provided by an executable file.
 """
 import os
+from . import rutil
 from .program import Program
 from .errors import ProgramError
 
@@ -26,7 +27,7 @@ class Executable(Program):
         """String representation"""
         return '%s' % (self.path)
 
-    def compile(self):
+    def compile(self, timelim=None):
         """Dummy implementation of the compile method -- nothing to check!
         """
         return True
@@ -36,6 +37,18 @@ class Executable(Program):
         """
         return [self.path] + self.args
 
+    def _compute_fingerprint(self):
+        # Arguments that are files (e.g. Checktestdata and VIVA
+        # scripts) are hashed by their contents
+        files = {'executable': self.path}
+        extra = ['executable']
+        for (idx, arg) in enumerate(self.args):
+            if os.path.isfile(arg):
+                files['arg%d' % idx] = arg
+            else:
+                extra.append(arg)
+        return rutil.hash_files(files, extra)
+
     def should_skip_memory_rlimit(self):
         """Ugly hack (see program.py for details)."""
         return True
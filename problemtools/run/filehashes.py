@@ -0,0 +1,78 @@
+"""
+Index of hashes of files (test data), each file being hashed only once
+as long as it does not change.
+"""
+import collections
+import hashlib
+import mmap
+import os
+import threading
+
+
+def _md5(path):
+    """MD5 hash (hex) of the contents of a file.  The file is mapped
+    into memory and hashed in one go, without copying it."""
+    digest = hashlib.md5()
+    with open(path, 'rb') as f_in:
+        if os.fstat(f_in.fileno()).st_size > 0:
+            contents = mmap.mmap(f_in.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                digest.update(contents)
+            finally:
+                contents.close()
+    return digest.hexdigest()
+
+
+class FileHashes(object):
+    """Hashes of files, remembered together with the size and
+    modification time of each file, and computed again only if either
+    has changed.  Safe to use from several threads at once.
+
+    The hash is MD5: it is not used for anything where collisions could
+    be forced to any benefit, and is a lot faster than e.g. SHA-256.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._hashes = {}
+
+
+    def digest(self, path):
+        """Hash (hex) of the contents of a file."""
+        info = os.stat(path)
+        stamp = (info.st_size, info.st_mtime)
+        with self._lock:
+            cached = self._hashes.get(path)
+        if cached is None or cached[0] != stamp:
+            cached = (stamp, _md5(path))
+            with self._lock:
+                self._hashes[path] = cached
+        return cached[1]
+
+
+    def duplicates(self, paths, pool=None):
+        """Find files with identical contents.
+
+        Only files of the same size can be identical, so only those are
+        hashed.
+
+        Args:
+            paths (list of str): the files.
+            pool (multiprocessing.pool.ThreadPool): if not None, pool on
+                which to hash the files.
+
+        Returns:
+            list of lists of str, the groups (of at least two files) of
+            identical files, each in the order of paths.
+        """
+        size = dict((path, os.path.getsize(path)) for path in paths)
+        count = collections.Counter(size.itervalues())
+        to_hash = [path for path in paths if count[size[path]] > 1]
+        if pool is not None:
+            digests = pool.map(self.digest, to_hash)
+        else:
+            digests = [self.digest(path) for path in to_hash]
+        groups = collections.OrderedDict()
+        for (path, digest) in zip(to_hash, digests):
+            groups.setdefault(digest, []).append(path)
+        return [group for group in groups.itervalues() if len(group) > 1]
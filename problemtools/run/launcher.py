@@ -0,0 +1,296 @@
+"""Launcher (a.k.a. fork server) for running programs.
+
+Forking a process costs time proportional to the size of its address
+space, and by the time verifyproblem runs submissions it has loaded a
+lot of stuff.  The launcher is a separate, small Python process that
+receives run requests over a unix socket, forks and execs the program,
+and reports back the exit status and resource usage.
+
+This module is also where the child side of a run (setting limits,
+redirecting stdin/stdout/stderr and exec:ing the program) lives, since
+it is shared between the launcher and local runs in program.py.  It
+should therefore stay cheap to import.
+"""
+import errno
+import fcntl
+import logging
+import marshal
+import os
+import resource
+import select
+import shutil
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+
+from . import limit
+from . import rutil
+from .affinity import CorePool
+from .errors import ProgramError
+
+
+def exec_child(argv, infile, outfile, errfile, timelim, memlim, outputlim, cpu):
+    """Child side of a program run: set limits, redirect stdin, stdout
+    and stderr, and exec the program.  Never returns.
+    """
+    try:
+        if cpu is not None:
+            CorePool.pin(cpu)
+        if timelim is not None:
+            limit.try_limit(resource.RLIMIT_CPU, timelim, timelim + 1)
+        if memlim is not None:
+            limit.try_limit(resource.RLIMIT_AS, memlim * (1024**2), resource.RLIM_INFINITY)
+        if outputlim is not None:
+            # One byte of slack, so that a file larger than the limit
+            # tells us the limit was exceeded
+            outputlim_bytes = outputlim * (1024**2) + 1
+            limit.try_limit(resource.RLIMIT_FSIZE, outputlim_bytes, outputlim_bytes)
+        # Python ignores SIGXFSZ and SIGPIPE, and ignored signals
+        # survive exec
+        signal.signal(signal.SIGXFSZ, signal.SIG_DFL)
+        signal.signal(signal.SIGPIPE, signal.SIG_DFL)
+        limit.try_limit(resource.RLIMIT_STACK,
+                        resource.RLIM_INFINITY, resource.RLIM_INFINITY)
+        # Non-blocking, in case infile is a FIFO whose writer has
+        # already finished (see stream.py)
+        _setfd(0, infile, os.O_RDONLY | os.O_NONBLOCK)
+        fcntl.fcntl(0, fcntl.F_SETFL, fcntl.fcntl(0, fcntl.F_GETFL) & ~os.O_NONBLOCK)
+        _setfd(1, outfile, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+        _setfd(2, errfile, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+        os.execvp(argv[0], argv)
+    except Exception as exc:
+        print "Oops. Fatal error in child process:"
+        print exc
+        os.kill(os.getpid(), signal.SIGTERM)
+    # Unreachable
+    logging.error("Unreachable part of run_wait reached")
+    os.kill(os.getpid(), signal.SIGTERM)
+
+
+def _setfd(fd, filename, flag):
+    tmpfd = os.open(filename, flag)
+    os.dup2(tmpfd, fd)
+    os.close(tmpfd)
+
+
+def _send_frame(sock, obj):
+    data = marshal.dumps(obj)
+    sock.sendall(struct.pack('!I', len(data)) + data)
+
+
+def _recv_exactly(sock, size):
+    chunks = []
+    while size > 0:
+        chunk = sock.recv(size)
+        if not chunk:
+            raise EOFError('connection closed')
+        chunks.append(chunk)
+        size -= len(chunk)
+    return ''.join(chunks)
+
+
+def _recv_frame(sock):
+    (size,) = struct.unpack('!I', _recv_exactly(sock, 4))
+    return marshal.loads(_recv_exactly(sock, size))
+
+
+class Launcher(object):
+    """Client side of the launcher.  Starts the launcher process, and
+    forwards runs to it.  Safe to use from several threads at once
+    (every run uses a connection of its own).
+    """
+
+    def __init__(self):
+        """Start a launcher process."""
+        self._sockdir = tempfile.mkdtemp(prefix='launcher-')
+        self._sockpath = os.path.join(self._sockdir, 'socket')
+        # Make sure the launcher finds the package even when it is not
+        # installed (e.g. when running from the repository)
+        env = dict(os.environ)
+        package_root = os.path.dirname(os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__))))
+        env['PYTHONPATH'] = os.pathsep.join(
+            [package_root] + [p for p in [env.get('PYTHONPATH')] if p])
+        self._process = subprocess.Popen(
+            [sys.executable, '-m', 'problemtools.run.launcher', self._sockpath],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=env,
+            close_fds=True)
+        # The launcher says when it is listening
+        if self._process.stdout.readline() != 'ready\n':
+            self.stop()
+            raise ProgramError('Failed to start launcher')
+        self._process.stdout.close()
+        logging.debug('Started launcher process %d', self._process.pid)
+
+
+    def run(self, argv, infile, outfile, errfile, timelim, memlim, outputlim,
+            cpu, cancel, walltimelim, killsig=signal.SIGKILL):
+        """Run a program through the launcher.
+
+        Args: as for Program.run, and additionally:
+            cpu (int): if not None, CPU to pin the program to.
+            killsig (int): signal to kill the program with when it is
+                cancelled or exceeds the wall time limit.
+
+        Returns:
+            tuple (status, rusage, wall, wall_timeout): exit status and
+            resource.struct_rusage of the program, its wall time, and
+            whether it was killed for exceeding the wall time limit.
+        """
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self._sockpath)
+            _send_frame(sock, {'argv': list(argv),
+                               'infile': infile,
+                               'outfile': outfile,
+                               'errfile': errfile,
+                               'timelim': timelim,
+                               'memlim': memlim,
+                               'outputlim': outputlim,
+                               'walltimelim': walltimelim,
+                               'killsig': killsig,
+                               'cpu': cpu})
+            pid = _recv_frame(sock)
+            if cancel is not None:
+                cancel._add(pid, killsig)
+            try:
+                (status, rusage, wall, wall_timeout) = _recv_frame(sock)
+            finally:
+                if cancel is not None:
+                    cancel._remove(pid)
+        except (socket.error, EOFError, struct.error) as exc:
+            raise ProgramError('Lost contact with launcher: %s' % exc)
+        finally:
+            sock.close()
+        return (status, resource.struct_rusage(rusage), wall, wall_timeout)
+
+
+    def stop(self):
+        """Stop the launcher process."""
+        if self._process is not None:
+            self._process.stdin.close()
+            self._process.wait()
+            self._process = None
+        shutil.rmtree(self._sockdir, ignore_errors=True)
+
+
+def serve(sockpath):
+    """Server side of the launcher: accept run requests on a unix socket
+    until stdin is closed.
+    """
+    listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    listener.bind(sockpath)
+    listener.listen(128)
+    rutil.set_cloexec(listener.fileno())
+
+    # SIGCHLD wakes up the select loop through a self-pipe
+    (wakeup_read, wakeup_write) = os.pipe()
+    for fd in [wakeup_read, wakeup_write]:
+        rutil.set_cloexec(fd)
+        fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+    signal.set_wakeup_fd(wakeup_write)
+    signal.signal(signal.SIGCHLD, lambda signum, frame: None)
+    # Talking to clients must not be interrupted by children finishing
+    signal.siginterrupt(signal.SIGCHLD, False)
+
+    # Tell the client we are up, and get our stdout out of the way
+    sys.stdout.write('ready\n')
+    sys.stdout.flush()
+    os.dup2(2, 1)
+
+    running = {}
+    starts = {}
+    # Wall time deadlines of running processes, and the processes that
+    # have been killed for exceeding them
+    deadlines = {}
+    killsigs = {}
+    killed = set()
+    stdin_open = True
+    while stdin_open or running:
+        watched = [wakeup_read] + ([0, listener] if stdin_open else [])
+        timeout = None
+        if deadlines:
+            timeout = max(0.0, min(deadlines.values()) - rutil.monotonic())
+        try:
+            ready = select.select(watched, [], [], timeout)[0]
+        except select.error as exc:
+            if exc.args[0] == errno.EINTR:
+                continue
+            raise
+
+        now = rutil.monotonic()
+        for (pid, deadline) in deadlines.items():
+            if deadline <= now:
+                del deadlines[pid]
+                killed.add(pid)
+                try:
+                    os.kill(pid, killsigs.get(pid, signal.SIGKILL))
+                except OSError:
+                    pass
+
+        if 0 in ready and os.read(0, 4096) == '':
+            # Our client has gone away, finish what is running and quit
+            stdin_open = False
+            listener.close()
+
+        if stdin_open and listener in ready:
+            (conn, _) = listener.accept()
+            rutil.set_cloexec(conn.fileno())
+            try:
+                request = _recv_frame(conn)
+                if request['cpu'] is not None:
+                    # Load libc here rather than in every child
+                    CorePool.available()
+                start = rutil.monotonic()
+                pid = os.fork()
+                if pid == 0:  # child
+                    exec_child(request['argv'], request['infile'],
+                               request['outfile'], request['errfile'],
+                               request['timelim'], request['memlim'],
+                               request['outputlim'], request['cpu'])
+                _send_frame(conn, pid)
+                running[pid] = conn
+                starts[pid] = start
+                if request['walltimelim'] is not None:
+                    deadlines[pid] = start + request['walltimelim']
+                    killsigs[pid] = request['killsig']
+            except (socket.error, EOFError, struct.error):
+                conn.close()
+
+        if wakeup_read in ready:
+            try:
+                while os.read(wakeup_read, 4096):
+                    pass
+            except OSError as exc:
+                if exc.errno != errno.EAGAIN:
+                    raise
+        # Reap everything that has finished
+        while running:
+            try:
+                (pid, status, rusage) = os.wait4(-1, os.WNOHANG)
+            except OSError as exc:
+                if exc.errno == errno.EINTR:
+                    continue
+                raise
+            if pid == 0:
+                break
+            wall = rutil.monotonic() - starts.pop(pid, 0.0)
+            conn = running.pop(pid, None)
+            deadlines.pop(pid, None)
+            killsigs.pop(pid, None)
+            wall_timeout = pid in killed
+            killed.discard(pid)
+            if conn is None:
+                continue
+            try:
+                _send_frame(conn, (status, tuple(rusage), wall, wall_timeout))
+            except socket.error:
+                pass
+            conn.close()
+
+
+if __name__ == '__main__':
+    serve(sys.argv[1])
@@ -1,20 +1,133 @@
 """Abstract base class for programs.
 """
+import errno
 import os
 import limit
 import resource
+import select
 import signal
 import logging
+import tempfile
+import threading
+import time
 
+from . import rutil
 from .errors import ProgramError
+from .launcher import exec_child
+
+
+class CancelToken(object):
+    """Token through which runs of programs can be cancelled from another
+    thread.  Cancelling kills every process currently running with the
+    token, and any later run with the token is killed immediately.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cancelled = False
+        # Signal to kill each process with
+        self._pids = {}
+
+
+    def cancel(self):
+        """Cancel all current and future runs using this token."""
+        with self._lock:
+            self._cancelled = True
+            for (pid, signum) in self._pids.items():
+                CancelToken.__kill(pid, signum)
+
+
+    def is_cancelled(self):
+        """Check whether the token has been cancelled."""
+        return self._cancelled
+
+
+    def _add(self, pid, signum=signal.SIGKILL):
+        with self._lock:
+            if self._cancelled:
+                CancelToken.__kill(pid, signum)
+            self._pids[pid] = signum
+
+
+    def _remove(self, pid):
+        with self._lock:
+            self._pids.pop(pid, None)
+
+
+    @staticmethod
+    def __kill(pid, signum):
+        logging.debug('cancelling run of process %d', pid)
+        try:
+            os.kill(pid, signum)
+        except OSError:
+            pass
+
+
+class RunResult(tuple):
+    """Result of a run of a program.  Unpacks as the pair (status,
+    runtime), with further details about the run as attributes.
+
+    Attributes:
+        status (int): exit status of the process
+        runtime (float): user+sys runtime of the process, in seconds
+        wall_timeout (bool): whether the process was killed for
+            exceeding the wall time limit
+        memory (float): peak resident set size of the process, in MB
+            (-1.0 if it could not be measured)
+        wall (float): wall time of the run, in seconds
+        utime (float): user CPU time of the process, in seconds
+        stime (float): system CPU time of the process, in seconds
+        voluntary_ctxsw (int): number of voluntary context switches
+            (i.e., the process waited for something)
+        involuntary_ctxsw (int): number of involuntary context switches
+            (i.e., the process was preempted)
+        output_limit_exceeded (bool): whether the process exceeded
+            the output limit
+    """
+    def __new__(cls, status, runtime, wall_timeout=False, memory=0.0,
+                wall=0.0, utime=0.0, stime=0.0,
+                voluntary_ctxsw=0, involuntary_ctxsw=0,
+                output_limit_exceeded=False):
+        result = tuple.__new__(cls, (status, runtime))
+        result.status = status
+        result.runtime = runtime
+        result.wall_timeout = wall_timeout
+        result.memory = memory
+        result.wall = wall
+        result.utime = utime
+        result.stime = stime
+        result.voluntary_ctxsw = voluntary_ctxsw
+        result.involuntary_ctxsw = involuntary_ctxsw
+        result.output_limit_exceeded = output_limit_exceeded
+        return result
+
 
 class Program(object):
     """Abstract base class for programs.
     """
     runtime = 0
 
+    # Wall time limit of a run, as a multiple of its CPU time limit
+    wall_time_factor = 3.0
+
+    # If set to a CorePool, every run gets a dedicated core of its own
+    # (except runs made through run_unpinned)
+    core_pool = None
+    _unpinned = threading.local()
+
+    # If set to a CompileCache, compiled programs are stored in and
+    # restored from it
+    compile_cache = None
+
+    # If set to a Launcher, runs are forked off by the launcher process
+    # instead of by us
+    launcher = None
+
+    # Maximum number of bytes of output kept by _run_captured
+    _CAPTURE_LIMIT = 64 * 1024
+
     def run(self, infile='/dev/null', outfile='/dev/null', errfile='/dev/null',
-            args=None, timelim=1000, memlim=1024):
+            args=None, timelim=1000, memlim=1024, cancel=None, walltimelim=None,
+            outputlim=None):
         """Run the program.
 
         Args:
@@ -25,9 +138,15 @@ class Program(object):
                 pass to the program
             timelim (int): CPU time limit in seconds
             memlim (int): memory limit in MB
+            cancel (CancelToken): if not None, the process is killed
+                when the token is cancelled
+            walltimelim (float): wall time limit in seconds.  If None,
+                wall_time_factor times the CPU time limit is used.
+            outputlim (int): if not None, limit in MB on the size of
+                every file written by the program (in particular outfile)
 
         Returns:
-            pair (status, runtime):
+            RunResult, which unpacks as the pair (status, runtime):
                status (int): exit status of the process
                runtime (float): user+sys runtime of the process, in seconds
         """
@@ -38,14 +157,59 @@ class Program(object):
             args = []
         if self.should_skip_memory_rlimit():
             memlim = None
+        if walltimelim is None and timelim is not None:
+            walltimelim = timelim * Program.wall_time_factor
+
+        result = self.__run_wait(runcmd + args,
+                                 infile, outfile, errfile,
+                                 timelim, memlim, outputlim, cancel, walltimelim)
+
+        self.runtime = max(self.runtime, result.runtime)
+
+        return result
+
 
-        status, runtime = self.__run_wait(runcmd + args,
-                                          infile, outfile, errfile,
-                                          timelim, memlim)
+    @staticmethod
+    def run_unpinned(func, *args):
+        """Call func(*args), with the runs of programs it makes in the
+        calling thread not taking a core from core_pool.
+
+        Used for programs that can only make progress together with
+        another, pinned, run (e.g. an output validator reading the
+        output of a submission as it is produced).  If both took a
+        core, a pool with fewer free cores than pairs would deadlock.
+        """
+        Program._unpinned.active = True
+        try:
+            return func(*args)
+        finally:
+            Program._unpinned.active = False
+
+
+    _fingerprint = None
+
+    def fingerprint(self):
+        """Hash of everything that determines how the program behaves
+        (e.g. its source files and how it is compiled and run), for
+        caching results of runs of the program.
+
+        Returns:
+            str, or None if the program cannot be fingerprinted.
+        """
+        if self._fingerprint is None:
+            self._fingerprint = self._compute_fingerprint()
+        return self._fingerprint
 
-        self.runtime = max(self.runtime, runtime)
 
-        return status, runtime
+    def _compute_fingerprint(self):
+        return None
+
+
+    def discard(self):
+        """Remove the files of the program in its work directory (e.g.
+        compiled binaries).  The program can not be used afterwards.
+        """
+        pass
 
 
     def should_skip_memory_rlimit(self):
@@ -63,33 +227,254 @@ class Program(object):
 
 
     @staticmethod
-    def __run_wait(argv, infile, outfile, errfile, timelim, memlim):
-        logging.debug('run "%s < %s > %s 2> %s"',
-                      ' '.join(argv), infile, outfile, errfile)
+    def __run_wait(argv, infile, outfile, errfile, timelim, memlim, outputlim,
+                   cancel, walltimelim):
+        core_pool = Program.core_pool
+        if getattr(Program._unpinned, 'active', False):
+            core_pool = None
+        cpu = None
+        if core_pool is not None:
+            cpu = core_pool.acquire()
+        try:
+            return Program.__run_wait_pinned(argv, infile, outfile, errfile,
+                                             timelim, memlim, outputlim,
+                                             cancel, walltimelim, cpu)
+        finally:
+            if cpu is not None:
+                core_pool.release(cpu)
+
+
+    @staticmethod
+    def __run_wait_pinned(argv, infile, outfile, errfile, timelim, memlim,
+                          outputlim, cancel, walltimelim, cpu):
+        logging.debug('run "%s < %s > %s 2> %s"%s',
+                      ' '.join(argv), infile, outfile, errfile,
+                      ' on CPU %d' % cpu if cpu is not None else '')
+        # The peak memory usage the kernel reports for a process includes
+        # whatever it had mapped before exec, so the program is run
+        # through the (small) peakmem tool, which reports the peak
+        # memory usage of the program itself
+        peakmem = Program.__peakmem_path()
+        command = argv
+        report = None
+        if peakmem is not None:
+            (report_fd, report) = tempfile.mkstemp(prefix='peakmem-')
+            os.close(report_fd)
+            command = [peakmem, report] + argv
+        try:
+            return Program.__run_wait_measured(argv, command, infile, outfile,
+                                               errfile, timelim, memlim,
+                                               outputlim, cancel, walltimelim,
+                                               cpu, report)
+        finally:
+            if report is not None:
+                os.remove(report)
+
+
+    @staticmethod
+    def __peakmem_path():
+        # Imported here since tools imports us (through Executable)
+        from .tools import get_tool_path
+        return get_tool_path('peakmem')
+
+
+    @staticmethod
+    def __read_peakmem(report):
+        """Peak memory usage (in MB) written by peakmem, or -1.0 if
+        there is none (e.g. the run was killed before it finished)."""
+        if report is None:
+            return -1.0
+        try:
+            with open(report) as report_file:
+                return int(report_file.read()) / 1024.0
+        except (IOError, ValueError):
+            return -1.0
+
+
+    @staticmethod
+    def __run_wait_measured(argv, command, infile, outfile, errfile, timelim,
+                            memlim, outputlim, cancel, walltimelim, cpu, report):
+        # Killing peakmem would leave the program unreaped, and its CPU
+        # time unaccounted for.  On SIGTERM, peakmem kills the program
+        # and reaps it instead.
+        killsig = signal.SIGTERM if report is not None else signal.SIGKILL
+        launcher = Program.launcher
+        if launcher is not None:
+            (status, rusage, wall, wall_timeout) = launcher.run(
+                command, infile, outfile, errfile, timelim, memlim, outputlim,
+                cpu, cancel, walltimelim, killsig)
+        else:
+            start = rutil.monotonic()
+            pid = os.fork()
+            if pid == 0:  # child
+                exec_child(command, infile, outfile, errfile, timelim, memlim,
+                           outputlim, cpu)
+            # The watchdog is a token of our own, cancelled by a timer
+            # when the wall time limit is reached.  That way wait4 can
+            # block instead of polling.
+            watchdog = CancelToken()
+            watchdog._add(pid, killsig)
+            timer = None
+            if walltimelim is not None:
+                timer = threading.Timer(walltimelim, watchdog.cancel)
+                timer.daemon = True
+                timer.start()
+            if cancel is not None:
+                cancel._add(pid, killsig)
+            try:
+                (pid, status, rusage) = Program.__wait4(pid)
+                wall = rutil.monotonic() - start
+            finally:
+                if cancel is not None:
+                    cancel._remove(pid)
+                watchdog._remove(pid)
+                if timer is not None:
+                    timer.cancel()
+            wall_timeout = (watchdog.is_cancelled() and os.WIFSIGNALED(status)
+                            and os.WTERMSIG(status) in (signal.SIGKILL, killsig))
+        runtime = rusage.ru_utime + rusage.ru_stime
+        if cpu is not None:
+            logging.debug('run of "%s" took %.3fs CPU time on CPU %d', argv[0], runtime, cpu)
+        if wall_timeout:
+            logging.debug('"%s" exceeded wall time limit of %.1f secs, killed it',
+                          argv[0], walltimelim)
+        output_limit_exceeded = False
+        if outputlim is not None:
+            # Either killed by SIGXFSZ, or (if the program ignores
+            # SIGXFSZ) the output got the byte of slack past the limit
+            output_limit_exceeded = (
+                (os.WIFSIGNALED(status) and os.WTERMSIG(status) == signal.SIGXFSZ)
+                or Program.__file_size(outfile) > outputlim * 1024**2)
+            if output_limit_exceeded:
+                logging.debug('"%s" exceeded output limit of %d MB', argv[0], outputlim)
+        return RunResult(status, runtime, wall_timeout=wall_timeout,
+                         output_limit_exceeded=output_limit_exceeded,
+                         memory=Program.__read_peakmem(report), wall=wall,
+                         utime=rusage.ru_utime, stime=rusage.ru_stime,
+                         voluntary_ctxsw=rusage.ru_nvcsw,
+                         involuntary_ctxsw=rusage.ru_nivcsw)
+
+
+    @staticmethod
+    def __file_size(filename):
+        try:
+            return os.path.getsize(filename)
+        except OSError:
+            return 0
+
+
+    @staticmethod
+    def __wait4(pid, options=0):
+        while True:
+            try:
+                return os.wait4(pid, options)
+            except OSError as exc:
+                if exc.errno != errno.EINTR:
+                    raise
+
+
+    @staticmethod
+    def _run_captured(argv, cwd=None, timelim=None):
+        """Run a command with stdin from /dev/null, capturing its stdout
+        and stderr (used for compilation and similar auxiliary tasks).
+
+        The command is run in a process group of its own, and if the
+        time limit is exceeded the whole process group is killed.
+
+        Args:
+            argv (list of str): command to run
+            cwd (str): working directory for the command
+            timelim (int): if not None, limit in seconds on both the
+                wall time and the CPU time of the command.
+
+        Returns:
+            tuple (status, output, timed_out):
+                status (int): exit status of the command
+                output (str): the combined stdout and stderr of the
+                    command, truncated to at most _CAPTURE_LIMIT bytes
+                timed_out (bool): whether the command was killed for
+                    exceeding the wall time limit
+        """
+        logging.debug('run captured "%s" in %s', ' '.join(argv), cwd)
+        (read_fd, write_fd) = os.pipe()
+        # Neither end may leak into programs run by other threads (a
+        # leaked write end would keep us from ever seeing EOF)
+        rutil.set_cloexec(read_fd)
+        rutil.set_cloexec(write_fd)
         pid = os.fork()
         if pid == 0:  # child
             try:
+                os.setpgid(0, 0)
                 if timelim is not None:
                     limit.try_limit(resource.RLIMIT_CPU, timelim, timelim + 1)
-                if memlim is not None:
-                    limit.try_limit(resource.RLIMIT_AS, memlim * (1024**2), resource.RLIM_INFINITY)
-                limit.try_limit(resource.RLIMIT_STACK,
-                                resource.RLIM_INFINITY, resource.RLIM_INFINITY)
-                Program.__setfd(0, infile, os.O_RDONLY)
-                Program.__setfd(1, outfile,
-                                os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
-                Program.__setfd(2, errfile,
-                                os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+                os.close(read_fd)
+                Program.__setfd(0, '/dev/null', os.O_RDONLY)
+                os.dup2(write_fd, 1)
+                os.dup2(write_fd, 2)
+                os.close(write_fd)
+                if cwd is not None:
+                    os.chdir(cwd)
                 os.execvp(argv[0], argv)
             except Exception as exc:
                 print "Oops. Fatal error in child process:"
                 print exc
-                os.kill(os.getpid(), signal.SIGTERM)
-            # Unreachable
-            logging.error("Unreachable part of run_wait reached")
-            os.kill(os.getpid(), signal.SIGTERM)
-        (pid, status, rusage) = os.wait4(pid, 0)
-        return status, rusage.ru_utime + rusage.ru_stime
+            os._exit(127)
+        os.close(write_fd)
+
+        deadline = rutil.monotonic() + timelim if timelim is not None else None
+        chunks = []
+        captured = 0
+        truncated = False
+        timed_out = False
+        while True:
+            wait = None if deadline is None else max(0.0, deadline - rutil.monotonic())
+            try:
+                ready = select.select([read_fd], [], [], wait)[0]
+            except select.error as exc:
+                if exc.args[0] == errno.EINTR:
+                    continue
+                raise
+            if not ready:
+                timed_out = True
+                break
+            try:
+                data = os.read(read_fd, 1 << 16)
+            except OSError as exc:
+                if exc.errno == errno.EINTR:
+                    continue
+                raise
+            if not data:
+                break
+            keep = data[:max(0, Program._CAPTURE_LIMIT - captured)]
+            chunks.append(keep)
+            captured += len(keep)
+            truncated = truncated or len(keep) < len(data)
+        os.close(read_fd)
+        # The command may close its output and keep running, so the
+        # deadline applies to waiting for it to exit as well
+        status = None
+        if deadline is None:
+            (_, status, _) = Program.__wait4(pid)
+        while status is None and not timed_out:
+            (done, status, _) = Program.__wait4(pid, os.WNOHANG)
+            if done == 0:
+                status = None
+                wait = deadline - rutil.monotonic()
+                if wait <= 0:
+                    timed_out = True
+                else:
+                    time.sleep(min(wait, 0.05))
+        if timed_out:
+            logging.debug('"%s" exceeded time limit of %s secs, killing it', argv[0], timelim)
+            try:
+                os.killpg(pid, signal.SIGKILL)
+            except OSError:
+                pass
+            (_, status, _) = Program.__wait4(pid)
+        output = ''.join(chunks)
+        if truncated:
+            output += '\n[output truncated to %d bytes]\n' % Program._CAPTURE_LIMIT
+        return (status, output, timed_out)
 
 
     @staticmethod
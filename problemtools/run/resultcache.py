@@ -0,0 +1,90 @@
+"""
+Persistent cache of results of runs, e.g. of validators, keyed by
+hashes of everything that determines the result.
+"""
+import errno
+import hashlib
+import logging
+import marshal
+import os
+import tempfile
+
+from . import rutil
+
+
+class ResultCache(object):
+    """On-disk map from keys to small values (anything marshal can
+    store), one file per entry.
+
+    The cache may be shared between concurrent threads and processes:
+    entries are only ever created by atomic renames, and an unreadable
+    entry is simply treated as a cache miss.
+    """
+
+    def __init__(self, cache_dir):
+        """Create/open a result cache.
+
+        Args:
+            cache_dir (str): directory in which the cache is stored.
+                Created if it does not exist.
+        """
+        self.cache_dir = cache_dir
+        if not os.path.isdir(cache_dir):
+            try:
+                os.makedirs(cache_dir)
+            except OSError as exc:
+                if exc.errno != errno.EEXIST:
+                    raise
+
+
+    @staticmethod
+    def default_dir():
+        """Default location of the cache (following the XDG base
+        directory conventions)."""
+        return rutil.user_cache_path('validation')
+
+
+    @staticmethod
+    def key(*parts):
+        """Compute a cache key from a number of strings."""
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update('%d:%s' % (len(part), part))
+        return digest.hexdigest()
+
+
+    def get(self, key):
+        """Look up an entry.
+
+        Returns:
+            the stored value, or None if there is no entry for key.
+        """
+        try:
+            with open(self.__path(key), 'rb') as entry:
+                return marshal.load(entry)
+        except (IOError, EOFError, ValueError, TypeError):
+            return None
+
+
+    def put(self, key, value):
+        """Store an entry (replacing any previous entry for key)."""
+        path = self.__path(key)
+        try:
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+        except OSError as exc:
+            if exc.errno != errno.EEXIST:
+                raise
+        (fd, tmp_name) = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+        try:
+            with os.fdopen(fd, 'wb') as entry:
+                marshal.dump(value, entry)
+            os.rename(tmp_name, path)
+        except (IOError, OSError) as exc:
+            logging.debug('Failed to store result cache entry: %s', exc)
+            if os.path.exists(tmp_name):
+                os.unlink(tmp_name)
+
+
+    def __path(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
@@ -1,11 +1,19 @@
 """Some utility functions for the run module.
 """
+import ctypes
 import errno
+import fcntl
+import hashlib
 import os
 import shutil
+import time
 
 from .errors import ProgramError
 
+# Not exposed by the os module in Python 2
+O_CLOEXEC = getattr(os, 'O_CLOEXEC', 0o2000000)
+
+
 def add_files(src, dstdir):
     """Copy src to dstdir.
 
@@ -52,3 +60,161 @@ def list_files_recursive(root):
     for (path, _, files) in os.walk(root):
         ret.extend([os.path.join(root, path, filename) for filename in files])
     return ret
+
+
+def list_files(src):
+    """List the files add_files(src, dstdir) would copy.
+
+    Returns:
+        dict mapping the name of each file relative to dstdir to
+        the path of the file to copy there.
+    """
+    if os.path.isfile(src):
+        return {os.path.basename(src): src}
+    if not os.path.isdir(src):
+        raise ProgramError('File not found when copying program:\n %s' % src)
+    return dict((os.path.relpath(filename, src), filename)
+                for filename in list_files_recursive(src))
+
+
+# ioctl to make a copy-on-write clone of a file (on file systems that
+# support it, e.g. btrfs and XFS)
+_FICLONE = 0x40049409
+
+# Pairs of (source, destination) devices between which cloning failed
+_no_clone = set()
+
+
+def materialize_files(files, dstdir):
+    """Put files into a directory as cheaply as possible: as a
+    copy-on-write clone if the file system supports it, otherwise as a
+    copy.  Either way the files in dstdir can be modified without
+    affecting the originals.
+
+    Args:
+        files (dict): mapping from names relative to dstdir to the
+            files to put there, as returned by list_files.
+        dstdir (str): directory into which to put the files.  Must be
+            an existing directory.
+    """
+    for (name, src) in sorted(files.items()):
+        dst = os.path.join(dstdir, name)
+        if not os.path.isdir(os.path.dirname(dst)):
+            os.makedirs(os.path.dirname(dst))
+        if os.path.lexists(dst):
+            os.unlink(dst)
+        src = os.path.realpath(src)
+        if not _clone(src, dst):
+            shutil.copy(src, dst)
+
+
+def file_digest(path):
+    """SHA-256 hash (hex) of the contents of a file."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f_in:
+        for buf in iter(lambda: f_in.read(1 << 20), b''):
+            digest.update(buf)
+    return digest.hexdigest()
+
+
+def hash_files(files, extra=()):
+    """Hash a set of files, e.g. the source files of a program.
+
+    Args:
+        files (dict): maps relative names to the paths of the files
+            (as returned by list_files).
+        extra (list of str): other things to include in the hash.
+
+    Returns:
+        str, hex digest covering the extra items and the names,
+        executable bits and contents of the files.
+    """
+    digest = hashlib.sha256()
+    for item in extra:
+        digest.update('%d:%s' % (len(item), item))
+    for relname in sorted(files):
+        mode = os.stat(files[relname]).st_mode
+        digest.update('%d:%s:%o:%s' % (len(relname), relname, mode & 0o111,
+                                       file_digest(files[relname])))
+    return digest.hexdigest()
+
+
+def _clone(src, dst):
+    devices = (os.stat(src).st_dev, os.stat(os.path.dirname(dst)).st_dev)
+    if devices in _no_clone:
+        return False
+    try:
+        with open(src, 'rb') as f_in:
+            with open(dst, 'wb') as f_out:
+                fcntl.ioctl(f_out.fileno(), _FICLONE, f_in.fileno())
+        shutil.copymode(src, dst)
+        return True
+    except IOError as exc:
+        if exc.errno == errno.ENOENT:
+            raise ProgramError('File not found when copying program:\n %s' % exc.filename)
+        if os.path.exists(dst):
+            os.unlink(dst)
+        _no_clone.add(devices)
+        return False
+
+
+_libc = []
+
+
+def libc():
+    """The C library, loaded through ctypes with errno support.
+
+    Returns:
+        ctypes.CDLL, or None if the C library cannot be found.
+    """
+    if not _libc:
+        from ctypes.util import find_library
+        libc_name = find_library('c')
+        _libc.append(ctypes.CDLL(libc_name, use_errno=True) if libc_name else None)
+    return _libc[0]
+
+
+class _Timespec(ctypes.Structure):
+    _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+
+_CLOCK_MONOTONIC = 1
+_clock_gettime = []
+
+
+def monotonic():
+    """Current time in seconds, from a clock that is not affected by
+    changes to the system time.  Only differences between values are
+    meaningful.  Falls back to time.time() if no monotonic clock is
+    available.
+    """
+    if not _clock_gettime:
+        _clock_gettime.append(getattr(libc(), 'clock_gettime', None))
+    clock_gettime = _clock_gettime[0]
+    if clock_gettime is not None:
+        now = _Timespec()
+        if clock_gettime(_CLOCK_MONOTONIC, ctypes.byref(now)) == 0:
+            return now.tv_sec + now.tv_nsec * 1e-9
+    return time.time()
+
+
+def user_cache_path(name):
+    """Location of a cache of problemtools in the cache directory of
+    the user (following the XDG base directory conventions).
+
+    Args:
+        name (str): file or directory name of the cache.
+
+    Returns:
+        str, the path of the cache (which need not exist).
+    """
+    base = os.environ.get('XDG_CACHE_HOME',
+                          os.path.join(os.path.expanduser('~'), '.cache'))
+    return os.path.join(base, 'problemtools', name)
+
+
+def set_cloexec(fd):
+    """Make a file descriptor be closed when exec'ing a program, so
+    that it is not inherited by other programs we run."""
+    flags = fcntl.fcntl(fd, fcntl.F_GETFD)
+    fcntl.fcntl(fd, fcntl.F_SETFD, flags | fcntl.FD_CLOEXEC)
@@ -0,0 +1,126 @@
+"""
+Scratch storage for the output of runs and for feedback directories of
+output validators.
+
+Scratch directories are placed in memory (on a tmpfs such as /dev/shm)
+as long as they fit within a budget, and on disk otherwise.  They are
+recycled through pools instead of being created and removed for every
+run.
+"""
+import contextlib
+import errno
+import logging
+import os
+import shutil
+import tempfile
+import threading
+
+
+class ScratchStorage(object):
+    """Pools of scratch directories.  Safe to use from several threads
+    at once; a directory is only handed out to one user at a time.
+
+    Directories for output of runs are each accounted as slot_size
+    bytes against the in-memory budget, so slot_size should be the
+    largest output a run may produce (i.e., the output limit).  Feedback
+    directories are assumed to be small and are not accounted.
+    """
+
+    def __init__(self, disk_dir, budget=0, slot_size=0, shm_dir='/dev/shm'):
+        """Create scratch storage.
+
+        Args:
+            disk_dir (str): directory in which to place scratch
+                directories on disk.
+            budget (int): maximum number of bytes of scratch space to
+                place in memory.  0 means to always use disk.
+            slot_size (int): number of bytes to account for each
+                output directory.
+            shm_dir (str): tmpfs directory in which to place in-memory
+                scratch directories.
+        """
+        self.budget = budget
+        self.slot_size = slot_size
+        self._lock = threading.Lock()
+        self._free_output = {True: [], False: []}
+        self._free_feedback = []
+        self._reserved = 0
+        self._disk_root = tempfile.mkdtemp(prefix='scratch-', dir=disk_dir)
+        self._shm_root = None
+        if budget > 0 and budget >= slot_size and os.path.isdir(shm_dir):
+            try:
+                self._shm_root = tempfile.mkdtemp(prefix='problemtools-', dir=shm_dir)
+            except OSError as exc:
+                logging.debug('Could not create scratch directory in %s: %s', shm_dir, exc)
+
+
+    @contextlib.contextmanager
+    def output_dir(self):
+        """Context manager giving an empty directory for the output of
+        a run, in memory if there is room within the budget."""
+        (path, in_memory) = self.__acquire_output_dir()
+        try:
+            yield path
+        finally:
+            ScratchStorage.__empty(path)
+            with self._lock:
+                self._free_output[in_memory].append(path)
+
+
+    @contextlib.contextmanager
+    def feedback_dir(self):
+        """Context manager giving an empty feedback directory for an
+        output validator."""
+        with self._lock:
+            path = self._free_feedback.pop() if self._free_feedback else None
+        if path is None:
+            path = tempfile.mkdtemp(prefix='feedback',
+                                    dir=self._shm_root or self._disk_root)
+        try:
+            yield path
+        finally:
+            ScratchStorage.__empty(path)
+            with self._lock:
+                self._free_feedback.append(path)
+
+
+    def close(self):
+        """Remove all scratch directories."""
+        for root in [self._shm_root, self._disk_root]:
+            if root is not None:
+                shutil.rmtree(root, ignore_errors=True)
+        self._shm_root = None
+
+
+    def __acquire_output_dir(self):
+        with self._lock:
+            for in_memory in [True, False]:
+                if self._free_output[in_memory]:
+                    return (self._free_output[in_memory].pop(), in_memory)
+            if self._shm_root is not None and self._reserved + self.slot_size <= self.budget \
+                    and self.__shm_free() >= self.slot_size:
+                self._reserved += self.slot_size
+                return (tempfile.mkdtemp(prefix='output', dir=self._shm_root), True)
+        return (tempfile.mkdtemp(prefix='output', dir=self._disk_root), False)
+
+
+    def __shm_free(self):
+        try:
+            info = os.statvfs(self._shm_root)
+        except OSError:
+            return 0
+        return info.f_bavail * info.f_frsize
+
+
+    @staticmethod
+    def __empty(path):
+        for name in os.listdir(path):
+            entry = os.path.join(path, name)
+            try:
+                if os.path.isdir(entry) and not os.path.islink(entry):
+                    shutil.rmtree(entry)
+                else:
+                    os.unlink(entry)
+            except OSError as exc:
+                if exc.errno != errno.ENOENT:
+                    raise
@@ -4,6 +4,7 @@ Implementation of programs provided by source code.
 import re
 import os
 import shlex
+import shutil
 import tempfile
 import logging
 
@@ -34,6 +35,9 @@ class SourceCode(Program):
                 source code for language ID <foo> (e.g. <foo>="cpp"),
                 then the files in include_dir/<foo>/ will be copied
                 into the work_dir along with the source file(s).
+
+        The files are not put in the work dir until the program is
+        compiled.
         """
 
         if path[-1] == '/':
@@ -50,16 +54,18 @@ class SourceCode(Program):
         else:
             os.makedirs(self.path)
 
-        # Copy all files
-        rutil.add_files(path, self.path)
+        # Files to put in the work dir (include files take precedence)
+        self._files = rutil.list_files(path)
         if include_dir is not None:
             include_dir = os.path.join(include_dir, self.language.lang_id)
             if os.path.isdir(include_dir):
-                rutil.add_files(include_dir, self.path)
+                self._files.update(rutil.list_files(include_dir))
+        self._sources = self._files
 
-        self.src = sorted(self.language.get_source_files(
-            rutil.list_files_recursive(self.path)
-        ))
+        work_names = dict((src, os.path.join(self.path, name))
+                          for (name, src) in self._files.items())
+        self.src = sorted(work_names[src] for src in
+                          self.language.get_source_files(work_names.keys()))
         if len(self.src) == 0:
             raise ProgramError('No source files found for language %s in %s'
                                % (self.language.lang_id, self.name))
@@ -74,31 +80,56 @@ class SourceCode(Program):
 
 
     _compile_result = None
+    compile_output = ''
 
 
-    def compile(self):
+    def compile(self, timelim=None):
         """Compile the source code.
 
+        Args:
+            timelim (int): if not None, limit in seconds on the wall
+                time and CPU time of the compiler.
+
         Returns:
-            True if compilation succeeded, False otherwise
+            True if compilation succeeded, False otherwise.  The output
+            of the compiler is available in compile_output.
         """
         if self._compile_result is not None:
             return self._compile_result
 
+        self.__materialize()
+
         if self.language.compile is None:
             self._compile_result = True
             return True
 
         command = self.language.compile.format(**self.__get_substitution())
 
+        cache = Program.compile_cache
+        cache_key = None
+        if cache is not None:
+            cache_key = cache.key(self.path,
+                                  [self.language.compile,
+                                   cache.tool_fingerprint(command)])
+            if cache.restore(cache_key, self.path):
+                logging.debug('restored %s from compile cache', self.name)
+                self._compile_result = True
+                return True
+
         logging.debug('compile command: %s', command)
-        status = os.system(command + ' > /dev/null 2> /dev/null')
+        (status, self.compile_output, timed_out) = Program._run_captured(
+            ['/bin/sh', '-c', command], cwd=self.path, timelim=timelim)
 
-        if not os.WIFEXITED(status) or os.WEXITSTATUS(status) != 0:
-            logging.info('Compiler failed (status %d) when compiling %s\n        Command used:\n%s', status, self.name, command)
+        if timed_out:
+            logging.info('Compiler exceeded time limit of %d secs when compiling %s\n        Command used:\n%s', timelim, self.name, command)
+            self._compile_result = False
+        elif not os.WIFEXITED(status) or os.WEXITSTATUS(status) != 0:
+            logging.info('Compiler failed (status %d) when compiling %s\n        Command used:\n%s\n        Compiler output:\n%s', status, self.name, command, self.compile_output)
             self._compile_result = False
         else:
             self._compile_result = True
+            if cache_key is not None:
+                cache.store(cache_key, self.path)
         return self._compile_result
 
 
@@ -121,6 +152,18 @@ class SourceCode(Program):
         return shlex.split(self.language.run.format(**subs))
 
 
+    def _compute_fingerprint(self):
+        return rutil.hash_files(self._sources,
+                                [self.language.lang_id,
+                                 self.language.compile or '',
+                                 self.language.run])
+
+
+    def discard(self):
+        """Remove the work directory of the program."""
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
     def should_skip_memory_rlimit(self):
         """Ugly hack (see program.py for details)."""
         return self.language.name in ['Java', 'Scala']
@@ -131,6 +174,14 @@ class SourceCode(Program):
         return '%s (%s)' % (self.name, self.language.name)
 
 
+    def __materialize(self):
+        if self._files is not None:
+            # Not hard linked, since the program (or its compiler)
+            # could write to the files
+            rutil.materialize_files(self._files, self.path)
+            self._files = None
+
+
     def __get_substitution(self, memlim=1024):
         return {
             'path': self.path,
@@ -0,0 +1,117 @@
+"""
+Persistent state of earlier verifications: results of running programs
+on test cases, together with hashes of everything the results depend
+on, so that only what has changed needs to be rerun.
+"""
+import errno
+import os
+import sqlite3
+import threading
+import time
+
+from . import rutil
+
+
+class StateDB(object):
+    """SQLite database of results of runs of programs on test cases,
+    one result per (program, test case).
+
+    A program is identified by its fingerprint (see
+    Program.fingerprint), so a changed program is a new program.  With
+    each result the hash of the test data and of the setup (validators,
+    limits etc.) is stored, and the result is only handed out again if
+    neither has changed.  Results not used in a long time are removed
+    when the database is opened.
+
+    Safe to use from several threads at once.
+    """
+
+    # Results not used in this many seconds are removed
+    _EXPIRY = 30 * 24 * 3600
+    _RESULT_FIELDS = ['verdict', 'score', 'reason', 'runtime', 'memory', 'wall',
+                      'utime', 'stime', 'voluntary_ctxsw', 'involuntary_ctxsw']
+
+    def __init__(self, path):
+        """Open a state database, creating it if it does not exist.
+
+        Args:
+            path (str): the database file.
+        """
+        self.path = path
+        if not os.path.isdir(os.path.dirname(os.path.abspath(path))):
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(path)))
+            except OSError as exc:
+                if exc.errno != errno.EEXIST:
+                    raise
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('CREATE TABLE IF NOT EXISTS results ('
+                         'program TEXT, testcase TEXT, data TEXT, setup TEXT, '
+                         'timelim REAL, verdict TEXT, score REAL, reason TEXT, '
+                         'runtime REAL, memory REAL, wall REAL, utime REAL, stime REAL, '
+                         'voluntary_ctxsw INTEGER, involuntary_ctxsw INTEGER, '
+                         'last_used REAL, PRIMARY KEY (program, testcase))')
+        self._db.execute('DELETE FROM results WHERE last_used < ?',
+                         (time.time() - StateDB._EXPIRY,))
+        self._db.commit()
+
+
+    @staticmethod
+    def default_path():
+        """Default location of the database (following the XDG base
+        directory conventions)."""
+        return rutil.user_cache_path('state.sqlite')
+
+
+    def get(self, program, testcase, data, setup):
+        """Look up the result of a program on a test case.
+
+        Args:
+            program (str): fingerprint of the program.
+            testcase (str): name of the test case.
+            data (str): hash of the test data of the test case.
+            setup (str): hash of everything else the result depends on.
+
+        Returns:
+            tuple (timelim, result), the time limit of the run and a
+            dict with the result fields (see put), or None if there is
+            no result for the program on the test case with this data
+            and setup.
+        """
+        with self._lock:
+            row = self._db.execute('SELECT timelim, %s FROM results '
+                                   'WHERE program = ? AND testcase = ? AND data = ? AND setup = ?'
+                                   % ', '.join(StateDB._RESULT_FIELDS),
+                                   (program, testcase, data, setup)).fetchone()
+            if row is None:
+                return None
+            self._db.execute('UPDATE results SET last_used = ? WHERE program = ? AND testcase = ?',
+                             (time.time(), program, testcase))
+            self._db.commit()
+        return (row[0], dict(zip(StateDB._RESULT_FIELDS, row[1:])))
+
+
+    def put(self, program, testcase, data, setup, timelim, result):
+        """Store the result of a program on a test case (replacing any
+        earlier result).
+
+        Args:
+            program, testcase, data, setup: see get.
+            timelim (float): time limit of the run.
+            result (dict): maps each of verdict, score, reason,
+                runtime, memory, wall, utime, stime, voluntary_ctxsw
+                and involuntary_ctxsw to its value.
+        """
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO results VALUES (%s)' % ', '.join(['?'] * 16),
+                             [program, testcase, data, setup, timelim] +
+                             [result[field] for field in StateDB._RESULT_FIELDS] +
+                             [time.time()])
+            self._db.commit()
+
+
+    def close(self):
+        """Close the database."""
+        with self._lock:
+            self._db.close()
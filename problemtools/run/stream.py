@@ -0,0 +1,141 @@
+"""
+Streaming the output of one program into another, e.g. the output of
+a submission into an output validator, without going through a file.
+
+The programs are connected through two FIFOs with a tee in between,
+which counts the bytes passing through so that an output limit can be
+enforced (RLIMIT_FSIZE does not apply to pipes).
+"""
+import errno
+import fcntl
+import os
+import sys
+import threading
+
+from . import rutil
+from .program import Program
+
+
+def run_piped(produce, consume, fifo_dir, limit=None):
+    """Run a producer and a consumer program concurrently, with the
+    output of the producer streamed to the input of the consumer.
+
+    Args:
+        produce (callable): called with the name of the file to which
+            the producer should write, runs the producer and returns
+            its result.
+        consume (callable): called with the name of the file from
+            which the consumer should read, runs the consumer and
+            returns its result.
+        fifo_dir (str): empty directory in which to create the FIFOs.
+        limit (int): if not None, maximum number of bytes the producer
+            may output.  If it outputs more, the stream is cut (the
+            producer gets SIGPIPE and the consumer end of file).
+
+    Returns:
+        tuple (produced, consumed, size, limit_exceeded): the results
+        of produce and consume, the number of bytes output by the
+        producer, and whether it exceeded the limit.
+    """
+    producer_fifo = os.path.join(fifo_dir, 'produced')
+    consumer_fifo = os.path.join(fifo_dir, 'consumed')
+    os.mkfifo(producer_fifo, 0o600)
+    os.mkfifo(consumer_fifo, 0o600)
+
+    # We hold a writer of the producer FIFO and a reader of the
+    # consumer FIFO ourselves until the respective program has
+    # finished.  That way none of the opens below block, the tee does
+    # not see end of file before the producer has even started, and
+    # what the tee writes stays in the pipe even if it finishes before
+    # the consumer has opened the FIFO (which it does non-blocking, so
+    # that it does not wait for a writer that has come and gone).
+    tee_in = os.open(producer_fifo, os.O_RDONLY | os.O_NONBLOCK | rutil.O_CLOEXEC)
+    guard_writer = os.open(producer_fifo, os.O_WRONLY | os.O_NONBLOCK | rutil.O_CLOEXEC)
+    guard_reader = os.open(consumer_fifo, os.O_RDONLY | os.O_NONBLOCK | rutil.O_CLOEXEC)
+    tee_out = os.open(consumer_fifo, os.O_WRONLY | os.O_NONBLOCK | rutil.O_CLOEXEC)
+    for fd in [tee_in, tee_out]:
+        fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) & ~os.O_NONBLOCK)
+
+    tee = _Tee(tee_in, tee_out, limit)
+    tee_thread = threading.Thread(target=tee.run)
+    tee_thread.daemon = True
+    tee_thread.start()
+
+    consumer = {}
+
+    def run_consumer():
+        try:
+            # The consumer only runs alongside the producer, so it
+            # must not wait for a core of its own when runs are pinned
+            consumer['result'] = Program.run_unpinned(consume, consumer_fifo)
+        except:
+            consumer['exc_info'] = sys.exc_info()
+        finally:
+            # Lets the tee discard whatever the consumer did not read
+            os.close(guard_reader)
+
+    consumer_thread = threading.Thread(target=run_consumer)
+    consumer_thread.daemon = True
+    consumer_thread.start()
+
+    try:
+        produced = produce(producer_fifo)
+    finally:
+        os.close(guard_writer)
+        tee_thread.join()
+        consumer_thread.join()
+    if 'exc_info' in consumer:
+        exc_info = consumer['exc_info']
+        raise exc_info[0], exc_info[1], exc_info[2]
+    return (produced, consumer['result'], tee.size, tee.limit_exceeded)
+
+
+class _Tee(object):
+    """Copies from one fd to another, counting the bytes.  If the
+    destination goes away, the rest of the source is read and
+    discarded."""
+
+    def __init__(self, src, dst, limit):
+        self.src = src
+        self.dst = dst
+        self.limit = limit
+        self.size = 0
+        self.limit_exceeded = False
+
+
+    def run(self):
+        try:
+            while True:
+                try:
+                    data = os.read(self.src, 1 << 16)
+                except OSError as exc:
+                    if exc.errno == errno.EINTR:
+                        continue
+                    raise
+                if not data:
+                    break
+                self.size += len(data)
+                if self.limit is not None and self.size > self.limit:
+                    self.limit_exceeded = True
+                    break
+                if self.dst is not None:
+                    self.__write(data)
+        finally:
+            os.close(self.src)
+            if self.dst is not None:
+                os.close(self.dst)
+
+
+    def __write(self, data):
+        while data:
+            try:
+                written = os.write(self.dst, data)
+            except OSError as exc:
+                if exc.errno == errno.EINTR:
+                    continue
+                if exc.errno == errno.EPIPE:
+                    os.close(self.dst)
+                    self.dst = None
+                    return
+                raise
+            data = data[written:]
@@ -1,8 +1,15 @@
 import os
+import threading
 from .executable import Executable
 
+# Tools already located, looking for them is only done when first needed
+_tool_paths = {}
+_tools = {}
+_tools_lock = threading.Lock()
+
 def get_tool_path(name):
-    """Find the path to one of problemtools' external tools.
+    """Find the path to one of problemtools' external tools.  The result
+    is remembered for later calls.
 
     Args:
         name (str): which tool is wanted (one of [default_grader,
@@ -11,15 +18,20 @@ def get_tool_path(name):
     Returns:
         str, path to the tool, or None if the tool was not found.
     """
-    return __locate_executable([os.path.join(os.path.dirname(__file__),
-                                             '..', 'support', name),
-                                os.path.join(os.path.dirname(__file__),
-                                             '..', '..', 'support',
-                                             os.path.splitext(name)[0], name)])
+    with _tools_lock:
+        if name not in _tool_paths:
+            _tool_paths[name] = __locate_executable(
+                [os.path.join(os.path.dirname(__file__),
+                              '..', 'support', name),
+                 os.path.join(os.path.dirname(__file__),
+                              '..', '..', 'support',
+                              os.path.splitext(name)[0], name)])
+        return _tool_paths[name]
 
 
 def get_tool(name):
     """Get an Executable instance for one of problemtools' external tools.
+    The same instance is returned by later calls.
 
     Args:
         name(str): same as for get_tool_path
@@ -29,7 +41,10 @@ def get_tool(name):
         the tool was not found.
     """
     path = get_tool_path(name)
-    return Executable(path) if path is not None else None
+    with _tools_lock:
+        if name not in _tools:
+            _tools[name] = Executable(path) if path is not None else None
+        return _tools[name]
 
 
 def __locate_executable(candidate_paths):
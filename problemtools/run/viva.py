@@ -3,6 +3,8 @@ verification language (http://viva.vanb.org/).
 """
 
 import os
+import re
+import tempfile
 from .executable import Executable
 from .errors import ProgramError
 from .tools import get_tool_path
@@ -11,18 +13,21 @@ from .tools import get_tool_path
 class Viva(Executable):
     """Wrapper class for running VIVA scripts.
     """
-    _VIVA_PATH = get_tool_path('viva.sh')
-
+    # Number of input files validated by each run of VIVA in run_batch
+    _BATCH_SIZE = 200
+    _BEGIN_RE = re.compile(r'^<<< Testing file: (.*) >>>$')
+    _END_RE = re.compile(r'^<<< DONE Testing file: (.*) >>>$')
     def __init__(self, path):
         """Create a VIVA wrapper.
 
         Args:
             path (str): path to .viva source file
         """
-        if Viva._VIVA_PATH is None:
+        tool_path = get_tool_path('viva.sh')
+        if tool_path is None:
             raise ProgramError(
                 'Could not locate the VIVA program to run %s' % path)
-        super(Viva, self).__init__(Viva._VIVA_PATH,
+        super(Viva, self).__init__(tool_path,
                                    args=[path])
 
 
@@ -32,14 +37,19 @@ class Viva(Executable):
 
 
     _compile_result = None
-    def compile(self):
+    def compile(self, timelim=None):
         """Syntax-check the VIVA script
 
+        Args:
+            timelim (int): if not None, time limit in seconds for the
+                syntax check.
+
         Returns:
             False if the VIVA script has syntax errors and True otherwise
         """
         if self._compile_result is None:
-            (status, _) = super(Viva, self).run()
+            (status, _) = super(Viva, self).run(
+                timelim=timelim if timelim is not None else 1000)
             self._compile_result = (os.WIFEXITED(status) and
                                     os.WEXITSTATUS(status) == 0)
         return self._compile_result
@@ -81,3 +91,79 @@ class Viva(Executable):
         if os.WIFEXITED(status) and os.WEXITSTATUS(status) == 42:
             return (0, runtime)
         return (status, runtime)
+
+
+    def run_batch(self, infiles, args=None, timelim=1000):
+        """Validate many input files with one JVM, by passing several
+        input files to each run of VIVA.
+
+        VIVA only tells us how many of the files it rejected, so which
+        ones they were is deduced from the error messages it prints for
+        each file.  Input files for which this is ambiguous get no
+        result, and should be validated with run().
+
+        Args:
+            infiles (list of str): names of input files to validate
+            args (list of str): additional command-line arguments to
+                pass to VIVA
+            timelim (int): time limit for each VIVA process in seconds
+
+        Returns:
+            dict mapping input file names to exit statuses, as returned
+            by run().
+        """
+        if args is None:
+            args = []
+        results = {}
+        for pos in range(0, len(infiles), Viva._BATCH_SIZE):
+            chunk = infiles[pos:pos + Viva._BATCH_SIZE]
+            (fd, outfile) = tempfile.mkstemp()
+            os.close(fd)
+            try:
+                (status, _) = super(Viva, self).run(outfile=outfile,
+                                                    errfile=outfile + '.err',
+                                                    args=args + chunk,
+                                                    timelim=timelim)
+                output = ''
+                for name in [outfile, outfile + '.err']:
+                    with open(name) as output_file:
+                        output += output_file.read()
+            finally:
+                for name in [outfile, outfile + '.err']:
+                    if os.path.exists(name):
+                        os.unlink(name)
+            results.update(Viva._parse_batch_output(chunk, status, output))
+        return results
+
+
+    @staticmethod
+    def _parse_batch_output(infiles, status, output):
+        """Figure out which files a run of VIVA on several input files
+        accepted, see run_batch."""
+        if not os.WIFEXITED(status):
+            return {}
+        # Lines printed between the start and end markers of each file
+        messages = {}
+        current = None
+        for line in output.splitlines():
+            match = Viva._BEGIN_RE.match(line)
+            if match:
+                current = match.group(1)
+                messages[current] = 0
+                continue
+            match = Viva._END_RE.match(line)
+            if match and match.group(1) == current:
+                current = None
+            elif current is not None and line.strip():
+                messages[current] += 1
+        if any(infile not in messages for infile in infiles) or current is not None:
+            return {}
+
+        # The exit code is the number of rejected files
+        rejected = [infile for infile in infiles if messages[infile] > 0]
+        if os.WEXITSTATUS(status) == 0:
+            rejected = []
+        elif len(rejected) % 256 != os.WEXITSTATUS(status):
+            return {}
+        return dict((infile, 1 << 8 if infile in rejected else 42 << 8)
+                    for infile in infiles)
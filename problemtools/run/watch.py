@@ -0,0 +1,165 @@
+"""
+Module for watching a directory tree for changes, using inotify.
+"""
+import ctypes
+import errno
+import logging
+import os
+import select
+import struct
+
+from . import rutil
+from .errors import ProgramError
+
+
+_IN_ATTRIB = 0x00000004
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_FROM = 0x00000040
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_DELETE = 0x00000200
+_IN_Q_OVERFLOW = 0x00004000
+_IN_IGNORED = 0x00008000
+_IN_ISDIR = 0x40000000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = (_IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO |
+               _IN_CREATE | _IN_DELETE)
+
+# struct inotify_event, followed by a NUL padded name of len bytes
+_EVENT = struct.Struct('iIII')
+
+
+class DirectoryWatcher(object):
+    """Watches a directory and all its subdirectories for files being
+    written, created, removed, renamed or having their permissions
+    changed.  Temporary files of editors (hidden files and backup
+    files) are ignored.
+    """
+
+    def __init__(self, path):
+        """Start watching a directory.
+
+        Args:
+            path (str): the directory.
+        """
+        libc = DirectoryWatcher.__load_libc()
+        if libc is None:
+            raise ProgramError('inotify is not available, cannot watch for changes')
+        self.path = path
+        self._libc = libc
+        self._fd = libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self._fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._dirs = {}
+        self._buffer = ''
+        self.__add_tree(path)
+
+
+    @staticmethod
+    def available():
+        """Check whether inotify is supported."""
+        return DirectoryWatcher.__load_libc() is not None
+
+
+    def wait(self, settle=0.5):
+        """Wait for changes.
+
+        Args:
+            settle (float): after the first change, keep collecting
+                changes until there has been none for this many
+                seconds (so that e.g. a program being saved in several
+                steps is seen as a single change).
+
+        Returns:
+            set of str, paths of the changed files and directories.  If
+            changes were lost (the kernel's event queue overflowed) the
+            watched directory itself is included.
+        """
+        changed = set()
+        timeout = None
+        while True:
+            try:
+                ready = select.select([self._fd], [], [], timeout)[0]
+            except select.error as exc:
+                if exc.args[0] == errno.EINTR:
+                    continue
+                raise
+            if not ready:
+                if changed:
+                    return changed
+                continue
+            changed |= self.__read_events()
+            if changed:
+                timeout = settle
+
+
+    def close(self):
+        """Stop watching."""
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+
+    def __read_events(self):
+        changed = set()
+        try:
+            self._buffer += os.read(self._fd, 1 << 16)
+        except OSError as exc:
+            if exc.errno not in (errno.EINTR, errno.EAGAIN):
+                raise
+        while len(self._buffer) >= _EVENT.size:
+            (wd, mask, _, name_len) = _EVENT.unpack_from(self._buffer)
+            if len(self._buffer) < _EVENT.size + name_len:
+                break
+            name = self._buffer[_EVENT.size:_EVENT.size + name_len].rstrip('\0')
+            self._buffer = self._buffer[_EVENT.size + name_len:]
+            if mask & _IN_Q_OVERFLOW:
+                logging.debug('inotify event queue overflowed')
+                changed.add(self.path)
+                continue
+            directory = self._dirs.get(wd)
+            if mask & _IN_IGNORED:
+                self._dirs.pop(wd, None)
+                continue
+            if directory is None or DirectoryWatcher.__is_temporary(name):
+                continue
+            path = os.path.join(directory, name)
+            if mask & _IN_ISDIR and mask & (_IN_CREATE | _IN_MOVED_TO):
+                # Files may have been put in the directory before the
+                # watch was added, count them as changed too
+                changed |= self.__add_tree(path)
+            changed.add(path)
+        return changed
+
+
+    def __add_tree(self, path):
+        """Watch a directory and its subdirectories.  Returns the set of
+        files and directories found in them."""
+        found = set()
+        for (root, dirs, files) in os.walk(path):
+            dirs[:] = [name for name in dirs if not DirectoryWatcher.__is_temporary(name)]
+            wd = self._libc.inotify_add_watch(self._fd, root, _WATCH_MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                # The directory may already be gone again
+                if err in (errno.ENOENT, errno.ENOTDIR):
+                    continue
+                raise OSError(err, '%s: %s' % (root, os.strerror(err)))
+            self._dirs[wd] = root
+            found |= set(os.path.join(root, name) for name in dirs + files
+                         if not DirectoryWatcher.__is_temporary(name))
+        return found
+
+
+    @staticmethod
+    def __is_temporary(name):
+        return name.startswith('.') or name.startswith('#') or name.endswith('~')
+
+
+    @staticmethod
+    def __load_libc():
+        libc = rutil.libc()
+        return libc if hasattr(libc, 'inotify_init1') else None
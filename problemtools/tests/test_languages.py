@@ -3,6 +3,8 @@ from unittest import TestCase
 import pytest
 import os
 import re
+import shutil
+import tempfile
 
 from problemtools import languages
 
@@ -246,3 +248,52 @@ class Languages_test(TestCase):
         lang = langs.detect_language(map(lambda x: examples_path(x),
                                          ['src2.zoo', 'src3.zpp']))
         assert lang.lang_id == 'zoopp'
+
+
+    def test_detect_with_non_suffix_globs(self):
+        langs = languages.Languages()
+        langs.update(examples_path('zoo.yaml'))
+        langs.languages['zoo'].update({'files': 'Zoofile *.zoo'})
+        tmpdir = tempfile.mkdtemp()
+        try:
+            zoofile = os.path.join(tmpdir, 'Zoofile')
+            src = os.path.join(tmpdir, 'main.zpp.zoo')
+            for name in [zoofile, src]:
+                with open(name, 'w') as f_out:
+                    f_out.write('no shebang\n')
+            lang = langs.detect_language([zoofile, src])
+            assert lang.lang_id == 'zoo'
+            assert langs.detect_language([os.path.join(tmpdir, 'x.txt')]) is None
+        finally:
+            shutil.rmtree(tmpdir)
+
+
+class LoadLanguageConfig_test(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.config = os.path.join(self.tmpdir, 'languages.yaml')
+        shutil.copy(examples_path('zoo.yaml'), self.config)
+
+    def tearDown(self):
+        languages.Languages.cache_file = None
+        shutil.rmtree(self.tmpdir)
+
+    def test_cached_until_modified(self):
+        langs = languages.load_language_config([self.config])
+        assert languages.load_language_config([self.config]) is langs
+        with open(self.config, 'a') as config:
+            config.write('\nzaa:\n    name: "Zaa"\n    priority: 30\n'
+                         '    files: "*.zaa"\n    run: "{binary}"\n')
+        reloaded = languages.load_language_config([self.config])
+        assert reloaded is not langs
+        assert 'zaa' in reloaded.languages
+
+    def test_persisted(self):
+        languages.Languages.cache_file = os.path.join(self.tmpdir, 'cache', 'languages.pickle')
+        langs = languages.load_language_config([self.config])
+        assert os.path.isfile(languages.Languages.cache_file)
+        languages._CACHE.clear()
+        persisted = languages.load_language_config([self.config])
+        assert persisted is not langs
+        assert sorted(persisted.languages) == sorted(langs.languages)
+        assert persisted.languages['zoork'].shebang.match('>Zoork')
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+
+from problemtools.run import affinity
+
+
+class Affinity_test(TestCase):
+    def test_parse_cpu_list(self):
+        assert affinity.parse_cpu_list('0') == set([0])
+        assert affinity.parse_cpu_list('0-3,8,10-11\n') == set([0, 1, 2, 3, 8, 10, 11])
+        assert affinity.parse_cpu_list('') == set()
+
+    def test_dedicated_cores(self):
+        topology = tempfile.mkdtemp()
+        try:
+            # Two physical cores with two hardware threads each
+            for (cpu, siblings) in [(0, '0,2'), (1, '1,3'), (2, '0,2'), (3, '1,3')]:
+                path = os.path.join(topology, 'cpu%d' % cpu, 'topology')
+                os.makedirs(path)
+                with open(os.path.join(path, 'thread_siblings_list'), 'w') as f_out:
+                    f_out.write(siblings + '\n')
+            assert affinity.dedicated_cores(set([0, 1, 2, 3]), topology) == [0, 1]
+            assert affinity.dedicated_cores(set([2, 3]), topology) == [2, 3]
+            assert affinity.dedicated_cores(set([1, 2, 3]), topology) == [1, 2]
+        finally:
+            shutil.rmtree(topology)
+
+    def test_allowed_cpus(self):
+        assert len(affinity.allowed_cpus(cpuset_files=[])) > 0
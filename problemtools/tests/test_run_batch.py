@@ -0,0 +1,112 @@
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from unittest import TestCase
+
+from problemtools.run import BATCH_ARG, BatchPool, BatchProcess
+
+# Echoes the number of fields of every job, and dies on a job "die"
+BATCH_ECHO = r'''
+import sys
+if sys.argv[-1] != '%s':
+    sys.exit(1)
+print('problemtools-batch 1')
+sys.stdout.flush()
+for line in iter(sys.stdin.readline, ''):
+    fields = line.rstrip('\n').split('\0')
+    if fields == ['die']:
+        sys.exit(1)
+    if fields == ['hang']:
+        while True:
+            pass
+    print(len(fields))
+    sys.stdout.flush()
+''' % BATCH_ARG
+
+
+class BatchPool_test(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.pool = BatchPool(self.tmpdir, timeout=5)
+        self.argv = [sys.executable, '-c', BATCH_ECHO, BATCH_ARG]
+
+    def tearDown(self):
+        self.pool.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_jobs_share_process(self):
+        proc = self.pool.acquire('echo', self.argv)
+        assert proc.request(['a', 'b c', '']) == '3'
+        self.pool.release('echo', proc)
+        again = self.pool.acquire('echo', self.argv)
+        assert again is proc
+        assert again.request(['x']) == '1'
+        self.pool.release('echo', again)
+
+    def test_unsupported(self):
+        assert self.pool.acquire('true', ['/bin/true']) is None
+        assert self.pool.acquire('true', self.argv) is None
+
+    def test_process_dies(self):
+        proc = self.pool.acquire('echo', self.argv)
+        assert proc.request(['die']) is None
+        self.pool.discard(proc)
+        proc = self.pool.acquire('echo', self.argv)
+        assert proc.request(['x', 'y']) == '2'
+        self.pool.release('echo', proc)
+
+    def test_timeout(self):
+        self.pool.timeout = 0.5
+        proc = self.pool.acquire('echo', self.argv)
+        assert proc.request(['hang']) is None
+        self.pool.discard(proc)
+
+    def test_cpu_limit(self):
+        self.pool.timeout = 30
+        self.pool.cpu_limit = 0.5
+        proc = self.pool.acquire('echo', self.argv)
+        # The CPU time used starting up does not count against a job
+        assert proc.request(['x']) == '1'
+        start = time.time()
+        assert proc.request(['hang']) is None
+        assert time.time() - start < 10
+        self.pool.discard(proc)
+
+    def test_can_send(self):
+        assert BatchProcess.can_send(['a b', ''])
+        assert not BatchProcess.can_send(['a\nb'])
+        assert not BatchProcess.can_send(['a\0b'])
+
+    def test_greeting_timeout(self):
+        self.pool.timeout = 60
+        self.pool.greeting_timeout = 0.5
+        start = time.time()
+        # Waits for input forever instead of greeting
+        assert self.pool.acquire('cat', ['/bin/cat', BATCH_ARG]) is None
+        assert time.time() - start < 5
+
+    def test_single_probe(self):
+        self.pool.greeting_timeout = 1
+        starts = os.path.join(self.tmpdir, 'starts')
+        argv = ['/bin/sh', '-c', 'echo >> %s; exec cat' % starts, BATCH_ARG]
+        results = []
+        def acquire():
+            results.append(self.pool.acquire('cat', argv))
+        threads = [threading.Thread(target=acquire) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results == [None] * 4
+        assert open(starts).read() == '\n'
+
+    def test_supported_after_probe(self):
+        procs = [self.pool.acquire('echo', self.argv) for _ in range(2)]
+        assert procs[0] is not None and procs[1] is not None
+        assert procs[0] is not procs[1]
+        for proc in procs:
+            self.pool.release('echo', proc)
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase
+import os
+import shutil
+import tempfile
+
+from problemtools.run import BuildRun, Program
+from problemtools.run.compilecache import CompileCache
+
+
+class CompileCache_test(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache = CompileCache(os.path.join(self.tmpdir, 'cache'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def workdir(self, name, files):
+        path = os.path.join(self.tmpdir, name)
+        os.makedirs(path)
+        for (filename, content) in files.items():
+            with open(os.path.join(path, filename), 'w') as f_out:
+                f_out.write(content)
+        return path
+
+    def test_key(self):
+        src1 = self.workdir('a', {'main.c': 'int main() {}'})
+        src2 = self.workdir('b', {'main.c': 'int main() {}'})
+        src3 = self.workdir('c', {'main.c': 'int main() { return 1; }'})
+        assert self.cache.key(src1, ['gcc']) == self.cache.key(src2, ['gcc'])
+        assert self.cache.key(src1, ['gcc']) != self.cache.key(src1, ['clang'])
+        assert self.cache.key(src1, ['gcc']) != self.cache.key(src3, ['gcc'])
+
+    def test_store_restore(self):
+        src = self.workdir('a', {'main.c': 'int main() {}'})
+        key = self.cache.key(src, ['gcc'])
+        assert not self.cache.restore(key, src)
+        with open(os.path.join(src, 'run'), 'w') as f_out:
+            f_out.write('binary')
+        self.cache.store(key, src)
+
+        other = self.workdir('b', {'main.c': 'int main() {}'})
+        assert self.cache.key(other, ['gcc']) == key
+        assert self.cache.restore(key, other)
+        assert open(os.path.join(other, 'run')).read() == 'binary'
+
+    def test_evict(self):
+        self.cache.max_size = 150
+        keys = []
+        for name in ['a', 'b', 'c']:
+            src = self.workdir(name, {'main.c': name * 100})
+            keys.append(self.cache.key(src, []))
+            self.cache.store(keys[-1], src)
+        # Only the most recently stored entry fits
+        assert not self.cache.restore(keys[0], os.path.join(self.tmpdir, 'a'))
+        assert not self.cache.restore(keys[1], os.path.join(self.tmpdir, 'b'))
+        assert self.cache.restore(keys[2], os.path.join(self.tmpdir, 'c'))
+
+
+class BuildRunCache_test(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.src = os.path.join(self.tmpdir, 'prog')
+        os.makedirs(self.src)
+        build = os.path.join(self.src, 'build')
+        with open(build, 'w') as f_out:
+            f_out.write('#!/bin/sh\necho "#!/bin/sh" > run\nchmod +x run\n')
+        os.chmod(build, 0o755)
+
+    def tearDown(self):
+        Program.compile_cache = None
+        shutil.rmtree(self.tmpdir)
+
+    def entries(self, cache):
+        return [name for name in os.listdir(cache.cache_dir)
+                if name.startswith('entry-') and not name.endswith('.size')]
+
+    def build(self, cache):
+        Program.compile_cache = cache
+        prog = BuildRun(self.src, work_dir=os.path.join(self.tmpdir, 'work'))
+        assert prog.compile()
+
+    def test_builds_not_cached_by_default(self):
+        cache = CompileCache(os.path.join(self.tmpdir, 'cache'))
+        self.build(cache)
+        assert self.entries(cache) == []
+
+    def test_cache_builds(self):
+        cache = CompileCache(os.path.join(self.tmpdir, 'cache'), cache_builds=True)
+        self.build(cache)
+        assert len(self.entries(cache)) == 1
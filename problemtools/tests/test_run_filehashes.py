@@ -0,0 +1,65 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from problemtools.run import FileHashes, filehashes
+
+
+class FileHashes_test(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.hashes = FileHashes()
+        self.hashed = []
+        self.saved_md5 = filehashes._md5
+        def md5(path):
+            self.hashed.append(path)
+            return self.saved_md5(path)
+        filehashes._md5 = md5
+
+    def tearDown(self):
+        filehashes._md5 = self.saved_md5
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, name, data):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'w') as f_out:
+            f_out.write(data)
+        return path
+
+    def test_digest(self):
+        path = self.write('a.in', 'hello\n')
+        assert self.hashes.digest(path) == 'b1946ac92492d2347c6235b4d2611184'
+        assert self.hashes.digest(self.write('empty.in', '')) == \
+            'd41d8cd98f00b204e9800998ecf8427e'
+
+    def test_same_size_duplicates(self):
+        one = self.write('1.in', 'abc\n')
+        two = self.write('2.in', 'xyz\n')
+        three = self.write('3.in', 'abc\n')
+        assert self.hashes.duplicates([one, two, three]) == [[one, three]]
+
+    def test_different_sizes_not_hashed(self):
+        one = self.write('1.in', 'a\n')
+        two = self.write('2.in', 'bb\n')
+        three = self.write('3.in', 'ccc\n')
+        four = self.write('4.in', 'ddd\n')
+        assert self.hashes.duplicates([one, two, three, four]) == []
+        assert sorted(self.hashed) == [three, four]
+
+    def test_stamp_invalidates(self):
+        path = self.write('a.in', 'abc\n')
+        first = self.hashes.digest(path)
+        assert self.hashes.digest(path) == first
+        assert self.hashed == [path]
+        # Same size, new modification time
+        self.write('a.in', 'xyz\n')
+        os.utime(path, (0, 0))
+        assert self.hashes.digest(path) != first
+        assert self.hashed == [path, path]
+        # Same size and modification time, taken to be unchanged
+        self.write('a.in', 'abc\n')
+        os.utime(path, (0, 0))
+        assert self.hashes.digest(path) != first
+        assert self.hashed == [path, path]
@@ -0,0 +1,168 @@
+import os
+import shutil
+import signal
+import sys
+import tempfile
+import threading
+import time
+from unittest import TestCase
+
+import pytest
+
+from problemtools.run import CancelToken, Executable, Launcher, Program, get_tool_path
+
+
+class Run_test(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.outfile = os.path.join(self.tmpdir, 'out')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def run_with_launcher(self, test):
+        Program.launcher = Launcher()
+        try:
+            test()
+        finally:
+            Program.launcher.stop()
+            Program.launcher = None
+
+    def check_memory(self):
+        # Make ourselves large, none of which should be attributed to
+        # the program
+        ballast = 'x' * (256 << 20)
+        python = Executable(sys.executable)
+        result = python.run(outfile=self.outfile,
+                            args=['-c', 's = "x" * (64 << 20)'])
+        assert len(ballast) > 0
+        assert result.status == 0
+        assert 64 <= result.memory < 96
+
+    @pytest.mark.skipif(get_tool_path('peakmem') is None,
+                        reason='peakmem not built')
+    def test_memory(self):
+        self.check_memory()
+
+    @pytest.mark.skipif(get_tool_path('peakmem') is None,
+                        reason='peakmem not built')
+    def test_memory_launcher(self):
+        self.run_with_launcher(self.check_memory)
+
+    def check_wall_timeout(self):
+        start = time.time()
+        result = Executable('/bin/sleep').run(args=['30'], timelim=5, walltimelim=0.5)
+        assert time.time() - start < 5
+        assert result.wall_timeout
+        # A run within the limit
+        result = Executable('/bin/sleep').run(args=['0'], timelim=5, walltimelim=5)
+        assert result.status == 0 and not result.wall_timeout
+
+    def test_wall_timeout(self):
+        self.check_wall_timeout()
+
+    def test_wall_timeout_launcher(self):
+        self.run_with_launcher(self.check_wall_timeout)
+
+    def check_wall_timeout_runtime(self):
+        # The CPU time of a program killed for exceeding the wall time
+        # limit is still accounted for
+        result = Executable('/bin/sh').run(args=['-c', 'while :; do :; done'],
+                                           timelim=30, walltimelim=1)
+        assert result.wall_timeout
+        assert result.runtime > 0.5
+        assert result.memory > 0
+
+    @pytest.mark.skipif(get_tool_path('peakmem') is None,
+                        reason='peakmem not built')
+    def test_wall_timeout_runtime(self):
+        self.check_wall_timeout_runtime()
+
+    @pytest.mark.skipif(get_tool_path('peakmem') is None,
+                        reason='peakmem not built')
+    def test_wall_timeout_runtime_launcher(self):
+        self.run_with_launcher(self.check_wall_timeout_runtime)
+
+    def check_output_limit(self):
+        yes = Executable('/usr/bin/yes')
+        result = yes.run(outfile=self.outfile, outputlim=1)
+        assert result.output_limit_exceeded
+        assert not result.wall_timeout
+        assert os.path.getsize(self.outfile) == (1 << 20) + 1
+        # Output right at the limit is fine
+        head = Executable('/usr/bin/head')
+        result = head.run(infile='/dev/zero', outfile=self.outfile, outputlim=1,
+                          args=['-c', str(1 << 20)])
+        assert result.status == 0 and not result.output_limit_exceeded
+
+    def test_output_limit(self):
+        self.check_output_limit()
+
+    def test_output_limit_launcher(self):
+        self.run_with_launcher(self.check_output_limit)
+
+    def check_cancel(self):
+        cancel = CancelToken()
+        timer = threading.Timer(0.5, cancel.cancel)
+        timer.start()
+        start = time.time()
+        (status, _) = Executable('/bin/sleep').run(args=['30'], cancel=cancel)
+        timer.join()
+        assert time.time() - start < 5
+        assert os.WIFSIGNALED(status) and os.WTERMSIG(status) == signal.SIGKILL
+        # Runs with a cancelled token are killed right away
+        start = time.time()
+        (status, _) = Executable('/bin/sleep').run(args=['30'], cancel=cancel)
+        assert time.time() - start < 5
+        assert os.WIFSIGNALED(status)
+
+    def test_cancel(self):
+        self.check_cancel()
+
+    def test_cancel_launcher(self):
+        self.run_with_launcher(self.check_cancel)
+
+
+class RunCaptured_test(TestCase):
+
+    def test_output(self):
+        (status, output, timed_out) = Program._run_captured(
+            ['/bin/sh', '-c', 'echo out; echo err >&2; exit 3'])
+        assert os.WIFEXITED(status) and os.WEXITSTATUS(status) == 3
+        assert output == 'out\nerr\n'
+        assert not timed_out
+
+    def test_cwd(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            (status, output, _) = Program._run_captured(['/bin/pwd'], cwd=tmpdir)
+            assert status == 0
+            assert output.strip() == os.path.realpath(tmpdir)
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_truncation(self):
+        size = Program._CAPTURE_LIMIT + 12345
+        (status, output, timed_out) = Program._run_captured(
+            ['/bin/sh', '-c', 'head -c %d /dev/zero' % size])
+        assert status == 0 and not timed_out
+        assert output.startswith('\0' * Program._CAPTURE_LIMIT)
+        assert output[Program._CAPTURE_LIMIT:] == \
+            '\n[output truncated to %d bytes]\n' % Program._CAPTURE_LIMIT
+
+    def test_timeout(self):
+        start = time.time()
+        (status, _, timed_out) = Program._run_captured(['/bin/sleep', '30'], timelim=1)
+        assert timed_out
+        assert os.WIFSIGNALED(status) and os.WTERMSIG(status) == signal.SIGKILL
+        assert time.time() - start < 5
+
+    def test_timeout_after_closing_output(self):
+        start = time.time()
+        (status, output, timed_out) = Program._run_captured(
+            ['/bin/sh', '-c', 'echo bye; exec sleep 30 >&- 2>&-'], timelim=1)
+        assert timed_out
+        assert output == 'bye\n'
+        assert os.WIFSIGNALED(status) and os.WTERMSIG(status) == signal.SIGKILL
+        assert time.time() - start < 5
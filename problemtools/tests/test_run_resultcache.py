@@ -0,0 +1,49 @@
+import os
+import shutil
+import stat
+import tempfile
+from unittest import TestCase
+
+from problemtools.run import Executable, ResultCache
+
+
+class ResultCache_test(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache = ResultCache(os.path.join(self.tmpdir, 'cache'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_put_get(self):
+        key = ResultCache.key('validator', 'input')
+        assert self.cache.get(key) is None
+        self.cache.put(key, 42 << 8)
+        assert self.cache.get(key) == 42 << 8
+        assert ResultCache(self.cache.cache_dir).get(key) == 42 << 8
+
+    def test_key(self):
+        assert ResultCache.key('ab', 'c') != ResultCache.key('a', 'bc')
+        assert ResultCache.key('a', 'b') == ResultCache.key('a', 'b')
+
+    def test_corrupt_entry(self):
+        key = ResultCache.key('x')
+        self.cache.put(key, 0)
+        with open(os.path.join(self.cache.cache_dir, key[:2], key), 'w') as entry:
+            entry.write('')
+        assert self.cache.get(key) is None
+
+    def test_executable_fingerprint(self):
+        path = os.path.join(self.tmpdir, 'validator')
+        script = os.path.join(self.tmpdir, 'format.ctd')
+        for (name, contents) in [(path, '#!/bin/sh\n'), (script, 'INT(1,10)')]:
+            with open(name, 'w') as f_out:
+                f_out.write(contents)
+        os.chmod(path, stat.S_IRWXU)
+        fingerprint = Executable(path, args=[script]).fingerprint()
+        assert fingerprint == Executable(path, args=[script]).fingerprint()
+        assert fingerprint != Executable(path, args=[script, '-g']).fingerprint()
+        with open(script, 'w') as f_out:
+            f_out.write('INT(1,20)')
+        assert fingerprint != Executable(path, args=[script]).fingerprint()
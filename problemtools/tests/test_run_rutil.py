@@ -0,0 +1,41 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from problemtools.run import rutil
+
+
+class MaterializeFiles_test(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.src = os.path.join(self.tmpdir, 'src')
+        os.makedirs(os.path.join(self.src, 'sub'))
+        for name in ['main.cc', os.path.join('sub', 'util.h')]:
+            with open(os.path.join(self.src, name), 'w') as f_out:
+                f_out.write(name)
+        self.dst = os.path.join(self.tmpdir, 'dst')
+        os.mkdir(self.dst)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_list_files(self):
+        files = rutil.list_files(self.src)
+        assert sorted(files.keys()) == ['main.cc', os.path.join('sub', 'util.h')]
+        main = os.path.join(self.src, 'main.cc')
+        assert rutil.list_files(main) == {'main.cc': main}
+
+    def test_copy(self):
+        rutil.materialize_files(rutil.list_files(self.src), self.dst)
+        main = os.path.join(self.dst, 'main.cc')
+        assert open(main).read() == 'main.cc'
+        assert os.stat(main).st_ino != os.stat(os.path.join(self.src, 'main.cc')).st_ino
+        assert open(os.path.join(self.dst, 'sub', 'util.h')).read() == os.path.join('sub', 'util.h')
+
+    def test_write_leaves_original(self):
+        rutil.materialize_files(rutil.list_files(self.src), self.dst)
+        with open(os.path.join(self.dst, 'main.cc'), 'w') as f_out:
+            f_out.write('changed')
+        assert open(os.path.join(self.src, 'main.cc')).read() == 'main.cc'
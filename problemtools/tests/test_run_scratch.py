@@ -0,0 +1,49 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from problemtools.run.scratch import ScratchStorage
+
+
+class ScratchStorage_test(TestCase):
+
+    def setUp(self):
+        self.disk = tempfile.mkdtemp()
+        self.shm = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.disk)
+        shutil.rmtree(self.shm)
+
+    def test_output_dirs_within_budget_in_memory(self):
+        scratch = ScratchStorage(self.disk, budget=10, slot_size=5, shm_dir=self.shm)
+        with scratch.output_dir() as first, scratch.output_dir() as second, \
+                scratch.output_dir() as third:
+            assert first.startswith(self.shm)
+            assert second.startswith(self.shm)
+            assert third.startswith(self.disk)
+        scratch.close()
+
+    def test_no_budget_uses_disk(self):
+        scratch = ScratchStorage(self.disk, shm_dir=self.shm)
+        with scratch.output_dir() as path:
+            assert path.startswith(self.disk)
+        assert os.listdir(self.shm) == []
+        scratch.close()
+
+    def test_dirs_are_recycled_empty(self):
+        scratch = ScratchStorage(self.disk, budget=10, slot_size=5, shm_dir=self.shm)
+        with scratch.feedback_dir() as path:
+            open(os.path.join(path, 'judgemessage.txt'), 'w').close()
+            os.mkdir(os.path.join(path, 'sub'))
+        with scratch.feedback_dir() as again:
+            assert again == path
+            assert os.listdir(again) == []
+        with scratch.output_dir() as path:
+            open(os.path.join(path, 'output'), 'w').close()
+        with scratch.output_dir() as again:
+            assert again == path
+            assert os.listdir(again) == []
+        scratch.close()
+        assert os.listdir(self.shm) == []
@@ -0,0 +1,43 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from problemtools.run import StateDB
+
+
+RESULT = {'verdict': 'AC', 'score': 1.0, 'reason': None, 'runtime': 0.25,
+          'memory': 3.5, 'wall': 0.3, 'utime': 0.2, 'stime': 0.05,
+          'voluntary_ctxsw': 2, 'involuntary_ctxsw': 1}
+
+
+class StateDB_test(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'state', 'state.sqlite')
+        self.state = StateDB(self.path)
+
+    def tearDown(self):
+        self.state.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_put_get(self):
+        assert self.state.get('prog', 'data/secret/1', 'data', 'setup') is None
+        self.state.put('prog', 'data/secret/1', 'data', 'setup', 5, RESULT)
+        self.state.close()
+        self.state = StateDB(self.path)
+        assert self.state.get('prog', 'data/secret/1', 'data', 'setup') == (5, RESULT)
+
+    def test_changed_inputs(self):
+        self.state.put('prog', 'data/secret/1', 'data', 'setup', 5, RESULT)
+        assert self.state.get('prog', 'data/secret/1', 'data2', 'setup') is None
+        assert self.state.get('prog', 'data/secret/1', 'data', 'setup2') is None
+        assert self.state.get('prog2', 'data/secret/1', 'data', 'setup') is None
+
+    def test_replace(self):
+        self.state.put('prog', 'data/secret/1', 'data', 'setup', 5, RESULT)
+        result = dict(RESULT, verdict='WA', reason='wrong')
+        self.state.put('prog', 'data/secret/1', 'data2', 'setup', 5, result)
+        assert self.state.get('prog', 'data/secret/1', 'data', 'setup') is None
+        assert self.state.get('prog', 'data/secret/1', 'data2', 'setup') == (5, result)
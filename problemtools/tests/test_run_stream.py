@@ -0,0 +1,80 @@
+import os
+import shutil
+import signal
+import tempfile
+import threading
+import time
+from unittest import TestCase
+
+import pytest
+
+from problemtools.run import CorePool, Executable, Program, affinity, run_piped
+
+
+class RunPiped_test(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.result = os.path.join(self.tmpdir, 'result')
+        self.fifo_dir = os.path.join(self.tmpdir, 'fifos')
+        os.mkdir(self.fifo_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def cat(self, infile):
+        return Executable('/bin/cat').run(infile=infile, outfile=self.result)
+
+    def test_output_is_streamed(self):
+        echo = Executable('/bin/echo')
+        (produced, consumed, size, exceeded) = run_piped(
+            lambda outfile: echo.run(outfile=outfile, args=['hello']),
+            self.cat, self.fifo_dir)
+        assert produced[0] == 0 and consumed[0] == 0
+        assert size == 6 and not exceeded
+        assert open(self.result).read() == 'hello\n'
+
+    def test_output_limit_cuts_stream(self):
+        yes = Executable('/usr/bin/yes')
+        (produced, consumed, size, exceeded) = run_piped(
+            lambda outfile: yes.run(outfile=outfile), self.cat,
+            self.fifo_dir, limit=1000)
+        assert exceeded
+        assert os.WIFSIGNALED(produced[0]) and os.WTERMSIG(produced[0]) == signal.SIGPIPE
+        assert consumed[0] == 0
+        assert os.path.getsize(self.result) <= 1000
+
+    def test_consumer_not_reading(self):
+        head = Executable('/usr/bin/head')
+        true = Executable('/bin/true')
+        (produced, consumed, size, exceeded) = run_piped(
+            lambda outfile: head.run(outfile=outfile, args=['-c', '1000000', '/dev/zero']),
+            lambda infile: true.run(infile=infile),
+            self.fifo_dir)
+        assert produced[0] == 0 and consumed[0] == 0
+        assert size == 1000000 and not exceeded
+
+    @pytest.mark.skipif(not CorePool.available(), reason='CPU pinning not available')
+    def test_pinned_single_core(self):
+        # The consumer must not need a core of its own, or it would
+        # wait for the producer's core while the producer waits for
+        # it to read
+        echo = Executable('/bin/echo')
+        def produce(outfile):
+            # Give the consumer time to start first
+            time.sleep(0.5)
+            return echo.run(outfile=outfile, args=['hello'])
+        results = []
+        Program.core_pool = CorePool([min(affinity.allowed_cpus())])
+        try:
+            thread = threading.Thread(target=lambda: results.append(
+                run_piped(produce, self.cat, self.fifo_dir)))
+            thread.daemon = True
+            thread.start()
+            thread.join(30)
+        finally:
+            Program.core_pool = None
+        assert not thread.is_alive()
+        (produced, consumed, size, exceeded) = results[0]
+        assert produced[0] == 0 and consumed[0] == 0
+        assert open(self.result).read() == 'hello\n'
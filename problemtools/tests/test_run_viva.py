@@ -0,0 +1,37 @@
+from unittest import TestCase
+
+from problemtools.run import Viva
+
+
+def viva_output(results):
+    lines = []
+    for (infile, messages) in results:
+        lines.append('<<< Testing file: %s >>>' % infile)
+        lines += messages
+        lines.append('<<< DONE Testing file: %s >>>' % infile)
+    return '\n'.join(lines) + '\n'
+
+
+class VivaBatch_test(TestCase):
+
+    def test_rejected_files_found(self):
+        output = viva_output([('a.in', []),
+                              ('b.in', ['Error on line 1: expected integer']),
+                              ('c.in', [])])
+        results = Viva._parse_batch_output(['a.in', 'b.in', 'c.in'], 1 << 8, output)
+        assert results == {'a.in': 42 << 8, 'b.in': 1 << 8, 'c.in': 42 << 8}
+
+    def test_all_accepted(self):
+        output = viva_output([('a.in', []), ('b.in', [])])
+        results = Viva._parse_batch_output(['a.in', 'b.in'], 0, output)
+        assert results == {'a.in': 42 << 8, 'b.in': 42 << 8}
+
+    def test_ambiguous(self):
+        # Two files with messages but only one rejected
+        output = viva_output([('a.in', ['Warning']), ('b.in', ['Error'])])
+        assert Viva._parse_batch_output(['a.in', 'b.in'], 1 << 8, output) == {}
+
+    def test_incomplete(self):
+        output = viva_output([('a.in', [])]) + '<<< Testing file: b.in >>>\n'
+        assert Viva._parse_batch_output(['a.in', 'b.in'], 1 << 8, output) == {}
+        assert Viva._parse_batch_output(['a.in'], 9, viva_output([('a.in', [])])) == {}
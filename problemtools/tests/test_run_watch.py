@@ -0,0 +1,40 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import pytest
+
+from problemtools.run import DirectoryWatcher
+
+
+@pytest.mark.skipif(not DirectoryWatcher.available(), reason='inotify not available')
+class DirectoryWatcher_test(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.tmpdir, 'data'))
+        self.watcher = DirectoryWatcher(self.tmpdir)
+
+    def tearDown(self):
+        self.watcher.close()
+        shutil.rmtree(self.tmpdir)
+
+    def write(self, *path):
+        with open(os.path.join(self.tmpdir, *path), 'w') as f_out:
+            f_out.write('1\n')
+
+    def test_changed_files(self):
+        self.write('data', '1.in')
+        self.write('data', '.1.in.swp')
+        self.write('problem.yaml~')
+        assert self.watcher.wait(settle=0.1) == set([os.path.join(self.tmpdir, 'data', '1.in')])
+
+    def test_new_directory(self):
+        os.mkdir(os.path.join(self.tmpdir, 'data', 'secret'))
+        self.write('data', 'secret', '1.in')
+        changed = self.watcher.wait(settle=0.1)
+        assert os.path.join(self.tmpdir, 'data', 'secret') in changed
+        assert os.path.join(self.tmpdir, 'data', 'secret', '1.in') in changed
+        self.write('data', 'secret', '1.ans')
+        assert self.watcher.wait(settle=0.1) == set([os.path.join(self.tmpdir, 'data', 'secret', '1.ans')])
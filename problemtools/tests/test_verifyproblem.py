@@ -0,0 +1,210 @@
+import logging
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from unittest import TestCase
+
+from problemtools.verifyproblem import Problem, default_args
+
+
+class Import_test(TestCase):
+
+    def test_statement_tools_loaded_lazily(self):
+        code = ('import sys, problemtools.verifyproblem\n'
+                'print(sorted(m for m in sys.modules\n'
+                '             if m.startswith("plasTeX") or "problem2" in m))\n')
+        loaded = subprocess.check_output([sys.executable, '-c', code])
+        assert loaded.strip() == '[]'
+
+
+def write_file(path, contents, executable=False):
+    if not os.path.isdir(os.path.dirname(path)):
+        os.makedirs(os.path.dirname(path))
+    with open(path, 'w') as f_out:
+        f_out.write(contents)
+    if executable:
+        os.chmod(path, 0o755)
+
+
+class FindPrograms_test(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.probdir = os.path.join(self.tmpdir, 'prob')
+        write_file(os.path.join(self.probdir, 'problem.yaml'), 'name: Test\n')
+        # Not a directory of the problem, so that only the test looks
+        # for programs in it
+        self.srcdir = os.path.join(self.tmpdir, 'programs')
+        self.build = os.path.join(self.srcdir, 'sol', 'build')
+        write_file(self.build, '#!/bin/sh\ntrue\n', executable=True)
+        self.work_dir = os.path.join(self.tmpdir, 'work')
+        os.mkdir(self.work_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def find(self, problem):
+        return problem.find_programs(self.srcdir, work_dir=self.work_dir)
+
+    def test_unchanged_program_reused(self):
+        with Problem(self.probdir) as problem:
+            [first] = self.find(problem)
+            [second] = self.find(problem)
+            assert second is first
+            # The instance created by the second call is cleaned up
+            assert os.listdir(self.work_dir) == [os.path.basename(first.path)]
+
+    def test_changed_program_replaced(self):
+        with Problem(self.probdir) as problem:
+            [first] = self.find(problem)
+            write_file(self.build, '#!/bin/sh\nfalse\n', executable=True)
+            [second] = self.find(problem)
+            assert second is not first
+            assert not os.path.exists(first.path)
+            assert os.listdir(self.work_dir) == [os.path.basename(second.path)]
+
+
+# Echoes its input, after sleeping for as many seconds as the input
+# says (if the input starts with "sleep")
+SLEEPER = '''#!/bin/sh
+read line
+case "$line" in
+    sleep*) sleep ${line#sleep } ;;
+esac
+echo "$line"
+'''
+
+
+def build_script(run):
+    """A build script making run the run script of a program."""
+    return "#!/bin/sh\ncat > run <<'END'\n%sEND\nchmod +x run\n" % run
+
+
+class ConcurrentCheck_test(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.probdir = os.path.join(self.tmpdir, 'prob')
+        write_file(os.path.join(self.probdir, 'problem.yaml'),
+                   'name: Test\nlimits:\n    compilation_time: 2\n')
+        self.add_testcase('sample', '1', 'sleep 0')
+        self.add_submission('accepted', 'cat', build_script('#!/bin/sh\ncat\n'))
+        self.errors = []
+        self.handler = logging.Handler(logging.ERROR)
+        self.handler.emit = lambda record: self.errors.append(record.getMessage())
+        logging.getLogger().addHandler(self.handler)
+
+    def tearDown(self):
+        logging.getLogger().removeHandler(self.handler)
+        shutil.rmtree(self.tmpdir)
+
+    def add_testcase(self, group, name, data):
+        for ext in ['.in', '.ans']:
+            write_file(os.path.join(self.probdir, 'data', group, name + ext), data + '\n')
+
+    def add_submission(self, verdict, name, build):
+        write_file(os.path.join(self.probdir, 'submissions', verdict, name, 'build'),
+                   build, executable=True)
+
+    def check(self, threads, submission_filter='.*', fixed_timelim=None):
+        args = default_args()
+        args.parts = ['submissions']
+        args.threads = threads
+        args.submission_filter = re.compile(submission_filter)
+        args.fixed_timelim = fixed_timelim
+        start = time.time()
+        with Problem(self.probdir) as problem:
+            (errors, _) = problem.check(args)
+        return (errors, time.time() - start)
+
+    def test_testcases_run_in_parallel(self):
+        for name in '1234':
+            self.add_testcase('secret', name, 'sleep 1')
+        self.add_submission('accepted', 'sleeper', build_script(SLEEPER))
+        (errors, elapsed) = self.check(4)
+        assert errors == 0, self.errors
+        # Each of the four secret test cases takes a second
+        assert elapsed < 3
+
+    def test_reject_cancels_later_testcases(self):
+        self.add_testcase('secret', '1', 'wrong')
+        for name in '234':
+            self.add_testcase('secret', name, 'sleep 30')
+        self.add_submission('wrong_answer', 'wrong',
+                            build_script(SLEEPER.replace('echo "$line"', 'echo "${line#wrong}"')))
+        (errors, elapsed) = self.check(4, fixed_timelim=30)
+        assert errors == 0, self.errors
+        assert elapsed < 10
+
+    def test_submissions_checked_concurrently(self):
+        self.add_testcase('secret', '1', 'sleep 0')
+        for name in ['crash1', 'crash2', 'crash3']:
+            self.add_submission('run_time_error', name,
+                                build_script('#!/bin/sh\nsleep 1\nexit 1\n'))
+        (errors, elapsed) = self.check(3, fixed_timelim=5)
+        assert errors == 0, self.errors
+        # Each submission takes a second on the sample
+        assert elapsed < 2.5
+
+    def test_compile_errors_reported(self):
+        self.add_submission('accepted', 'broken', '#!/bin/sh\nexit 1\n')
+        self.add_submission('accepted', 'slow', '#!/bin/sh\nsleep 30\n')
+        (errors, elapsed) = self.check(2)
+        assert errors >= 2
+        assert any('Compile error' in msg and 'broken' in msg for msg in self.errors)
+        assert any('compilation time limit' in msg and 'slow' in msg for msg in self.errors)
+        assert elapsed < 10
+
+
+class OutputValidationMemo_test(TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.probdir = os.path.join(self.tmpdir, 'prob')
+        write_file(os.path.join(self.probdir, 'problem.yaml'),
+                   'name: Test\nvalidation: custom\n')
+        for ext in ['.in', '.ans']:
+            write_file(os.path.join(self.probdir, 'data', 'secret', '1' + ext), 'x\n')
+        # Counts its runs, and accepts output equal to the answer
+        self.runs = os.path.join(self.tmpdir, 'runs')
+        validator = ('#!/bin/sh\necho >> %s\necho "run $(wc -c < %s)" > "$3/judgemessage.txt"\n'
+                     'cmp -s - "$2" && exit 42\nexit 43\n' % (self.runs, self.runs))
+        write_file(os.path.join(self.probdir, 'output_validators', 'count', 'build'),
+                   build_script(validator), executable=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def count_runs(self):
+        if not os.path.exists(self.runs):
+            return 0
+        return len(open(self.runs).read())
+
+    def test_identical_output_not_revalidated(self):
+        with Problem(self.probdir) as problem:
+            validators = problem.output_validators
+            [val] = validators._actual_validators()
+            assert val.compile()
+            [testcase] = problem.testdata.get_all_testcases()
+            outputs = {}
+            for (name, data) in [('a', 'x\n'), ('b', 'x\n'), ('c', 'y\n')]:
+                outputs[name] = os.path.join(self.tmpdir, name)
+                write_file(outputs[name], data)
+
+            assert validators.validate_with(val, testcase, outputs['a']).verdict == 'AC'
+            assert self.count_runs() == 1
+            # Same output in another file
+            assert validators.validate_with(val, testcase, outputs['b']).verdict == 'AC'
+            assert self.count_runs() == 1
+            # Different output
+            assert validators.validate_with(val, testcase, outputs['c']).verdict == 'WA'
+            assert self.count_runs() == 2
+            res = validators.validate_with(val, testcase, outputs['c'])
+            assert res.verdict == 'WA'
+            assert self.count_runs() == 2
+            # The feedback of the run that was remembered
+            assert res.feedback == {'judgemessage.txt': 'run 2\n'}
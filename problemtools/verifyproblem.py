@@ -2,7 +2,6 @@
 # -*- coding: utf-8 -*-
 import glob
 import string
-import hashlib
 import collections
 import os
 import signal
@@ -14,9 +13,11 @@ import tempfile
 import sys
 import copy
 import random
+import math
+import threading
+import time
+from multiprocessing.pool import ThreadPool
 from argparse import ArgumentParser, ArgumentTypeError
-import problem2pdf
-import problem2html
 
 import languages
 import run
@@ -42,6 +43,19 @@ class SubmissionResult:
         self.runtime_testcase = None
         self.ac_runtime = -1.0
         self.ac_runtime_testcase = None
+        self.memory = -1.0
+        self.memory_testcase = None
+        self.ac_memory = -1.0
+        self.ac_memory_testcase = None
+        self.wall = -1.0
+        self.wall_testcase = None
+        # Contents of the feedback directory of the output validator,
+        # as a dict from file names (relative to it) to contents
+        self.feedback = None
+        self.utime = 0.0
+        self.stime = 0.0
+        self.voluntary_ctxsw = 0
+        self.involuntary_ctxsw = 0
 
 
     @staticmethod
@@ -55,6 +69,19 @@ class SubmissionResult:
             if r.ac_runtime > res.ac_runtime:
                 res.ac_runtime = r.ac_runtime
                 res.ac_runtime_testcase = r.ac_runtime_testcase
+            if r.memory > res.memory:
+                res.memory = r.memory
+                res.memory_testcase = r.memory_testcase
+            if r.ac_memory > res.ac_memory:
+                res.ac_memory = r.ac_memory
+                res.ac_memory_testcase = r.ac_memory_testcase
+            if r.wall > res.wall:
+                res.wall = r.wall
+                res.wall_testcase = r.wall_testcase
+            res.utime += r.utime
+            res.stime += r.stime
+            res.voluntary_ctxsw += r.voluntary_ctxsw
+            res.involuntary_ctxsw += r.involuntary_ctxsw
 
         verdict_value = {'JE': -1, 'CE': 0, 'TLE': 1, 'RTE': 2, 'WA': 3, 'AC': 4}
 
@@ -80,6 +107,11 @@ class SubmissionResult:
 
 
 
+    def timing_details(self):
+        """Breakdown of where the time of the run(s) went."""
+        return 'user %.3fs, sys %.3fs, %d voluntary and %d involuntary context switches' % (
+            self.utime, self.stime, self.voluntary_ctxsw, self.involuntary_ctxsw)
+
     def __str__(self):
         verdict = self.verdict
         details = []
@@ -93,6 +125,10 @@ class SubmissionResult:
             details.append('test case: %s' % self.testcase)
         if self.runtime != -1:
             details.append('CPU: %.2fs @ %s' % (self.runtime, self.runtime_testcase))
+        if self.memory != -1:
+            details.append('memory: %.1f MB @ %s' % (self.memory, self.memory_testcase))
+        if self.wall != -1:
+            details.append('wall: %.2fs @ %s' % (self.wall, self.wall_testcase))
 
         if len(details) == 0:
             return verdict
@@ -109,11 +145,14 @@ class ProblemAspect:
     warnings = 0
     bail_on_error = False
     _check_res = None
+    _counter_lock = threading.Lock()
+    _output = threading.local()
 
     def error(self, msg):
         self._check_res = False
-        ProblemAspect.errors += 1
-        logging.error('in %s: %s', self, msg)
+        with ProblemAspect._counter_lock:
+            ProblemAspect.errors += 1
+        ProblemAspect._log(logging.ERROR, 'in %s: %s', self, msg)
         if ProblemAspect.bail_on_error:
             raise VerifyError(msg)
 
@@ -121,20 +160,65 @@ class ProblemAspect:
         if ProblemAspect.consider_warnings_errors:
             self.error(msg)
             return
-        ProblemAspect.warnings += 1
-        logging.warning('in %s: %s', self, msg)
+        with ProblemAspect._counter_lock:
+            ProblemAspect.warnings += 1
+        ProblemAspect._log(logging.WARNING, 'in %s: %s', self, msg)
 
     def msg(self, msg):
-        print msg
+        ProblemAspect._log(None, '%s', msg)
 
     def info(self, msg):
-        logging.info(': %s', msg)
+        ProblemAspect._log(logging.INFO, ': %s', msg)
 
     def debug(self, msg):
-        logging.debug(': %s', msg)
+        ProblemAspect._log(logging.DEBUG, ': %s', msg)
+
+    @staticmethod
+    def _log(level, fmt, *args):
+        buf = getattr(ProblemAspect._output, 'buffer', None)
+        if buf is not None:
+            if level is None or logging.getLogger().isEnabledFor(level):
+                buf.append((level, fmt % args))
+        elif level is None:
+            print fmt % args
+        else:
+            logging.log(level, fmt, *args)
+
+    @staticmethod
+    def call_buffered(func, *args):
+        """Call func(*args), buffering all messages emitted by the calling
+        thread instead of outputting them directly.  Useful when
+        running things concurrently, to keep the output of each task
+        together.
+
+        Returns:
+            tuple (messages, result, exc_info) where messages should be
+            passed to flush_messages(), result is the return value of
+            func, and exc_info is the sys.exc_info() of the exception
+            raised by func (or None if no exception was raised).
+        """
+        ProblemAspect._output.buffer = []
+        result = exc_info = None
+        try:
+            result = func(*args)
+        except Exception:
+            exc_info = sys.exc_info()
+        messages = ProblemAspect._output.buffer
+        ProblemAspect._output.buffer = None
+        return (messages, result, exc_info)
+
+    @staticmethod
+    def flush_messages(messages):
+        """Output messages buffered by call_buffered()."""
+        for (level, text) in messages:
+            ProblemAspect._log(level, '%s', text)
 
 
 class TestCase(ProblemAspect):
+    # Fields of SubmissionResult stored in the state database
+    _STATE_FIELDS = ['verdict', 'score', 'reason', 'runtime', 'memory', 'wall',
+                     'utime', 'stime', 'voluntary_ctxsw', 'involuntary_ctxsw']
+
     def __init__(self, problem, base, testcasegroup):
         self._base = base
         self.infile = base + '.in'
@@ -182,27 +266,31 @@ class TestCase(ProblemAspect):
     def matches_filter(self, filter_re):
         return filter_re.search(self.strip_path_prefix(self._base)) is not None
 
-    def run_submission(self, sub, args, timelim_low=1000, timelim_high=1000):
-        outfile = os.path.join(self._problem.tmpdir, 'output')
-        if sys.stdout.isatty():
+    def run_submission(self, sub, args, timelim_low=1000, timelim_high=1000, cancel=None):
+        show_progress = sys.stdout.isatty() and self._problem.pool is None
+        if show_progress:
             msg = 'Running %s on %s...' % (sub, self)
             sys.stdout.write('%s' % msg)
             sys.stdout.flush()
 
-        if self._problem.is_interactive:
-            res2 = self._problem.output_validators.validate_interactive(self, sub, timelim_high, self._problem.submissions)
-        else:
-            status, runtime = sub.run(self.infile, outfile,
-                                      timelim=timelim_high+1,
-                                      memlim=self._problem.config.get('limits')['memory'])
-            if is_TLE(status) or runtime > timelim_high:
-                res2 = SubmissionResult('TLE', score=self._problem.config.get('grading')['reject_score'])
-            elif is_RTE(status):
-                res2 = SubmissionResult('RTE', score=self._problem.config.get('grading')['reject_score'])
+        cell = self._state_cell(sub)
+        res2 = None
+        if cell is not None:
+            res2 = self._stored_result(cell, timelim_high)
+        if res2 is None:
+            if self._problem.is_interactive:
+                res2 = self._problem.output_validators.validate_interactive(self, sub, timelim_high, self._problem.submissions)
             else:
-                res2 = self._problem.output_validators.validate(self, outfile)
-            res2.runtime = runtime
-        if sys.stdout.isatty():
+                with self._problem.scratch.output_dir() as scratch:
+                    res2 = self._run_and_validate(sub, args, scratch, timelim_high, cancel)
+            # Judge errors may be due to the circumstances of the run,
+            # and cancelled runs have no proper result
+            if (cell is not None and res2.verdict != 'JE' and
+                    (cancel is None or not cancel.is_cancelled())):
+                self._problem.state.put(*cell, timelim=timelim_high,
+                                        result=dict((field, getattr(res2, field))
+                                                    for field in TestCase._STATE_FIELDS))
+        if show_progress:
             sys.stdout.write('%s' % '\b' * (len(msg)))
         if res2.runtime <= timelim_low:
             res1 = res2
@@ -210,16 +298,111 @@ class TestCase(ProblemAspect):
             res1 = SubmissionResult('TLE', score=self._problem.config.get('grading')['reject_score'])
         res1.testcase = res2.testcase = self
         res1.runtime_testcase = res2.runtime_testcase = self
-        res1.runtime = res2.runtime
-        if res1.verdict == 'AC':
-            res1.ac_runtime = res1.runtime
-            res1.ac_runtime_testcase = res1.runtime_testcase
-        if res2.verdict == 'AC':
-            res2.ac_runtime = res2.runtime
-            res2.ac_runtime_testcase = res2.runtime_testcase
+        res1.memory_testcase = res2.memory_testcase = self
+        res1.wall_testcase = res2.wall_testcase = self
+        for attr in ['runtime', 'memory', 'wall', 'utime', 'stime',
+                     'voluntary_ctxsw', 'involuntary_ctxsw']:
+            setattr(res1, attr, getattr(res2, attr))
+        for res in [res1, res2]:
+            if res.verdict == 'AC':
+                res.ac_runtime = res.runtime
+                res.ac_runtime_testcase = res.runtime_testcase
+                res.ac_memory = res.memory
+                res.ac_memory_testcase = res.memory_testcase
         self.info('Test file result: %s)' % (res1))
+        if res2.wall != -1:
+            self.info('Test file timing: %s' % res2.timing_details())
         return (res1, res2)
 
+    def _state_cell(self, sub):
+        """Identify the result of a submission on the test case in the
+        state database (see run.StateDB).
+
+        Returns:
+            tuple (program, testcase, data, setup) of arguments to
+            run.StateDB.get, or None if not running incrementally.
+        """
+        if self._problem.state is None:
+            return None
+        program = sub.fingerprint()
+        validators = self._problem.output_validators.fingerprint(self)
+        if program is None or validators is None:
+            return None
+        data = run.ResultCache.key(self._problem.file_digest(self.infile),
+                                   self._problem.file_digest(self.ansfile))
+        limits = self._problem.config.get('limits')
+        setup = run.ResultCache.key(validators,
+                                    repr([limits[limit] for limit in ['memory', 'output', 'validation_time', 'validation_memory']]),
+                                    repr(sorted(self._problem.config.get('grading').items())),
+                                    repr(run.Program.wall_time_factor))
+        return (program, os.path.abspath(self._base), data, setup)
+
+    def _stored_result(self, cell, timelim):
+        """Result of an earlier run stored in the state database, or None
+        if there is none that is valid with this time limit."""
+        stored = self._problem.state.get(*cell)
+        if stored is None:
+            return None
+        (stored_timelim, fields) = stored
+        # A result under a lower time limit is still valid unless it
+        # was a time limit exceeded, and one under a higher time limit
+        # only if it was
+        if stored_timelim != timelim and (stored_timelim < timelim) == (fields['verdict'] == 'TLE'):
+            return None
+        self.debug('Using result from an earlier run')
+        res = SubmissionResult(fields['verdict'], score=fields['score'], reason=fields['reason'])
+        for field in TestCase._STATE_FIELDS[3:]:
+            setattr(res, field, fields[field])
+        return res
+
+    def _run_and_validate(self, sub, args, scratch, timelim_high, cancel):
+        outputlim = self._problem.config.get('limits')['output']
+        run_sub = lambda outfile: sub.run(self.infile, outfile,
+                                          timelim=timelim_high+1,
+                                          memlim=self._problem.config.get('limits')['memory'],
+                                          outputlim=outputlim,
+                                          cancel=cancel)
+        validators = self._problem.output_validators
+        val = validators.streaming_validator() if args.stream_output else None
+        if val is not None:
+            # The validator runs alongside the submission, so it
+            # also gets the wall time of the submission
+            val_walltimelim = (run.Program.wall_time_factor *
+                               (timelim_high + 1 + self._problem.config.get('limits')['validation_time']))
+            (result, val_res, _, output_limit_exceeded) = run.run_piped(
+                run_sub,
+                lambda infile: validators.validate_with(val, self, infile, walltimelim=val_walltimelim),
+                scratch, outputlim * 1024**2)
+        else:
+            outfile = os.path.join(scratch, 'output')
+            result = run_sub(outfile)
+            output_limit_exceeded = getattr(result, 'output_limit_exceeded', False)
+        # The submission's own verdict takes precedence over that of
+        # the validator, just as when the validator runs afterwards
+        status, runtime = result
+        if getattr(result, 'wall_timeout', False):
+            res = SubmissionResult('TLE', score=self._problem.config.get('grading')['reject_score'],
+                                   reason='wall time limit exceeded (hung or sleeping?)')
+        elif output_limit_exceeded:
+            res = SubmissionResult('RTE', score=self._problem.config.get('grading')['reject_score'],
+                                   reason='output limit exceeded')
+        elif is_TLE(status) or runtime > timelim_high:
+            res = SubmissionResult('TLE', score=self._problem.config.get('grading')['reject_score'])
+        elif is_RTE(status):
+            res = SubmissionResult('RTE', score=self._problem.config.get('grading')['reject_score'])
+        elif val is not None:
+            res = val_res
+        else:
+            res = validators.validate(self, outfile)
+        res.runtime = runtime
+        res.memory = getattr(result, 'memory', -1.0)
+        res.wall = getattr(result, 'wall', -1.0)
+        res.utime = getattr(result, 'utime', 0.0)
+        res.stime = getattr(result, 'stime', 0.0)
+        res.voluntary_ctxsw = getattr(result, 'voluntary_ctxsw', 0)
+        res.involuntary_ctxsw = getattr(result, 'involuntary_ctxsw', 0)
+        return res
+
     def get_all_testcases(self):
         return [self]
 
@@ -303,7 +486,7 @@ class TestCaseGroup(ProblemAspect):
 
         if self.config['grading'] == 'custom' and len(self._problem.graders._graders) == 0:
             self._problem.graders.error('%s has custom grading but no custom graders provided' % self)
-        if self.config['grading'] == 'default' and Graders._default_grader is None:
+        if self.config['grading'] == 'default' and Graders._default_grader() is None:
             self._problem.graders.error('%s has default grading but I could not find default grader' % self)
 
         for field in self.config.keys():
@@ -332,20 +515,19 @@ class TestCaseGroup(ProblemAspect):
                 self.error("No secret data provided")
             if not seen_sample:
                 self.warning("No sample data provided")
-            hashes = collections.defaultdict(list)
-            for root, dirs, files in os.walk(self._datadir):
-                for filename in files:
-                    if filename[-3:] == ".in":
-                        md5 = hashlib.md5()
-                        with open(os.path.join(root, filename), 'rb') as f:
-                            for buf in iter(lambda: f.read(1024), b''):
-                                md5.update(buf)
-                        filehash = md5.digest()
-                        filepath = os.path.join(root, filename)
-                        hashes[filehash].append(os.path.relpath(filepath, self._problem.probdir))
-            for _, files in hashes.iteritems():
-                if len(files) > 1:
-                    self.warning("Identical input files: '%s'" % str(files))
+            # The hashes end up in the problem's index of file hashes,
+            # for use by other checks
+            all_infiles = [os.path.join(root, filename)
+                           for root, dirs, files in os.walk(self._datadir)
+                           for filename in files if filename[-3:] == ".in"]
+            for files in self._problem.file_hashes.duplicates(all_infiles, self._problem.pool):
+                files = [os.path.relpath(filepath, self._problem.probdir) for filepath in files]
+                self.warning("Identical input files: '%s'" % str(files))
+
+        if self._parent is None:
+            self._problem.input_format_validators.prevalidate(
+                [testcase for testcase in self.get_all_testcases()
+                 if testcase.matches_filter(args.data_filter)])
 
         for f in infiles:
             if not f[:-3] + '.ans' in ansfiles:
@@ -374,17 +556,86 @@ class TestCaseGroup(ProblemAspect):
         subres2 = []
         probtype = self._problem.config.get('type')
         on_reject = self._problem.config.get('grading')['on_reject']
-        for subdata in self._items:
-            if not subdata.matches_filter(args.data_filter):
-                continue
-            (r1, r2) = subdata.run_submission(sub, args, timelim_low, timelim_high)
+        stop_on_reject = on_reject == 'first_error'
+        items = [subdata for subdata in self._items
+                 if subdata.matches_filter(args.data_filter)]
+        for (r1, r2) in self._run_items(items, sub, args, timelim_low, timelim_high, stop_on_reject):
             subres1.append(r1)
             subres2.append(r2)
-            if on_reject == 'first_error' and r2.verdict != 'AC':
-                break
         return (self.compute_result(subres1, probtype, on_reject),
                 self.compute_result(subres2, probtype, on_reject, shadow_result=True))
 
+
+    def _run_items(self, items, sub, args, timelim_low, timelim_high, stop_on_reject):
+        """Run a submission on a list of test cases and subgroups, yielding
+        the result pairs in the order of the items.
+
+        Consecutive test cases are run concurrently on the problem's
+        worker pool (if any), subgroups are run in the calling thread
+        so that the pool is only ever occupied by actual runs.
+        """
+        pos = 0
+        while pos < len(items):
+            if isinstance(items[pos], TestCaseGroup):
+                batch_results = [items[pos].run_submission(sub, args, timelim_low, timelim_high)]
+                pos += 1
+            else:
+                end = pos
+                while end < len(items) and isinstance(items[end], TestCase):
+                    end += 1
+                batch_results = self._run_testcases(items[pos:end], sub, args, timelim_low, timelim_high, stop_on_reject)
+                pos = end
+            for (r1, r2) in batch_results:
+                yield (r1, r2)
+                if stop_on_reject and r2.verdict != 'AC':
+                    return
+
+
+    def _run_testcases(self, testcases, sub, args, timelim_low, timelim_high, stop_on_reject):
+        """Run a submission on a list of test cases.
+
+        Returns:
+            list of result pairs, in the same order as testcases.  If
+            stop_on_reject is set, the list ends with the first
+            rejected test case, and test cases after it are cancelled
+            (if queued or still running) as soon as the rejection is
+            known.
+        """
+        pool = self._problem.pool
+        if pool is None:
+            res = []
+            for testcase in testcases:
+                res.append(testcase.run_submission(sub, args, timelim_low, timelim_high))
+                if stop_on_reject and res[-1][1].verdict != 'AC':
+                    break
+            return res
+
+        cancel = [run.CancelToken() for _ in testcases]
+        state_lock = threading.Lock()
+        first_reject = [len(testcases)]
+
+        def run_one(index):
+            if cancel[index].is_cancelled():
+                return None
+            res = testcases[index].run_submission(sub, args, timelim_low, timelim_high,
+                                                  cancel=cancel[index])
+            if stop_on_reject and res[1].verdict != 'AC':
+                with state_lock:
+                    if index < first_reject[0]:
+                        for later in range(index + 1, first_reject[0]):
+                            cancel[later].cancel()
+                        first_reject[0] = index
+            return res
+
+        results = []
+        for (messages, res, exc_info) in pool.map(lambda index: ProblemAspect.call_buffered(run_one, index),
+                                                  range(len(testcases)), chunksize=1):
+            ProblemAspect.flush_messages(messages)
+            if exc_info is not None:
+                raise exc_info[0], exc_info[1], exc_info[2]
+            results.append(res)
+        return results[:first_reject[0] + 1]
+
     def all_datasets(self):
         res = []
         for subdata in self._items:
@@ -582,6 +833,9 @@ class ProblemStatement(ProblemAspect):
             self.languages.append('')
         for f in glob.glob(glob_path + '[a-z][a-z].tex'):
             self.languages.append(re.search("problem.([a-z][a-z]).tex$", f).group(1))
+        # Languages whose statements to convert when checking, None
+        # for all of them
+        self.convert_languages = None
 
     def check(self, args):
         if self._check_res is not None:
@@ -592,6 +846,10 @@ class ProblemStatement(ProblemAspect):
             self.error('No problem statements found (expected problem.tex or problem.[a-z][a-z].tex in problem_statement directory)')
         if '' in self.languages and 'en' in self.languages:
             self.error("Can't supply both problem.tex and problem.en.tex")
+        # Imported here since they pull in plasTeX, which is slow to
+        # load and not needed unless the statement is checked
+        import problem2pdf
+        import problem2html
         pdfopt = problem2pdf.ConvertOptions()
         pdfopt.nopdf = True
         pdfopt.quiet = True
@@ -600,6 +858,8 @@ class ProblemStatement(ProblemAspect):
         htmlopt.quiet = True
 
         for lang in self.languages:
+            if self.convert_languages is not None and lang not in self.convert_languages:
+                continue
             pdfopt.language = lang
             htmlopt.language = lang
             pdf_ok = True
@@ -690,11 +950,14 @@ class InputFormatValidators(ProblemAspect):
 
     def __init__(self, problem):
         self._problem = problem
-        self._validators = run.find_programs(os.path.join(problem.probdir,
-                                                          'input_format_validators'),
-                                             language_config=problem.language_config,
-                                             allow_validation_script=True,
-                                             work_dir=problem.tmpdir)
+        self._validators = problem.find_programs(os.path.join(problem.probdir,
+                                                              'input_format_validators'),
+                                                 language_config=problem.language_config,
+                                                 allow_validation_script=True,
+                                                 work_dir=problem.tmpdir)
+        # Results of validators run in batch mode by prevalidate(), by
+        # (validator, input file, flags)
+        self._batch_results = {}
 
 
     def __str__(self):
@@ -726,30 +989,103 @@ class InputFormatValidators(ProblemAspect):
                     collect_flags(subgroup, flags)
             collect_flags(self._problem.testdata, all_flags)
 
-            fd, file_name = tempfile.mkstemp()
-            os.close(fd)
-            for (desc, case) in _JUNK_CASES:
-                f = open(file_name, "wb")
-                f.write(case)
-                f.close()
-                for flags in all_flags:
-                    flags = flags.split()
-                    for val in self._validators:
-                        status, _ = val.run(file_name, args=flags)
-                        if os.WEXITSTATUS(status) != 42:
-                            break
-                    else:
+            junk_dir = tempfile.mkdtemp(dir=self._problem.tmpdir)
+            file_names = []
+            for (idx, (desc, case)) in enumerate(_JUNK_CASES):
+                file_name = os.path.join(junk_dir, 'junk%d.in' % idx)
+                with open(file_name, "wb") as f:
+                    f.write(case)
+                file_names.append(file_name)
+            for flags in all_flags:
+                flags = flags.split()
+                rejected = set()
+                for val in self._validators:
+                    remaining = [file_name for file_name in file_names if file_name not in rejected]
+                    statuses = self._run_all(val, remaining, flags)
+                    rejected.update(file_name for (file_name, status) in zip(remaining, statuses)
+                                    if os.WEXITSTATUS(status) != 42)
+                for ((desc, _), file_name) in zip(_JUNK_CASES, file_names):
+                    if file_name not in rejected:
                         self.warning('No validator rejects %s with flags "%s"' % (desc, ' '.join(flags)))
-            os.unlink(file_name)
+            shutil.rmtree(junk_dir)
 
         return self._check_res
 
 
+    def prevalidate(self, testcases):
+        """Validate many test cases at once, with the validators that
+        can do that (those with a run_batch method) if batch validation
+        is enabled.  The results are picked up by validate().
+        """
+        if self._problem.batch is None:
+            return
+        self.check(None)
+        by_flags = collections.defaultdict(list)
+        for testcase in testcases:
+            flags = testcase.testcasegroup.config['input_validator_flags'].split()
+            by_flags[tuple(flags)].append(testcase.infile)
+        for val in self._validators:
+            if not hasattr(val, 'run_batch'):
+                continue
+            for (flags, infiles) in by_flags.iteritems():
+                missing = [infile for infile in infiles
+                           if self._cached_status(val, infile, list(flags)) is None]
+                for (infile, status) in val.run_batch(missing, args=list(flags)).iteritems():
+                    self._batch_results[(val, infile, flags)] = status
+
+
+    def _run_all(self, val, infiles, flags):
+        """Run a validator on a list of input files, in batch mode if
+        possible.  Returns the list of exit statuses."""
+        if self._problem.batch is not None and hasattr(val, 'run_batch'):
+            missing = [infile for infile in infiles
+                       if self._cached_status(val, infile, flags) is None]
+            for (infile, status) in val.run_batch(missing, args=flags).iteritems():
+                self._batch_results[(val, infile, tuple(flags))] = status
+        return [self._status(val, infile, flags) for infile in infiles]
+
+
+    def _status(self, val, infile, flags):
+        """Exit status of a validator on an input file, from the
+        validation cache, from a batch run, or by running it."""
+        status = self._cached_status(val, infile, flags)
+        if status is not None:
+            return status
+        status = self._batch_results.pop((val, infile, tuple(flags)), None)
+        if status is None:
+            status, _ = val.run(infile, args=flags)
+        # Crashes may be due to the circumstances of the run (e.g.
+        # running out of memory), so only proper exits are cached
+        key = self._cache_key(val, infile, flags)
+        if key is not None and os.WIFEXITED(status):
+            self._problem.validation_cache.put(key, status)
+        return status
+
+
+    def _cached_status(self, val, infile, flags):
+        key = self._cache_key(val, infile, flags)
+        if key is None:
+            return None
+        return self._problem.validation_cache.get(key)
+
+
+    def _cache_key(self, val, infile, flags):
+        """Key of the result of a validator on an input file in the
+        validation cache, None if not caching."""
+        if self._problem.validation_cache is None:
+            return None
+        fingerprint = val.fingerprint()
+        if fingerprint is None:
+            return None
+        return run.ResultCache.key('input_format_validator', fingerprint,
+                                   self._problem.file_digest(infile), ' '.join(flags))
+
+
     def validate(self, testcase):
         flags = testcase.testcasegroup.config['input_validator_flags'].split()
         self.check(None)
         for val in self._validators:
-            status, _ = val.run(testcase.infile, args=flags)
+            status = self._status(val, testcase.infile, flags)
             if not os.WIFEXITED(status):
                 testcase.error('Input format validator %s crashed on input %s' % (val, testcase.infile))
             if os.WEXITSTATUS(status) != 42:
@@ -757,13 +1093,16 @@ class InputFormatValidators(ProblemAspect):
 
 
 class Graders(ProblemAspect):
-    _default_grader = run.get_tool('default_grader')
+    @staticmethod
+    def _default_grader():
+        return run.get_tool('default_grader')
 
     def __init__(self, problem):
         self._problem = problem
-        self._graders = run.find_programs(os.path.join(problem.probdir, 'graders'),
-                                          language_config=problem.language_config,
-                                          work_dir=problem.tmpdir)
+        self._compile_lock = threading.Lock()
+        self._graders = problem.find_programs(os.path.join(problem.probdir, 'graders'),
+                                              language_config=problem.language_config,
+                                              work_dir=problem.tmpdir)
 
     def __str__(self):
         return 'graders'
@@ -784,7 +1123,7 @@ class Graders(ProblemAspect):
     def grade(self, sub_results, testcasegroup, shadow_result=False):
 
         if testcasegroup.config['grading'] == 'default':
-            graders = [self._default_grader]
+            graders = [self._default_grader()]
         else:
             graders = self._graders
 
@@ -797,7 +1136,12 @@ class Graders(ProblemAspect):
         self.debug('Grader flags: %s' % (testcasegroup.config.get('grader_flags')))
 
         for grader in graders:
-            if grader is not None and grader.compile():
+            if grader is None:
+                continue
+            # grade() may be called concurrently for several submissions
+            with self._compile_lock:
+                compiled = grader.compile()
+            if compiled:
                 fd, infile = tempfile.mkstemp()
                 os.close(fd)
                 fd, outfile = tempfile.mkstemp()
@@ -838,15 +1182,22 @@ class Graders(ProblemAspect):
 
 
 class OutputValidators(ProblemAspect):
-    _default_validator = run.get_tool('default_validator')
+    @staticmethod
+    def _default_validator():
+        return run.get_tool('default_validator')
 
 
     def __init__(self, problem):
         self._problem = problem
-        self._validators = run.find_programs(os.path.join(problem.probdir,
-                                                          'output_validators'),
-                                             language_config=problem.language_config,
-                                             work_dir=problem.tmpdir)
+        self._compile_lock = threading.Lock()
+        # Results of validating outputs, keyed by validator, hashes of
+        # the test case files, flags and hash of the output (see
+        # validate_with)
+        self._results = {}
+        self._validators = problem.find_programs(os.path.join(problem.probdir,
+                                                              'output_validators'),
+                                                 language_config=problem.language_config,
+                                                 work_dir=problem.tmpdir)
 
 
     def __str__(self):
@@ -863,7 +1214,7 @@ class OutputValidators(ProblemAspect):
         elif self._problem.config.get('validation') != 'default' and not self._validators:
             self.error('problem.yaml specifies custom validator but no validator programs found')
 
-        if self._problem.config.get('validation') == 'default' and self._default_validator is None:
+        if self._problem.config.get('validation') == 'default' and self._default_validator() is None:
             self.error('Unable to locate default validator')
 
         for val in self._validators:
@@ -928,13 +1279,37 @@ class OutputValidators(ProblemAspect):
         return SubmissionResult('AC', score=score)
 
 
+    def _compile(self, val):
+        # validate() may be called concurrently from several worker
+        # threads, make sure each validator is only compiled once.
+        with self._compile_lock:
+            return val.compile()
+
+
     def _actual_validators(self):
         vals = self._validators
         if self._problem.config.get('validation') == 'default':
-            vals = [self._default_validator]
+            vals = [self._default_validator()]
         return vals
 
 
+    def _flags(self, testcase):
+        return self._problem.config.get('validator_flags').split() + testcase.testcasegroup.config['output_validator_flags'].split()
+
+
+    def fingerprint(self, testcase):
+        """Hash of the output validators (and interactive runner) used
+        for a test case and their flags, None if some of them cannot be
+        fingerprinted (see run.Program.fingerprint)."""
+        vals = self._actual_validators()
+        if self._problem.is_interactive:
+            vals = vals + [run.get_tool('interactive')]
+        fingerprints = [val.fingerprint() if val is not None else None for val in vals]
+        if None in fingerprints:
+            return None
+        return run.ResultCache.key(' '.join(self._flags(testcase)), *fingerprints)
+
+
     def validate_interactive(self, testcase, submission, timelim, errorhandler):
         interactive_output_re = r'\d+ \d+\.\d+ \d+ \d+\.\d+'
         res = SubmissionResult('JE')
@@ -951,37 +1326,36 @@ class OutputValidators(ProblemAspect):
         val_memlim = self._problem.config.get('limits')['validation_memory']
         for val in self._actual_validators():
             if val is not None and val.compile():
-                feedbackdir = tempfile.mkdtemp(prefix='feedback', dir=self._problem.tmpdir)
-                validator_args[2] = feedbackdir + os.sep
-                f = tempfile.NamedTemporaryFile(delete=False)
-                interactive_out = f.name
-                f.close()
-                i_status, _ = interactive.run(outfile=interactive_out,
-                                              args=initargs + val.get_runcmd(memlim=val_memlim) + validator_args + [';'] + submission_args)
-                if is_RTE(i_status):
-                    errorhandler.error('Interactive crashed, status %d' % i_status)
-                else:
-                    interactive_output = open(interactive_out).read()
-                    errorhandler.debug('Interactive output: "%s"' % interactive_output)
-                    if not re.match(interactive_output_re, interactive_output):
-                        errorhandler.error('Output from interactive does not follow expected format, got output "%s"' % interactive_output)
+                with self._problem.scratch.feedback_dir() as feedbackdir:
+                    validator_args[2] = feedbackdir + os.sep
+                    f = tempfile.NamedTemporaryFile(delete=False)
+                    interactive_out = f.name
+                    f.close()
+                    i_status, _ = interactive.run(outfile=interactive_out,
+                                                  args=initargs + val.get_runcmd(memlim=val_memlim) + validator_args + [';'] + submission_args)
+                    if is_RTE(i_status):
+                        errorhandler.error('Interactive crashed, status %d' % i_status)
                     else:
-                        val_status, _, sub_status, sub_runtime = interactive_output.split()
-                        sub_status = int(sub_status)
-                        sub_runtime = float(sub_runtime)
-                        val_status = int(val_status)
-
-                        if is_TLE(sub_status, True):
-                            res = SubmissionResult('TLE', score=self._problem.config.get('grading')['reject_score'])
-                        elif is_RTE(sub_status):
-                            res = SubmissionResult('RTE', score=self._problem.config.get('grading')['reject_score'])
+                        interactive_output = open(interactive_out).read()
+                        errorhandler.debug('Interactive output: "%s"' % interactive_output)
+                        if not re.match(interactive_output_re, interactive_output):
+                            errorhandler.error('Output from interactive does not follow expected format, got output "%s"' % interactive_output)
                         else:
-                            res = self._parse_validator_results(val, val_status, feedbackdir)
+                            val_status, _, sub_status, sub_runtime = interactive_output.split()
+                            sub_status = int(sub_status)
+                            sub_runtime = float(sub_runtime)
+                            val_status = int(val_status)
+
+                            if is_TLE(sub_status, True):
+                                res = SubmissionResult('TLE', score=self._problem.config.get('grading')['reject_score'])
+                            elif is_RTE(sub_status):
+                                res = SubmissionResult('RTE', score=self._problem.config.get('grading')['reject_score'])
+                            else:
+                                res = self._parse_validator_results(val, val_status, feedbackdir)
 
-                        res.runtime = sub_runtime
+                            res.runtime = sub_runtime
 
-                os.unlink(interactive_out)
-                shutil.rmtree(feedbackdir)
+                    os.unlink(interactive_out)
                 if res.verdict != 'AC':
                     return res
         # TODO: check that all output validators give same result
@@ -990,17 +1364,9 @@ class OutputValidators(ProblemAspect):
 
     def validate(self, testcase, submission_output):
         res = SubmissionResult('JE')
-        val_timelim = self._problem.config.get('limits')['validation_time']
-        val_memlim = self._problem.config.get('limits')['validation_memory']
-        flags = self._problem.config.get('validator_flags').split() + testcase.testcasegroup.config['output_validator_flags'].split()
         for val in self._actual_validators():
-            if val is not None and val.compile():
-                feedbackdir = tempfile.mkdtemp(prefix='feedback', dir=self._problem.tmpdir)
-                status, runtime = val.run(submission_output,
-                                          args=[testcase.infile, testcase.ansfile, feedbackdir] + flags,
-                                          timelim=val_timelim, memlim=val_memlim)
-                res = self._parse_validator_results(val, status, feedbackdir)
-                shutil.rmtree(feedbackdir)
+            if val is not None and self._compile(val):
+                res = self.validate_with(val, testcase, submission_output)
                 if res.verdict != 'AC':
                     return res
 
@@ -1008,7 +1374,145 @@ class OutputValidators(ProblemAspect):
         return res
 
 
+    def validate_with(self, val, testcase, submission_output, walltimelim=None):
+        """Validate submission output for a test case with a single
+        (compiled) output validator.
+
+        Many outputs are identical (most submissions print the same
+        answers, and the answer files are validated as outputs too),
+        so results of validating output files are remembered by the
+        hash of the output, and the validator is only run for outputs
+        it has not seen before for the test case.  A remembered result
+        includes the feedback (e.g. judgemessage.txt) of the validator.
+        Only AC and WA results are remembered, as judge errors may be
+        due to the circumstances (e.g. the validator timing out).
+        """
+        flags = self._flags(testcase)
+        if not os.path.isfile(submission_output):
+            return self._run_validator(val, testcase, submission_output, flags, walltimelim)
+
+        output_digest = run.rutil.file_digest(submission_output)
+        key = (val, self._problem.file_digest(testcase.infile),
+               self._problem.file_digest(testcase.ansfile), tuple(flags), output_digest)
+        cache_key = self._cache_key(val, testcase, flags, output_digest)
+        result = self._results.get(key)
+        if result is None and cache_key is not None:
+            result = self._problem.validation_cache.get(cache_key)
+        if result is None:
+            res = self._run_validator(val, testcase, submission_output, flags, walltimelim)
+            if res.verdict not in ['AC', 'WA']:
+                return res
+            result = (res.verdict, res.score, res.reason, res.feedback)
+            if cache_key is not None:
+                self._problem.validation_cache.put(cache_key, result)
+        self._results[key] = result
+        (verdict, score, reason, feedback) = result
+        res = SubmissionResult(verdict, score=score, reason=reason)
+        res.feedback = feedback
+        return res
+
+
+    def _cache_key(self, val, testcase, flags, output_digest):
+        """Key of the result of validating an output in the validation
+        cache, None if not caching."""
+        if self._problem.validation_cache is None:
+            return None
+        fingerprint = val.fingerprint()
+        if fingerprint is None:
+            return None
+        # The grading configuration determines the scores
+        grading = self._problem.config.get('grading')
+        return run.ResultCache.key('output_validator_feedback', fingerprint,
+                                   self._problem.file_digest(testcase.infile),
+                                   self._problem.file_digest(testcase.ansfile),
+                                   ' '.join(flags), output_digest,
+                                   repr(sorted(grading.items())))
+
+
+    def _run_validator(self, val, testcase, submission_output, flags, walltimelim):
+        val_timelim = self._problem.config.get('limits')['validation_time']
+        val_memlim = self._problem.config.get('limits')['validation_memory']
+        # Batch mode needs the whole output in a file (to be able to
+        # fall back to running the validator on it)
+        if self._problem.batch is not None and os.path.isfile(submission_output):
+            res = self._validate_batch(val, testcase, submission_output, flags)
+            if res is not None:
+                return res
+        with self._problem.scratch.feedback_dir() as feedbackdir:
+            status, runtime = val.run(submission_output,
+                                      args=[testcase.infile, testcase.ansfile, feedbackdir] + flags,
+                                      timelim=val_timelim, memlim=val_memlim,
+                                      walltimelim=walltimelim)
+            res = self._parse_validator_results(val, status, feedbackdir)
+            res.feedback = OutputValidators.__read_feedback(feedbackdir)
+            return res
+
+
+    def _validate_batch(self, val, testcase, submission_output, flags):
+        """Validate with a batch process of the validator (see
+        run.batch).  A job is the fields input, answer, feedback
+        directory and output file, followed by the validator flags,
+        and the response is the exit code the validator would have
+        exited with, optionally followed by a score (which is the same
+        as writing the score to score.txt in the feedback directory).
+
+        Returns:
+            SubmissionResult, or None if the validator does not support
+            batch mode or the batch process failed, in which case the
+            validator should be run as usual.
+        """
+        val_memlim = self._problem.config.get('limits')['validation_memory']
+        batch = self._problem.batch
+        with self._problem.scratch.feedback_dir() as feedbackdir:
+            fields = [testcase.infile, testcase.ansfile, feedbackdir, submission_output] + flags
+            if not run.BatchProcess.can_send(fields):
+                return None
+            proc = batch.acquire(val, val.get_runcmd(memlim=val_memlim) + [run.BATCH_ARG],
+                                 memlim=None if val.should_skip_memory_rlimit() else val_memlim)
+            if proc is None:
+                return None
+            response = proc.request(fields)
+            match = re.match(r'^(\d+)(?:\s+(\S+))?\s*$', response or '')
+            if match is None:
+                if response is not None:
+                    self.debug('Invalid batch response "%s" from output validator %s' % (response, val))
+                batch.discard(proc)
+                return None
+            batch.release(val, proc)
+            if match.group(2) is not None:
+                with open(os.path.join(feedbackdir, 'score.txt'), 'w') as score_file:
+                    score_file.write(match.group(2))
+            res = self._parse_validator_results(val, int(match.group(1)) << 8, feedbackdir)
+            res.feedback = OutputValidators.__read_feedback(feedbackdir)
+            return res
+
+
+    @staticmethod
+    def __read_feedback(feedbackdir):
+        feedback = {}
+        for (root, _, files) in os.walk(feedbackdir):
+            for name in files:
+                filename = os.path.join(root, name)
+                with open(filename) as feedback_file:
+                    feedback[os.path.relpath(filename, feedbackdir)] = feedback_file.read()
+        return feedback
+
+
+    def streaming_validator(self):
+        """The output validator to stream submission output into, or
+        None if output cannot be streamed (there is more than one
+        output validator, and each of them needs the whole output)."""
+        vals = self._actual_validators()
+        if len(vals) != 1 or vals[0] is None or not self._compile(vals[0]):
+            return None
+        return vals[0]
+
+
 class Submissions(ProblemAspect):
+    # Recommended memory limit is this many times the peak memory usage
+    # of the AC submissions, rounded up to a multiple of the granularity
+    _MEMORY_MULTIPLIER = 2
+    _MEMORY_GRANULARITY = 64.0
     _SUB_REGEXP = re.compile(r'^[a-zA-Z0-9][a-zA-Z0-9_.-]*[a-zA-Z0-9](\.c\+\+)?$')
     _VERDICTS = [
         ['AC', 'accepted', True],
@@ -1023,12 +1527,12 @@ class Submissions(ProblemAspect):
         srcdir = os.path.join(problem.probdir, 'submissions')
         for verdict in Submissions._VERDICTS:
             acr = verdict[0]
-            self._submissions[acr] = run.find_programs(os.path.join(srcdir, verdict[1]),
-                                                       language_config=problem.language_config,
-                                                       pattern=Submissions._SUB_REGEXP,
-                                                       work_dir=problem.tmpdir,
-                                                       include_dir=os.path.join(problem.probdir,
-                                                                                    'include'))
+            self._submissions[acr] = problem.find_programs(os.path.join(srcdir, verdict[1]),
+                                                           language_config=problem.language_config,
+                                                           pattern=Submissions._SUB_REGEXP,
+                                                           work_dir=problem.tmpdir,
+                                                           include_dir=os.path.join(problem.probdir,
+                                                                                        'include'))
 
     def __str__(self):
         return 'submissions'
@@ -1039,6 +1543,9 @@ class Submissions(ProblemAspect):
         if result1.verdict != result2.verdict:
             self.warning('%s submission %s sensitive to time limit: limit of %s secs -> %s, limit of %s secs -> %s' % (expected_verdict, sub, timelim_low, result1.verdict, timelim_high, result2.verdict))
 
+        if result1.wall != -1:
+            self.info('%s submission %s timing in total: %s' % (expected_verdict, sub, result1.timing_details()))
+
         if result1.verdict == expected_verdict:
             self.msg('   %s submission %s OK: %s' % (expected_verdict, sub, result1))
         elif result2.verdict == expected_verdict:
@@ -1047,6 +1554,62 @@ class Submissions(ProblemAspect):
             self.error('%s submission %s got %s' % (expected_verdict, sub, result1))
         return result1
 
+    def _check_submissions(self, args, verdicts, timelim, timelim_margin):
+        """Check all submissions (matching the submission filter) for the
+        given expected verdicts.
+
+        With more than one thread, the submissions are checked
+        concurrently.  The messages for each submission are then
+        buffered and output in the same order as in a serial run.
+
+        Returns:
+            list of SubmissionResult, results of all submissions that
+            compiled.
+        """
+        jobs = [(verdict[0], sub) for verdict in verdicts
+                for sub in self._submissions[verdict[0]]
+                if args.submission_filter.search(os.path.join(verdict[1], sub.name))]
+
+        def check_one(job):
+            (acr, sub) = job
+            self.info('Check %s submission %s' % (acr, sub))
+
+            if not sub.compile():
+                self.error('Compile error for %s submission %s' % (acr, sub))
+                return None
+
+            return self.check_submission(sub, args, acr, timelim, timelim_margin)
+
+        results = []
+        if args.threads > 1 and len(jobs) > 1:
+            pool = ThreadPool(min(args.threads, len(jobs)))
+            try:
+                for (messages, res, exc_info) in pool.imap(lambda job: ProblemAspect.call_buffered(check_one, job), jobs):
+                    ProblemAspect.flush_messages(messages)
+                    if exc_info is not None:
+                        raise exc_info[0], exc_info[1], exc_info[2]
+                    if res is not None:
+                        results.append(res)
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for job in jobs:
+                res = check_one(job)
+                if res is not None:
+                    results.append(res)
+        return results
+
+    def _recommend_memlim(self, max_memory):
+        """Recommend a memory limit based on the peak memory usage of the
+        AC submissions."""
+        memlim = self._problem.config.get('limits')['memory']
+        exact_memlim = max_memory * Submissions._MEMORY_MULTIPLIER
+        recommended = Submissions._MEMORY_GRANULARITY * int(math.ceil(exact_memlim / Submissions._MEMORY_GRANULARITY))
+        self.msg("   Largest AC memory usage: %.1f MB, recommended memory limit %d MB (current limit %d MB)" % (max_memory, recommended, memlim))
+        if recommended > memlim:
+            self.warning('AC submissions use %.1f MB of memory, leaving little margin to the memory limit of %d MB' % (max_memory, memlim))
+
     def check(self, args):
         if self._check_res is not None:
             return self._check_res
@@ -1065,18 +1628,12 @@ class Submissions(ProblemAspect):
             if verdict[2] and not self._submissions[acr]:
                 self.error('Require at least one "%s" submission' % verdict[1])
 
-            runtimes = []
-
-            for sub in self._submissions[acr]:
-                if args.submission_filter.search(os.path.join(verdict[1], sub.name)):
-                    self.info('Check %s submission %s' % (acr, sub))
-
-                    if not sub.compile():
-                        self.error('Compile error for %s submission %s' % (acr, sub))
-                        continue
-
-                    res = self.check_submission(sub, args, acr, timelim, timelim_margin)
-                    runtimes.append(res.runtime)
+        # The AC submissions determine the time limit, so they need to
+        # be done before the others, which can then all run together.
+        for verdicts in [Submissions._VERDICTS[:1], Submissions._VERDICTS[1:]]:
+            acr = verdicts[0][0]
+            results = self._check_submissions(args, verdicts, timelim, timelim_margin)
+            runtimes = [res.runtime for res in results]
 
             if acr == 'AC':
                 if len(runtimes) > 0:
@@ -1094,6 +1651,9 @@ class Submissions(ProblemAspect):
                     timelim_margin = timelim * self._problem.config.get('limits')['time_safety_margin']
 
                 self.msg("   Slowest AC runtime: %s, setting timelim to %d secs, safety margin to %d secs" % (max_runtime, timelim, timelim_margin))
+                memories = [res.ac_memory for res in results if res.ac_memory >= 0]
+                if memories:
+                    self._recommend_memlim(max(memories))
             self._problem.config.get('limits')['time'] = timelim
 
         return self._check_res
@@ -1101,6 +1661,18 @@ class Submissions(ProblemAspect):
 
 PROBLEM_PARTS = ['config', 'statement', 'validators', 'graders', 'data', 'submissions']
 
+# The parts affected by changes to the files and directories at the top
+# level of a problem (see Problem.reload)
+_AFFECTED_PARTS = {'problem.yaml': PROBLEM_PARTS,
+                   'problem_statement': ['config', 'statement'],
+                   'attachments': ['statement'],
+                   'input_format_validators': ['validators', 'data'],
+                   'output_validators': ['validators', 'data', 'submissions'],
+                   'graders': ['graders', 'submissions'],
+                   'data': ['data', 'submissions'],
+                   'submissions': ['submissions'],
+                   'include': ['submissions']}
+
 class Problem(ProblemAspect):
     def __init__(self, probdir):
         self.probdir = os.path.realpath(probdir)
@@ -1109,28 +1681,119 @@ class Problem(ProblemAspect):
 
     def __enter__(self):
         self.tmpdir = tempfile.mkdtemp(prefix='verify-%s-'%self.shortname)
+        self.pool = None
+        self.scratch = run.ScratchStorage(self.tmpdir)
+        self.batch = None
+        self.validation_cache = None
+        self.state = None
+        self.file_hashes = run.FileHashes()
+        self._programs = {}
         if not os.path.isdir(self.probdir):
             self.error("Problem directory '%s' not found" % self.probdir)
             self.shortname = None
             return self
 
-        self.statement = ProblemStatement(self)
-        self.attachments = Attachments(self)
-        self.config = ProblemConfig(self)
-        self.is_interactive = 'interactive' in self.config.get('validation-params')
-        self.input_format_validators = InputFormatValidators(self)
-        self.output_validators = OutputValidators(self)
-        self.graders = Graders(self)
-        self.testdata = TestCaseGroup(self, os.path.join(self.probdir, 'data'))
-        self.submissions = Submissions(self)
+        self._load(PROBLEM_PARTS)
         return self
 
+    def _load(self, parts):
+        """(Re)create the aspects checking the given parts."""
+        if 'statement' in parts:
+            self.statement = ProblemStatement(self)
+            self.attachments = Attachments(self)
+        if 'config' in parts:
+            self.config = ProblemConfig(self)
+            self.is_interactive = 'interactive' in self.config.get('validation-params')
+        if 'validators' in parts:
+            self.input_format_validators = InputFormatValidators(self)
+            self.output_validators = OutputValidators(self)
+        if 'graders' in parts:
+            self.graders = Graders(self)
+        if 'data' in parts:
+            self.testdata = TestCaseGroup(self, os.path.join(self.probdir, 'data'))
+        if 'submissions' in parts:
+            self.submissions = Submissions(self)
+
+    def reload(self, changed):
+        """Reload the parts of the problem affected by changes to some of
+        its files, so that the next check() rechecks them.
+
+        Programs that have not changed are kept (compiled, if they
+        were), and results of validation and of runs of submissions are
+        reused as far as the caches enabled by the arguments of check()
+        allow (see --validation_cache and --incremental).
+
+        Args:
+            changed (collection of str): paths of changed files and
+                directories.
+
+        Returns:
+            list of the affected parts, in the order of PROBLEM_PARTS.
+        """
+        affected = set()
+        # If only statement files changed, only those languages need
+        # to be converted
+        statement_languages = set()
+        for path in changed:
+            relpath = os.path.relpath(path, self.probdir)
+            if relpath == '.':
+                path_parts = PROBLEM_PARTS
+            else:
+                path_parts = _AFFECTED_PARTS.get(relpath.split(os.sep)[0], [])
+            affected.update(path_parts)
+            match = re.match(r'^problem_statement/problem(?:\.([a-z][a-z]))?\.tex$', relpath)
+            if match is not None and statement_languages is not None:
+                statement_languages.add(match.group(1) or '')
+            elif 'statement' in path_parts:
+                statement_languages = None
+        parts = [part for part in PROBLEM_PARTS if part in affected]
+        self._load(parts)
+        if 'statement' in parts:
+            self.statement.convert_languages = statement_languages
+        return parts
+
+    def find_programs(self, path, pattern='.*', **kwargs):
+        """Find all programs in a directory (see run.find_programs).
+
+        A program found by an earlier call at the same path that is
+        still the same (according to its fingerprint) is returned
+        instead of a new one, so that it does not need to be compiled
+        again.  Programs that have changed since are discarded.
+        """
+        if not os.path.isdir(path):
+            return []
+        programs = []
+        for name in sorted(os.listdir(path)):
+            if not re.match(pattern, name):
+                continue
+            source = os.path.join(path, name)
+            prog = run.get_program(source, **kwargs)
+            if prog is None:
+                continue
+            fingerprint = prog.fingerprint()
+            known = self._programs.pop(source, None)
+            if known is not None and fingerprint is not None and known[0] == fingerprint:
+                prog.discard()
+                prog = known[1]
+            elif known is not None:
+                known[1].discard()
+            if fingerprint is not None:
+                self._programs[source] = (fingerprint, prog)
+            programs.append(prog)
+        return programs
+
     def __exit__(self, exc_type, exc_value, exc_traceback):
+        self.scratch.close()
         shutil.rmtree(self.tmpdir)
 
     def __str__(self):
         return self.shortname
 
+    def file_digest(self, path):
+        """Hash of a file, computed only once per file (and contents,
+        as given by size and modification time)."""
+        return self.file_hashes.digest(path)
+
     def check(self, args=None):
         if self.shortname is None:
             return [1, 0]
@@ -1141,6 +1804,7 @@ class Problem(ProblemAspect):
         ProblemAspect.warnings = 0
         ProblemAspect.bail_on_error = args.bail_on_error
         ProblemAspect.consider_warnings_errors = args.werror
+        default_wall_time_factor = run.Program.wall_time_factor
 
         try:
             part_mapping = {'config': [self.config],
@@ -1155,15 +1819,132 @@ class Problem(ProblemAspect):
 
             run.limit.check_limit_capabilities(self)
 
+            if args.pin_cpus:
+                try:
+                    run.Program.core_pool = run.CorePool()
+                    if args.threads > len(run.Program.core_pool):
+                        self.warning('Running %d threads but only %d cores available for pinning, runs will wait for free cores'
+                                     % (args.threads, len(run.Program.core_pool)))
+                except run.ProgramError as e:
+                    self.warning('%s, running without CPU pinning' % e)
+
+            if args.compile_cache is not None:
+                run.Program.compile_cache = run.CompileCache(
+                    args.compile_cache, cache_builds=args.cache_builds)
+
+            if args.validation_cache is not None:
+                self.validation_cache = run.ResultCache(args.validation_cache)
+
+            if args.incremental is not None:
+                self.state = run.StateDB(args.incremental)
+
+            if args.forkserver:
+                try:
+                    run.Program.launcher = run.Launcher()
+                except (run.ProgramError, OSError) as e:
+                    self.warning('Could not start launcher (%s), forking runs directly' % e)
+
+            # With more threads than cores, runs get correspondingly
+            # less wall time per CPU second
+            if run.Program.core_pool is not None:
+                cores = len(run.Program.core_pool)
+            else:
+                cores = len(run.affinity.allowed_cpus())
+            run.Program.wall_time_factor = args.wall_time_factor * max(1.0, float(args.threads) / cores)
+
+            # Every run may produce up to the output limit (plus the
+            # byte of slack that tells us it went over)
+            self.scratch.close()
+            self.scratch = run.ScratchStorage(self.tmpdir,
+                                              budget=args.scratch_budget * 1024**2,
+                                              slot_size=self.config.get('limits')['output'] * 1024**2 + 1)
+
+            if args.batch_validation:
+                val_timelim = self.config.get('limits')['validation_time']
+                self.batch = run.BatchPool(self.tmpdir,
+                                           timeout=val_timelim * run.Program.wall_time_factor,
+                                           cpu_limit=val_timelim)
+
+            if args.threads > 1:
+                self.pool = ThreadPool(args.threads)
+
+            self._compile_programs(args)
+
             for part in args.parts:
                 self.msg('Checking %s' % part)
                 for item in part_mapping[part]:
                     item.check(args)
         except VerifyError:
             pass
+        finally:
+            if self.pool is not None:
+                self.pool.close()
+                self.pool.join()
+                self.pool = None
+            if self.batch is not None:
+                self.batch.close()
+                self.batch = None
+            self.validation_cache = None
+            if self.state is not None:
+                self.state.close()
+                self.state = None
+            run.Program.core_pool = None
+            run.Program.compile_cache = None
+            run.Program.wall_time_factor = default_wall_time_factor
+            if run.Program.launcher is not None:
+                run.Program.launcher.stop()
+                run.Program.launcher = None
         return [ProblemAspect.errors, ProblemAspect.warnings]
 
 
+    def _compile_programs(self, args):
+        """Compile all programs needed for checking the requested parts
+        up front, concurrently if there is a worker pool.  The checks
+        of the individual parts then just pick up the (cached) result
+        of compilation.
+        """
+        parts = set(args.parts)
+        programs = []
+        if parts & set(['validators', 'data']):
+            programs += self.input_format_validators._validators
+        if parts & set(['validators', 'data', 'submissions']):
+            programs += self.output_validators._actual_validators()
+        if parts & set(['graders', 'submissions']):
+            programs += self.graders._graders
+        if 'submissions' in parts:
+            for verdict in Submissions._VERDICTS:
+                programs += [sub for sub in self.submissions._submissions[verdict[0]]
+                             if args.submission_filter.search(os.path.join(verdict[1], sub.name))]
+        unique = []
+        for prog in programs:
+            if prog is not None and not any(prog is seen for seen in unique):
+                unique.append(prog)
+
+        compile_timelim = self.config.get('limits')['compilation_time']
+
+        def compile_one(prog):
+            start = time.time()
+            try:
+                prog.compile(timelim=compile_timelim)
+            except run.ProgramError:
+                # Reported when the part owning the program is checked
+                pass
+            return time.time() - start
+
+        start = time.time()
+        if self.pool is not None:
+            compile_times = self.pool.map(compile_one, unique, chunksize=1)
+        else:
+            compile_times = [compile_one(prog) for prog in unique]
+        for (prog, compile_time) in zip(unique, compile_times):
+            self.info('Compiled %s in %.2fs' % (prog, compile_time))
+            if compile_time > compile_timelim:
+                self.error('Compiling %s was stopped after %.1fs, exceeding the compilation time limit of %d secs'
+                           % (prog, compile_time, compile_timelim))
+        if unique:
+            self.debug('Compiled %d programs in %.2fs' % (len(unique), time.time() - start))
+
+
 def re_argument(s):
     try:
         r = re.compile(s)
@@ -1178,6 +1959,26 @@ def part_argument(s):
     return s
 
 
+def positive_int_argument(s):
+    try:
+        val = int(s)
+    except ValueError:
+        raise ArgumentTypeError('%s is not an integer' % s)
+    if val < 1:
+        raise ArgumentTypeError('%s is not a positive integer' % s)
+    return val
+
+
+def positive_float_argument(s):
+    try:
+        val = float(s)
+    except ValueError:
+        raise ArgumentTypeError('%s is not a number' % s)
+    if val <= 0:
+        raise ArgumentTypeError('%s is not a positive number' % s)
+    return val
+
+
 def argparser():
     parser = ArgumentParser(description="Validate a problem package in the Kattis problem format.")
     parser.add_argument("-s", "--submission_filter", metavar='SUBMISSIONS', help="run only submissions whose name contains this regex.  The name includes category (accepted, wrong_answer, etc), e.g. 'accepted/hello.java' (for a single file submission) or 'wrong_answer/hello' (for a directory submission)", type=re_argument, default=re.compile('.*'))
@@ -1187,6 +1988,19 @@ def argparser():
     parser.add_argument("-b", "--bail_on_error", help="bail verification on first error", action='store_true')
     parser.add_argument("-l", "--log-level", dest="loglevel", help="set log level (debug, info, warning, error, critical)", default="warning")
     parser.add_argument("-e", "--werror", help="consider warnings as errors", action='store_true')
+    parser.add_argument("-j", "--threads", help="number of test cases to run in parallel (default 1)", type=positive_int_argument, default=1)
+    parser.add_argument("--compile_cache", metavar='DIR', help="cache compiled programs in this directory (default %s) and reuse them when neither the sources nor the compiler have changed" % run.CompileCache.default_dir(), nargs='?', const=run.CompileCache.default_dir())
+    parser.add_argument("--cache_builds", action='store_true', help="with --compile_cache, also cache programs built by build scripts (note that changes to the tools a build script uses are not detected)")
+    parser.add_argument("--language_cache", metavar='FILE', help="keep the parsed language configuration in this file (default %s) and reuse it while the configuration is unchanged" % languages.Languages.default_cache_file(), nargs='?', const=languages.Languages.default_cache_file())
+    parser.add_argument("--validation_cache", metavar='DIR', help="cache results of input format and output validation in this directory (default %s) and reuse them when neither the validated file, the test case, the validator nor the validator flags have changed" % run.ResultCache.default_dir(), nargs='?', const=run.ResultCache.default_dir())
+    parser.add_argument("--incremental", metavar='FILE', help="keep results of running submissions on test cases in this database (default %s), and only rerun those whose submission, test data, validators or limits have changed" % run.StateDB.default_path(), nargs='?', const=run.StateDB.default_path())
+    parser.add_argument("--watch", help="after checking, keep watching the problem directory, and recheck the parts affected by each change", action='store_true')
+    parser.add_argument("--forkserver", help="start programs from a small separate launcher process, which is cheaper than forking verifyproblem itself for every run", action='store_true')
+    parser.add_argument("--pin_cpus", help="pin every run to a dedicated CPU core (one per physical core, within our cpuset) to reduce timing noise between parallel runs", action='store_true')
+    parser.add_argument("--scratch_budget", metavar='MB', help="keep submission output in memory (in /dev/shm) as long as at most this many MB may be needed, otherwise on disk (default %(default)s)", type=int, default=256)
+    parser.add_argument("--stream_output", help="stream the output of submissions directly into the output validator instead of going through a file (only with a single output validator)", action='store_true')
+    parser.add_argument("--batch_validation", help="run validators that support batch mode on many test cases at a time instead of once per test case: output validators that speak the batch protocol, and VIVA input format validators (output validators are not batched with --stream_output)", action='store_true')
+    parser.add_argument("--wall_time_factor", help="kill runs whose wall time exceeds this many times their CPU time limit (default %(default)s).  Scaled up automatically when running more threads than there are cores", type=positive_float_argument, default=run.Program.wall_time_factor)
     parser.add_argument('problemdir')
     return parser
 
@@ -1195,6 +2009,39 @@ def default_args():
     return argparser().parse_args([None])
 
 
+def watch(prob, args):
+    """Recheck the parts of a problem affected by changes to its files,
+    as they happen, until interrupted.
+
+    Returns:
+        int, the number of errors in the last round.
+    """
+    errors = 0
+    try:
+        watcher = run.DirectoryWatcher(prob.probdir)
+    except (run.ProgramError, OSError) as e:
+        print 'Cannot watch %s for changes: %s' % (prob.probdir, e)
+        return 1
+    try:
+        while True:
+            print 'Watching %s for changes (press Ctrl-C to stop)' % prob.probdir
+            changed = watcher.wait()
+            parts = [part for part in prob.reload(changed) if part in args.parts]
+            if not parts:
+                continue
+            print 'Changed: %s' % ', '.join(sorted(os.path.relpath(path, prob.probdir)
+                                                   for path in changed))
+            round_args = copy.copy(args)
+            round_args.parts = parts
+            [errors, warnings] = prob.check(round_args)
+            print "%s rechecked %s: %d errors, %d warnings" % (prob.shortname, ', '.join(parts), errors, warnings)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.close()
+    return errors
+
+
 def main():
     args = argparser().parse_args()
     fmt = "%(levelname)s %(message)s"
@@ -1202,10 +2049,19 @@ def main():
                         format=fmt,
                         level=eval("logging." + args.loglevel.upper()))
 
+    languages.Languages.cache_file = args.language_cache
     print 'Loading problem %s' % os.path.basename(os.path.realpath(args.problemdir))
     with Problem(args.problemdir) as prob:
+        if args.watch:
+            # Only what has changed needs to be rerun between rounds
+            if args.validation_cache is None:
+                args.validation_cache = os.path.join(prob.tmpdir, 'validation')
+            if args.incremental is None:
+                args.incremental = os.path.join(prob.tmpdir, 'state.sqlite')
         [errors, warnings] = prob.check(args)
         print "%s tested: %d errors, %d warnings" % (prob.shortname, errors, warnings)
+        if args.watch and prob.shortname is not None:
+            errors = watch(prob, args)
 
     sys.exit(1 if errors > 0 else 0)
 
@@ -0,0 +1,103 @@
+// Runs a program and writes its peak memory usage (resident set size,
+// in kB) to a report file.
+//
+// The peak resident set size the kernel reports for a process includes
+// whatever the process had mapped before it exec'd the program, i.e.,
+// for a process forked by verifyproblem, all of verifyproblem.  The
+// program is therefore forked from this (small) process instead.
+//
+// Usage: peakmem REPORTFILE PROGRAM [ARG]...
+//
+// The exit status of peakmem is that of the program: if the program is
+// killed by a signal, peakmem kills itself with the same signal.
+//
+// To stop a run, send SIGTERM to peakmem: it kills the program with
+// SIGKILL, but still reaps it, so that the CPU time of the program is
+// accounted for, and writes the report.  If peakmem itself is killed,
+// the program is killed too, but its CPU time is lost.
+
+#include <cerrno>
+#include <csignal>
+#include <cstdio>
+#include <cstdlib>
+#include <fcntl.h>
+#include <sys/prctl.h>
+#include <sys/resource.h>
+#include <sys/types.h>
+#include <sys/wait.h>
+#include <unistd.h>
+
+static volatile sig_atomic_t child = 0;
+static volatile sig_atomic_t stopped = 0;
+
+static void stop(int) {
+	stopped = 1;
+	if (child > 0) {
+		kill(child, SIGKILL);
+	}
+}
+
+int main(int argc, char **argv) {
+	if (argc < 3) {
+		fprintf(stderr, "Usage: %s REPORTFILE PROGRAM [ARG]...\n", argv[0]);
+		return 127;
+	}
+	struct sigaction action;
+	sigemptyset(&action.sa_mask);
+	action.sa_flags = 0;
+	action.sa_handler = stop;
+	sigaction(SIGTERM, &action, NULL);
+
+	pid_t parent = getpid();
+	pid_t pid = fork();
+	if (pid < 0) {
+		perror("fork");
+		return 127;
+	}
+	if (pid == 0) {
+		signal(SIGTERM, SIG_DFL);
+		prctl(PR_SET_PDEATHSIG, SIGKILL);
+		if (getppid() != parent) {
+			_exit(127);
+		}
+		execvp(argv[2], argv + 2);
+		perror(argv[2]);
+		kill(getpid(), SIGTERM);
+		_exit(127);
+	}
+
+	child = pid;
+	// A SIGTERM that arrived before we knew the pid of the program
+	if (stopped) {
+		kill(pid, SIGKILL);
+	}
+
+	int status;
+	struct rusage ru;
+	while (wait4(pid, &status, 0, &ru) < 0) {
+		if (errno != EINTR) {
+			perror("wait4");
+			return 127;
+		}
+	}
+
+	FILE *report = fopen(argv[1], "w");
+	if (report != NULL) {
+		fprintf(report, "%ld\n", ru.ru_maxrss);
+		fclose(report);
+	}
+
+	if (WIFSIGNALED(status)) {
+		int sig = WTERMSIG(status);
+		struct rlimit no_core = {0, 0};
+		setrlimit(RLIMIT_CORE, &no_core);
+		signal(sig, SIG_DFL);
+		sigset_t mask;
+		sigemptyset(&mask);
+		sigaddset(&mask, sig);
+		sigprocmask(SIG_UNBLOCK, &mask, NULL);
+		kill(getpid(), sig);
+		return 128 + sig;
+	}
+	return WEXITSTATUS(status);
+}